@@ -5,7 +5,7 @@ a = Analysis(
     ['C:\\Users\\22903\\Desktop\\python\\classroom-gacha\\backend\\main.py'],
     pathex=[],
     binaries=[],
-    datas=[('C:\\Users\\22903\\Desktop\\python\\classroom-gacha\\frontend\\dist', 'dist'), ('C:\\Users\\22903\\Desktop\\python\\classroom-gacha\\backend\\static', 'static')],
+    datas=[('C:\\Users\\22903\\Desktop\\python\\classroom-gacha\\frontend\\dist', 'dist'), ('C:\\Users\\22903\\Desktop\\python\\classroom-gacha\\backend\\static', 'static'), ('C:\\Users\\22903\\Desktop\\python\\classroom-gacha\\files\\抽卡定义说明.json', 'files')],
     hiddenimports=['uvicorn.logging', 'uvicorn.loops', 'uvicorn.loops.auto', 'uvicorn.protocols', 'uvicorn.protocols.http', 'uvicorn.protocols.http.auto', 'uvicorn.lifespan', 'uvicorn.lifespan.on', 'engineio.async_drivers.threading'],
     hookspath=[],
     hooksconfig={},
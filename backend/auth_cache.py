@@ -0,0 +1,107 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Detached snapshot of an authenticated User (safe to share across requests)."""
+    id: int
+    username: str
+    is_admin: bool
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(id=user.id, username=user.username, is_admin=bool(user.is_admin))
+
+
+class PrincipalCache:
+    """Bounded LRU + TTL cache of principals keyed by token subject."""
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, subject):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(subject)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[subject]
+            self.misses += 1
+            return None
+
+    def put(self, subject, principal):
+        with self._lock:
+            self._entries[subject] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, subject=None):
+        # Call on account deletion and on any password or role change
+        with self._lock:
+            if subject is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(subject, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class StreamTickets:
+    """Single-use, short-lived tickets that stand in for the bearer token in URLs.
+
+    EventSource can't send headers, so event streams authenticate with a
+    query parameter, and query strings end up in access logs. A ticket is
+    worthless once redeemed or after `ttl` seconds.
+    """
+
+    def __init__(self, ttl=30.0, maxsize=4096):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._tickets = OrderedDict()  # ticket -> (expires, principal), oldest first
+
+    def issue(self, principal):
+        ticket = secrets.token_urlsafe(24)
+        now = time.monotonic()
+        with self._lock:
+            while self._tickets and (len(self._tickets) >= self.maxsize or next(iter(self._tickets.values()))[0] <= now):
+                self._tickets.popitem(last=False)
+            self._tickets[ticket] = (now + self.ttl, principal)
+        return ticket
+
+    def redeem(self, ticket):
+        with self._lock:
+            entry = self._tickets.pop(ticket, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+
+principals = PrincipalCache(
+    maxsize=int(os.environ.get("AUTH_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("AUTH_CACHE_TTL", "300")),
+)
+
+stream_tickets = StreamTickets(ttl=float(os.environ.get("STREAM_TICKET_TTL", "30")))
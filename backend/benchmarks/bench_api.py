@@ -0,0 +1,275 @@
+"""API latency and throughput under realistic scenarios, in process.
+
+Drives the real FastAPI app through httpx.ASGITransport against a throwaway
+SQLite file seeded with --teachers classes of --students students, each
+with a starting inventory. Scenarios run one after another; each runs its
+iterations --concurrency at a time against randomly chosen classes:
+
+  login    POST /token (the start-of-period login storm)
+  poll     GET /students and GET /inventory with If-None-Match, as a browser tab does
+  play     draw_student, draw_item for them, then use one of their cards
+  import   POST /import_excel with the class's roster as CSV
+  advance  POST /advance_turn
+
+Reports p50/p95/p99 latency and requests/second per endpoint. --out writes
+the results as JSON; --compare prints the change against an earlier file,
+e.g. one written on another commit.
+
+Usage (from backend/):  python benchmarks/bench_api.py [--scenarios poll,play] [--out after.json --compare before.json]
+Needs httpx.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+
+from common import BACKEND_DIR, load_app, seed_class, auth_headers
+
+PASSWORD = "bench"
+
+
+class Recorder:
+    """Latencies and status codes per endpoint label for one scenario."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+
+    async def request(self, client, label, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies.setdefault(label, []).append(time.perf_counter() - start)
+        codes = self.statuses.setdefault(label, {})
+        codes[response.status_code] = codes.get(response.status_code, 0) + 1
+        return response
+
+
+class Bench:
+    """Seeded classes plus the per-class state scenarios carry between iterations."""
+
+    def __init__(self, app_module, teachers, students, dorms, rng):
+        self.rng = rng
+        self.classes = []
+        for t in range(teachers):
+            username = f"bench-{t}"
+            _, ids = seed_class(app_module, username, students=students, dorms=dorms, password=PASSWORD)
+            roster = "name,dorm\n" + "".join(f"{username}-{i},{i % dorms}\n" for i in range(students))
+            self.classes.append({
+                "username": username,
+                "headers": auth_headers(app_module, username),
+                "ids": ids,
+                "roster": roster.encode(),
+                "etags": {},
+            })
+        self._seed_inventory(app_module)
+
+    def _seed_inventory(self, app_module):
+        import inventory
+        import models
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            cards = [card_id for (card_id,) in db.query(models.ItemCard.id).filter(models.ItemCard.probability > 0)]
+            counts = {}
+            for cls in self.classes:
+                for sid in cls["ids"]:
+                    for card_id in self.rng.sample(cards, min(3, len(cards))):
+                        counts[(sid, card_id)] = self.rng.randint(1, 3)
+            inventory.add_copies(db, counts)
+            db.commit()
+        finally:
+            db.close()
+
+    def pick(self):
+        return self.rng.choice(self.classes)
+
+
+async def login(client, bench, rec):
+    cls = bench.pick()
+    await rec.request(client, "POST /token", "POST", "/token", data={"username": cls["username"], "password": PASSWORD})
+
+
+async def poll(client, bench, rec):
+    cls = bench.pick()
+    for label, url in (("GET /students", "/students"), ("GET /inventory", "/inventory")):
+        headers = dict(cls["headers"])
+        if url in cls["etags"]:
+            headers["If-None-Match"] = cls["etags"][url]
+        r = await rec.request(client, label, "GET", url, headers=headers)
+        if "etag" in r.headers:
+            cls["etags"][url] = r.headers["etag"]
+
+
+async def play(client, bench, rec):
+    cls = bench.pick()
+    headers = cls["headers"]
+    r = await rec.request(client, "POST /draw_student", "POST", "/draw_student", headers=headers)
+    student_id = r.json()["id"] if r.status_code == 200 else bench.rng.choice(cls["ids"])
+    await rec.request(client, "POST /students/{id}/draw_item", "POST", f"/students/{student_id}/draw_item", headers=headers)
+    r = await rec.request(client, "GET /students/{id}/items", "GET", f"/students/{student_id}/items", headers=headers)
+    items = r.json() if r.status_code == 200 else []
+    if items:
+        item_id = bench.rng.choice(items)["id"]
+        await rec.request(client, "POST /student_items/{id}/use", "POST", f"/student_items/{item_id}/use", headers=headers)
+
+
+async def import_roster(client, bench, rec):
+    cls = bench.pick()
+    await rec.request(
+        client, "POST /import_excel", "POST", "/import_excel", headers=cls["headers"],
+        files={"file": ("roster.csv", cls["roster"], "text/csv")},
+    )
+
+
+async def advance(client, bench, rec):
+    cls = bench.pick()
+    await rec.request(client, "POST /advance_turn", "POST", "/advance_turn", headers=cls["headers"])
+
+
+# name -> (iteration, default iterations at --scale 1)
+SCENARIOS = {
+    "login": (login, 40),
+    "poll": (poll, 400),
+    "play": (play, 150),
+    "import": (import_roster, 20),
+    "advance": (advance, 200),
+}
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(rec, elapsed):
+    endpoints = {}
+    for label, values in sorted(rec.latencies.items()):
+        values.sort()
+        statuses = rec.statuses[label]
+        endpoints[label] = {
+            "count": len(values),
+            "errors": sum(n for code, n in statuses.items() if code >= 400),
+            "statuses": {str(code): n for code, n in sorted(statuses.items())},
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "rps": round(len(values) / elapsed, 1),
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {"elapsed_s": round(elapsed, 3), "requests": total, "rps": round(total / elapsed, 1), "endpoints": endpoints}
+
+
+async def run_scenario(client, bench, iteration, iterations, concurrency):
+    rec = Recorder()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await iteration(client, bench, rec)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(iterations)))
+    return summarize(rec, time.perf_counter() - start)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    for name, result in results["scenarios"].items():
+        print(f"\n{name}: {result['requests']} requests in {result['elapsed_s']:.2f}s, {result['rps']:.1f} req/s")
+        print(f"  {'endpoint':32s} {'count':>6s} {'err':>4s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'req/s':>8s}")
+        for label, e in result["endpoints"].items():
+            print(f"  {label:32s} {e['count']:6d} {e['errors']:4d} {e['p50_ms']:8.1f} {e['p95_ms']:8.1f} {e['p99_ms']:8.1f} {e['rps']:8.1f}")
+
+
+def print_comparison(results, baseline):
+    print(f"\nchange vs {baseline['meta'].get('commit') or 'baseline'} (negative latency is better)")
+    for name, result in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        for label, e in result["endpoints"].items():
+            b = before["endpoints"].get(label)
+            if b is None:
+                continue
+            deltas = "  ".join(
+                f"{key[:-3]} {(e[key] - b[key]) / b[key] * 100 if b[key] else 0:+6.1f}%" for key in ("p50_ms", "p95_ms", "p99_ms")
+            )
+            rps = (e["rps"] - b["rps"]) / b["rps"] * 100 if b["rps"] else 0
+            print(f"  {name:8s} {label:32s} {deltas}  req/s {rps:+6.1f}%")
+
+
+async def run(args):
+    import httpx
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    app_module = load_app()
+    start = time.perf_counter()
+    bench = Bench(app_module, args.teachers, args.students, args.dorms, random.Random(args.seed))
+    print(f"seeded {args.teachers} classes of {args.students} students in {time.perf_counter() - start:.1f}s")
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "scenarios": {},
+    }
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in args.scenarios:
+            iteration, iterations = SCENARIOS[name]
+            iterations = max(1, int(iterations * args.scale))
+            results["scenarios"][name] = await run_scenario(client, bench, iteration, iterations, args.concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies each scenario's iteration count")
+    parser.add_argument("--teachers", type=int, default=10)
+    parser.add_argument("--students", type=int, default=45)
+    parser.add_argument("--dorms", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nwrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Item-card draws/second: per-student POST /students/{id}/draw_item vs
+POST /draw_items/batch.
+
+Usage (from backend/):  python benchmarks/bench_batch_draw.py [--students 60] [--count 10]
+Needs httpx for FastAPI's TestClient.
+"""
+import argparse
+import time
+
+from common import load_app, seed_class, auth_headers
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=60)
+    parser.add_argument("--count", type=int, default=10, help="cards per student")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    from fastapi.testclient import TestClient
+
+    client = TestClient(app_module.app)
+    _, student_ids = seed_class(app_module, "bench-draw", students=args.students)
+    headers = auth_headers(app_module, "bench-draw")
+    total = len(student_ids) * args.count
+
+    # Warm the compiled pools so both paths start from the same state
+    client.post(f"/students/{student_ids[0]}/draw_item", headers=headers)
+
+    single, batch = [], []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        for sid in student_ids:
+            for _ in range(args.count):
+                client.post(f"/students/{sid}/draw_item", headers=headers).raise_for_status()
+        single.append(total / (time.perf_counter() - start))
+
+        payload = {"draws": [{"student_id": sid, "count": args.count} for sid in student_ids]}
+        start = time.perf_counter()
+        client.post("/draw_items/batch", json=payload, headers=headers).raise_for_status()
+        batch.append(total / (time.perf_counter() - start))
+
+    print(f"{total} draws per round, best of {args.rounds}")
+    print(f"  single draw_item : {max(single):10.0f} draws/s")
+    print(f"  draw_items/batch : {max(batch):10.0f} draws/s")
+
+
+if __name__ == "__main__":
+    main()
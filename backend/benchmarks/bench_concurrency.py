@@ -0,0 +1,69 @@
+"""Concurrent-request throughput while a login storm is running.
+
+Fires --logins POST /token requests and --writes PATCH /students/bulk
+requests alongside --polls GET /students requests, --concurrency at a time,
+through an in-process ASGI client. Any handler that
+blocks the event loop (e.g. password hashing inside an async def) shows up as
+inflated /students latency.
+
+Usage (from backend/):  python benchmarks/bench_concurrency.py [--concurrency 32]
+Needs httpx.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from common import load_app, seed_class, auth_headers
+
+
+async def run(args):
+    import httpx
+
+    app_module = load_app()
+    seed_class(app_module, "bench-conc", students=args.students, password="bench")
+    headers = auth_headers(app_module, "bench-conc")
+
+    jobs = ["login"] * args.logins + ["write"] * args.writes + ["poll"] * args.polls
+    random.Random(0).shuffle(jobs)
+    latencies = {kind: [] for kind in set(jobs)}
+    sem = asyncio.Semaphore(args.concurrency)
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(kind):
+            async with sem:
+                start = time.perf_counter()
+                if kind == "login":
+                    r = await client.post("/token", data={"username": "bench-conc", "password": "bench"})
+                elif kind == "write":
+                    r = await client.patch("/students/bulk", json={"delta": 1}, headers=headers)
+                else:
+                    r = await client.get("/students", headers=headers)
+                r.raise_for_status()
+                latencies[kind].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(kind) for kind in jobs))
+        elapsed = time.perf_counter() - start
+
+    print(f"{len(jobs)} requests, concurrency {args.concurrency}: {len(jobs) / elapsed:.1f} req/s")
+    for kind, values in sorted(latencies.items()):
+        values.sort()
+        p95 = values[int(len(values) * 0.95) - 1]
+        print(f"  {kind:5s} p50 {statistics.median(values) * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--writes", type=int, default=0)
+    parser.add_argument("--polls", type=int, default=400)
+    parser.add_argument("--students", type=int, default=60)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""First-paint cost of the bundled frontend, as the app serves it.
+
+Simulates a browser opening the app: GET /, then every local script,
+stylesheet and icon the page references, sent with
+`Accept-Encoding: gzip, deflate, br`. Then it simulates a repeat visit
+from a warm cache:
+- index.html is revalidated with If-None-Match.
+- Files marked immutable are not requested.
+- Other files that carry an ETag are revalidated. Browsers may
+  heuristically skip some of these; counting them is the conservative
+  choice.
+
+The same visits run against the serving code this replaced, kept below
+as legacy_app: /assets through StaticFiles, plus a catch-all that stats
+the path and returns a fresh FileResponse, uncompressed.
+
+Reports requests, bytes on the wire and the median server time per
+visit. It also estimates a weak link: the bytes at --mbps, plus --rtt-ms
+per round trip. There are two round trips, the page and then its assets
+in parallel.
+
+Usage (from backend/):  python benchmarks/bench_spa.py [--dist ../frontend/dist] [--precompress] [--mbps 2]
+Needs httpx; build the frontend first (npm run build).
+"""
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import sys
+import time
+
+from common import load_app
+
+ACCEPT_ENCODING = "gzip, deflate, br"
+LOCAL_REF = re.compile(r'(?:src|href)="(/[^/"][^"]*)"')
+
+
+def legacy_app(frontend_path):
+    from fastapi import FastAPI
+    from fastapi.responses import FileResponse
+    from fastapi.staticfiles import StaticFiles
+
+    app = FastAPI()
+    app.mount("/assets", StaticFiles(directory=os.path.join(frontend_path, "assets")), name="assets")
+
+    @app.get("/{full_path:path}")
+    async def serve_spa(full_path: str):
+        target_file = os.path.join(frontend_path, full_path)
+        if os.path.isfile(target_file):
+            return FileResponse(target_file)
+        return FileResponse(os.path.join(frontend_path, "index.html"))
+
+    return app
+
+
+async def visit(client, cache):
+    """One page load; cache maps URL -> response headers from the previous visit."""
+    requests, wire, server = 0, 0, 0.0
+
+    async def get(url):
+        nonlocal requests, wire, server
+        headers = {"Accept-Encoding": ACCEPT_ENCODING}
+        cached = cache.get(url)
+        if cached is not None:
+            if "immutable" in cached.get("cache-control", ""):
+                return None
+            if "etag" in cached:
+                headers["If-None-Match"] = cached["etag"]
+        start = time.perf_counter()
+        r = await client.get(url, headers=headers)
+        server += time.perf_counter() - start
+        requests += 1
+        wire += int(r.headers.get("content-length", len(r.content)))
+        assert r.status_code in (200, 304), f"{url}: {r.status_code}"
+        if r.status_code == 200:
+            cache[url] = r.headers
+        return r
+
+    page = await get("/")
+    html = page.text if page is not None and page.status_code == 200 else cache["/html"]
+    cache["/html"] = html
+    refs = sorted(set(LOCAL_REF.findall(html)))
+    await asyncio.gather(*(get(url) for url in refs))
+    return {"requests": requests, "bytes": wire, "server_ms": server * 1000}
+
+
+async def measure(app, repeat):
+    import httpx
+
+    first, repeated = [], []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://spa") as client:
+        for _ in range(repeat):
+            cache = {}
+            first.append(await visit(client, cache))
+            repeated.append(await visit(client, cache))
+    return [summarize(first), summarize(repeated)]
+
+
+def summarize(visits):
+    return {
+        "requests": visits[0]["requests"],
+        "bytes": visits[0]["bytes"],
+        "server_ms": statistics.median(v["server_ms"] for v in visits),
+    }
+
+
+def estimate_ms(result, mbps, rtt_ms):
+    round_trips = 2 if result["requests"] > 1 else result["requests"]
+    return result["server_ms"] + result["bytes"] * 8 / (mbps * 1e6) * 1000 + round_trips * rtt_ms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dist", default=os.path.join("..", "frontend", "dist"))
+    parser.add_argument("--precompress", action="store_true", help="write .br/.gz variants first, as build_exe.py does")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--mbps", type=float, default=2.0, help="link speed for the estimate")
+    parser.add_argument("--rtt-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    dist = os.path.abspath(args.dist)
+    if not os.path.isfile(os.path.join(dist, "index.html")):
+        sys.exit(f"no frontend build at {dist}")
+    if args.precompress:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import spa
+        spa.precompress(dist)
+    os.environ["FRONTEND_DIST"] = dist
+    app_module = load_app()
+
+    results = {
+        "before (FileResponse)": asyncio.run(measure(legacy_app(dist), args.repeat)),
+        "after (spa.py)": asyncio.run(measure(app_module.app, args.repeat)),
+    }
+    print(f"\n{'':24s} {'visit':6s} {'reqs':>5s} {'bytes':>10s} {'server ms':>10s} {f'est. ms @{args.mbps:g} Mbps':>18s}")
+    for name, visits in results.items():
+        for label, r in zip(("first", "repeat"), visits):
+            print(f"{name:24s} {label:6s} {r['requests']:5d} {r['bytes']:10d} {r['server_ms']:10.2f} "
+                  f"{estimate_ms(r, args.mbps, args.rtt_ms):18.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Cold-start budget: import profile and time to first 200 on GET /students.
+
+1. Imports main in a fresh interpreter under `python -X importtime` and
+   prints the slowest modules it pulls in.
+2. Starts `uvicorn main:app` against a prepared database (one teacher with
+   --students students) and polls GET /students until it answers 200.
+   Repeated --runs times; the median is reported.
+
+Exits 1 if the median time to first 200 exceeds --budget-ms or importing
+main exceeds --import-budget-ms, so a build can fail on a regression.
+
+Usage (from backend/):  python benchmarks/bench_startup.py [--budget-ms 1500]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from common import BACKEND_DIR, load_app, seed_class, auth_headers
+
+
+def import_profile(env, top):
+    """Returns (total_ms, [(cumulative_ms, module)]) for `import main`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    total, block, children = 0.0, [], []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # header row
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        ms = int(cumulative) / 1000
+        # importtime prints a module's children before the module itself
+        if depth == 1:
+            block.append((ms, name.strip()))
+        elif depth == 0:
+            if name.strip() == "main":
+                total, children = ms, block
+            block = []
+    children.sort(reverse=True)
+    return total, children[:top]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_200(env, headers, timeout=60.0):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/students"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with code {server.returncode}")
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=5) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"no 200 from {url} within {timeout:.0f}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--students", type=int, default=60)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--import-budget-ms", type=float, default=1000)
+    args = parser.parse_args()
+
+    # Prepare schema, catalog and a class once; the runs below measure a warm DB file
+    app_module = load_app()
+    seed_class(app_module, "bench-start", students=args.students)
+    headers = auth_headers(app_module, "bench-start")
+    env = dict(os.environ, PYTHONWARNINGS="ignore")
+
+    total, slowest = import_profile(env, args.top)
+    print(f"import main: {total:.0f} ms")
+    for ms, name in slowest:
+        print(f"  {ms:7.1f} ms  {name}")
+
+    samples = [time_to_first_200(env, headers) * 1000 for _ in range(args.runs)]
+    median = statistics.median(samples)
+    print(f"time to first 200 on /students: median {median:.0f} ms "
+          f"(min {min(samples):.0f}, max {max(samples):.0f}, {args.runs} runs)")
+
+    failed = False
+    if total > args.import_budget_ms:
+        print(f"FAIL: import main {total:.0f} ms > budget {args.import_budget_ms:.0f} ms")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: first 200 {median:.0f} ms > budget {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+"""Check the roll-call sampler, the star ledger and the schema migrations.
+
+sampler     ClassSampler against a brute-force model. A random sequence of
+            update / advance / remove calls (immune students, negative
+            stars, removals, growth past the trees' capacity) is checked
+            after every step: each student's ticket range in both Fenwick
+            trees must match the weights the model computes from scratch.
+migrations  A copy of the shipped sql_app.db, given one duplicated card copy
+            and one immune student so both conversions have work to do, is
+            migrated by the app's own startup. Students, stars, card copies
+            (now stacks with a quantity) and remaining immunity turns must
+            survive; the ledger baseline must match Student.stars; a second
+            run must apply nothing.
+ledger      The largest class of that database is driven through every
+            endpoint that changes stars, immunity or picks: draws, bulk and
+            absolute star changes, turns, every card effect, draw-time cards,
+            a student deletion. Afterwards verify_stars must report nothing
+            and, after every write, the cached sampler must equal one rebuilt
+            from the database.
+race        Class-wide writers are held right after their commit releases
+            the writer while a draw_student commits in between; the sampler
+            must still match the database once both have finished.
+
+Prints one line per check and exits 1 on any failure.
+
+Usage (from backend/):  python benchmarks/check_core.py [--db sql_app.db] [--steps 3000]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+from collections import Counter
+
+from common import BACKEND_DIR, load_app, auth_headers
+
+failures = []
+
+
+def check(label, ok, detail=""):
+    print(f"[{'ok' if ok else 'FAIL'}] {label}" + (f": {detail}" if detail and not ok else ""))
+    if not ok:
+        failures.append(label)
+    return ok
+
+
+# --- sampler ---
+
+def expected_weights(model, turn):
+    """{student_id: (fresh, weighted)} computed from scratch."""
+    from sampler import fresh_weight, star_weight
+
+    weights = {}
+    for student_id, (stars, pick_count, until) in model.items():
+        immune = until > turn
+        weights[student_id] = (fresh_weight(pick_count, immune), star_weight(stars, immune))
+    return weights
+
+
+def tree_problems(sampler, model, turn):
+    # Fenwick find() is monotonic, so a student owning the first and last
+    # ticket of its range owns the whole range
+    weights = expected_weights(model, turn)
+    problems = []
+    for which, tree in ((0, sampler.fresh_tree), (1, sampler.weighted_tree)):
+        prefix = 0
+        for slot, student_id in enumerate(sampler.ids):
+            w = weights[student_id][which] if student_id in weights else 0
+            if w and (tree.find(prefix) != slot or tree.find(prefix + w - 1) != slot):
+                problems.append(f"student {student_id}: tickets {prefix}..{prefix + w - 1} not in slot {slot}")
+            prefix += w
+        if tree.total != prefix:
+            problems.append(f"{('fresh', 'weighted')[which]} total {tree.total} != {prefix}")
+    return problems
+
+
+def check_sampler(steps, seed=0):
+    from sampler import ClassSampler
+
+    rng = random.Random(seed)
+    turn = 3
+    model = {}
+    for student_id in range(1, 21):
+        until = rng.choice([0, 0, turn - 1, turn, turn + 1, turn + 4])
+        model[student_id] = (rng.randint(0, 9), rng.choice([0, 0, 1, 2]), until)
+    sampler = ClassSampler([(sid, *state) for sid, state in model.items()], turn)
+    next_id = 21
+    first_error = None
+    immune_drawn = 0
+
+    for step in range(steps):
+        op = rng.random()
+        if op < 0.55:
+            # Existing or new student; stars go negative for cursed ones
+            if model and rng.random() < 0.8:
+                student_id = rng.choice(list(model))
+            else:
+                student_id, next_id = next_id, next_id + 1
+            state = (rng.randint(-3, 9), rng.choice([0, 1, 3]), rng.choice([0, turn, turn + rng.randint(1, 4)]))
+            model[student_id] = state
+            sampler.update(student_id, *state)
+        elif op < 0.75:
+            turn += rng.choice([0, 1, 1, 2])
+            sampler.advance(turn)
+        elif op < 0.85 and model:
+            student_id = rng.choice(list(model))
+            del model[student_id]
+            sampler.remove(student_id)
+        else:
+            drawn = sampler.draw(rng)
+            weights = expected_weights(model, turn)
+            if drawn is not None and model[drawn][2] > turn:
+                immune_drawn += 1
+            pool = 0 if any(f for f, _ in weights.values()) else 1
+            if drawn is None:
+                ok = not any(w[pool] for w in weights.values())
+            else:
+                ok = drawn in weights and weights[drawn][pool] > 0
+            if not ok and first_error is None:
+                first_error = f"step {step}: draw returned {drawn}"
+        problems = tree_problems(sampler, model, turn)
+        if problems and first_error is None:
+            first_error = f"step {step}: {problems[0]}"
+
+    check(f"sampler: {steps} random steps, {len(sampler.ids)} slots, turn {turn}", first_error is None, first_error)
+    check("sampler: immune students never drawn", immune_drawn == 0, f"{immune_drawn} draws")
+
+
+# --- migrations ---
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def snapshot(path):
+    conn = sqlite3.connect(path)
+    try:
+        has_quantity = "quantity" in columns(conn, "student_items")
+        immunity = "immunity" if "immune_until_turn" not in columns(conn, "students") else "immune_until_turn"
+        students = {
+            sid: (owner, stars, until)
+            for sid, owner, stars, until in conn.execute(f"SELECT id, owner_id, stars, {immunity} FROM students")
+        }
+        copies = Counter()
+        quantity = "quantity" if has_quantity else "1"
+        for sid, n in conn.execute(f"SELECT student_id, {quantity} FROM student_items"):
+            copies[sid] += n
+        stacks = conn.execute("SELECT COUNT(*) FROM student_items").fetchone()[0]
+        return students, copies, stacks
+    finally:
+        conn.close()
+
+
+def prepare_copy(source):
+    path = os.path.join(tempfile.mkdtemp(prefix="gacha-check-"), "sql_app.db")
+    shutil.copyfile(source, path)
+    conn = sqlite3.connect(path)
+    try:
+        if "quantity" not in columns(conn, "student_items"):
+            # A second copy of a card someone holds: the migration must fold it into one stack
+            conn.execute(
+                "INSERT INTO student_items (student_id, item_card_id) "
+                "SELECT student_id, item_card_id FROM student_items ORDER BY id LIMIT 1"
+            )
+        if "immune_until_turn" not in columns(conn, "students"):
+            # Two turns of immunity left: the migration must turn it into a stamp
+            conn.execute("UPDATE students SET immunity = 2 WHERE id = (SELECT MIN(id) FROM students)")
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+
+def check_migrations(before):
+    from database import SessionLocal, engine
+    from migrations import MIGRATIONS, run_migrations
+    from stars import verify_stars
+    from sqlalchemy import text
+
+    students_before, copies_before, stacks_before = before
+    students_after, copies_after, stacks_after = snapshot(engine.url.database)
+    with engine.connect() as conn:
+        version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+        duplicates = conn.execute(text(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM student_items GROUP BY student_id, item_card_id HAVING COUNT(*) > 1)"
+        )).scalar()
+        empty = conn.execute(text("SELECT COUNT(*) FROM student_items WHERE quantity < 1")).scalar()
+        turns = dict(conn.execute(text("SELECT id, current_turn FROM users")).all())
+
+    check(f"migrations: schema at version {version}", version == MIGRATIONS[-1][0], f"expected {MIGRATIONS[-1][0]}")
+    check(f"migrations: {len(students_after)} students kept", students_after.keys() == students_before.keys())
+    check("migrations: stars unchanged",
+          all(students_after[sid][1] == s[1] for sid, s in students_before.items() if sid in students_after))
+    remaining = {
+        sid: (students_after[sid][2] - turns.get(students_after[sid][0], 0))
+        for sid, s in students_before.items() if s[2] and sid in students_after
+    }
+    check(f"migrations: {len(remaining)} immune students keep their turns",
+          all(remaining[sid] == students_before[sid][2] for sid in remaining), str(remaining))
+    check(f"migrations: {sum(copies_before.values())} card copies in {stacks_before} rows -> {stacks_after} stacks",
+          copies_after == copies_before and not duplicates and not empty,
+          f"copies {sum(copies_after.values())}, duplicate stacks {duplicates}, empty stacks {empty}")
+
+    db = SessionLocal()
+    try:
+        mismatches = verify_stars(db)
+        check("migrations: ledger baseline matches Student.stars", not mismatches, str(mismatches[:5]))
+    finally:
+        db.close()
+    with engine.connect() as conn:
+        rows_before = conn.execute(text("SELECT COUNT(*) FROM schema_version")).scalar()
+    run_migrations(engine)
+    with engine.connect() as conn:
+        rows_after = conn.execute(text("SELECT COUNT(*) FROM schema_version")).scalar()
+    check("migrations: a second run applies nothing", rows_after == rows_before)
+
+
+# --- ledger ---
+
+def sampler_drift(owner_id):
+    """Students whose cached sampler weights differ from a sampler rebuilt from the database."""
+    import models
+    from database import SessionLocal
+    from sampler import ClassSampler, samplers
+
+    db = SessionLocal()
+    try:
+        cached = samplers.get(db, owner_id)
+        rows = db.query(
+            models.Student.id, models.Student.stars, models.Student.pick_count, models.Student.immune_until_turn,
+        ).filter(models.Student.owner_id == owner_id).all()
+        turn = db.query(models.User.current_turn).filter(models.User.id == owner_id).scalar()
+    finally:
+        db.close()
+    rebuilt = ClassSampler(rows, turn)
+
+    def weights(sampler):
+        return {sid: (sampler.fresh[slot], sampler.weighted[slot]) for sid, slot in sampler.slots.items()}
+
+    cached_weights, rebuilt_weights = weights(cached), weights(rebuilt)
+    drift = sorted(sid for sid in cached_weights.keys() | rebuilt_weights.keys()
+                   if cached_weights.get(sid) != rebuilt_weights.get(sid))
+    if cached.turn != turn:
+        drift.append(f"turn {cached.turn} vs {turn}")
+    return drift
+
+
+def drive_class(main, owner_id, username, rounds, seed=0):
+    from fastapi.testclient import TestClient
+    import inventory
+    import models
+    from database import SessionLocal
+
+    rng = random.Random(seed)
+    client = TestClient(main.app)
+    headers = auth_headers(main, username)
+    errors, drifts = [], []
+
+    def call(method, url, **kwargs):
+        r = client.request(method, url, headers=headers, **kwargs)
+        if r.status_code >= 400:
+            errors.append(f"{method} {url}: {r.status_code} {r.text[:200]}")
+        # Later writes resync most students, so a missed update only shows right after its request
+        elif method != "GET":
+            drift = sampler_drift(owner_id)
+            if drift:
+                drifts.append(f"after {method} {url}: students {drift[:10]}")
+        return r
+
+    def student_ids():
+        return [s["id"] for s in call("GET", "/students").json()]
+
+    db = SessionLocal()
+    cards = [(c.id, c.name) for c in db.query(models.ItemCard).filter(models.ItemCard.probability != 0)]
+    db.close()
+
+    for _ in range(rounds):
+        ids = student_ids()
+        call("POST", "/draw_student")
+        call("PATCH", "/students/bulk", json={"delta": rng.choice([-2, -1, 1, 2]), "reason": "answer"})
+        call("PATCH", "/students/bulk", json={"delta": -1, "student_ids": rng.sample(ids, 3)})
+        call("PATCH", "/students/bulk", json={"delta": 1, "dorm_number": rng.choice(["1", "2", "3"])})
+        call("PUT", f"/students/{rng.choice(ids)}", json={"stars": rng.randint(0, 6), "is_cursed": rng.random() < 0.3})
+        call("PUT", f"/students/{rng.choice(ids)}/immunity?immunity={rng.randint(0, 3)}")
+        call("POST", "/advance_turn")
+        # Every card once per round, used by a random student
+        db = SessionLocal()
+        given = []
+        for card_id, _ in cards:
+            student_id = rng.choice(ids)
+            inventory.add_copies(db, {(student_id, card_id): 1})
+            given.append(db.query(models.StudentItem.id).filter_by(student_id=student_id, item_card_id=card_id).scalar())
+        db.commit()
+        db.close()
+        for item_id in given:
+            call("POST", f"/student_items/{item_id}/use")
+        # Negative pool: draw-time cards resolve on the server
+        call("POST", f"/students/{rng.choice(ids)}/draw_item?pool_type=negative")
+        call("POST", "/draw_items/batch", json={"draws": [
+            {"student_id": sid, "count": 2, "pool_type": rng.choice(["normal", "negative"])} for sid in rng.sample(ids, 4)
+        ]})
+    call("DELETE", f"/students/{student_ids()[-1]}")
+    return errors, drifts
+
+
+def largest_class():
+    import models
+    from database import SessionLocal
+    from sqlalchemy import func
+
+    db = SessionLocal()
+    try:
+        owner_id, count = (
+            db.query(models.Student.owner_id, func.count())
+            .filter(models.Student.owner_id.isnot(None))
+            .group_by(models.Student.owner_id).order_by(func.count().desc()).first()
+        )
+        return owner_id, db.get(models.User, owner_id).username, count
+    finally:
+        db.close()
+
+
+def check_ledger(main, rounds):
+    from database import SessionLocal
+    from stars import verify_stars
+
+    owner_id, username, count = largest_class()
+    errors, drifts = drive_class(main, owner_id, username, rounds)
+    check(f"ledger: {rounds} rounds of class activity on {count} students", not errors, "; ".join(errors[:3]))
+    check("ledger: cached sampler matches the database after every write", not drifts, "; ".join(drifts[:3]))
+
+    db = SessionLocal()
+    try:
+        mismatches = verify_stars(db)
+    finally:
+        db.close()
+    check("ledger: star ledger totals match Student.stars", not mismatches, str(mismatches[:5]))
+
+
+class CommitGate:
+    """Holds the next committed request once its session has returned the writer.
+
+    after_transaction_end fires after the connection is back in the pool, so
+    another request can write while the held one has not yet returned.
+    """
+
+    def __init__(self):
+        self.armed = False
+        self.held = threading.Event()
+        self.release = threading.Event()
+
+    def after_commit(self, session):
+        session.info["committed"] = True
+
+    def after_transaction_end(self, session, transaction):
+        if transaction.parent is None and session.info.pop("committed", False) and self.armed:
+            self.armed = False
+            self.held.set()
+            self.release.wait(10)
+
+
+def check_race(main):
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    import inventory
+    import models
+    from database import SessionLocal
+    from sampler import samplers
+
+    owner_id, username, _ = largest_class()
+    client = TestClient(main.app)
+    headers = auth_headers(main, username)
+    db = SessionLocal()
+    card_id = db.query(models.ItemCard.id).filter(models.ItemCard.name == "普渡众生").scalar()
+    student_id = db.query(models.Student.id).filter(models.Student.owner_id == owner_id).first()[0]
+    inventory.add_copies(db, {(student_id, card_id): 1})
+    item_id = db.query(models.StudentItem.id).filter_by(student_id=student_id, item_card_id=card_id).scalar()
+    db.commit()
+    db.close()
+
+    # Class-wide, so whoever the interleaved draw picks was written by both
+    writers = [
+        ("PATCH", "/students/bulk", {"json": {"delta": 1}}),
+        ("POST", f"/student_items/{item_id}/use", {}),
+    ]
+    gate = CommitGate()
+    event.listen(Session, "after_commit", gate.after_commit)
+    event.listen(Session, "after_transaction_end", gate.after_transaction_end)
+    try:
+        for method, url, kwargs in writers:
+            # Fresh weight only changes on a first pick, so make every student's next draw one
+            db = SessionLocal()
+            db.query(models.Student).filter(models.Student.owner_id == owner_id).update({"pick_count": 0})
+            db.commit()
+            db.close()
+            samplers.invalidate(owner_id)
+            gate.held.clear()
+            gate.release.clear()
+            gate.armed = True
+            responses = []
+            writer = threading.Thread(target=lambda: responses.append(client.request(method, url, headers=headers, **kwargs)))
+            writer.start()
+            held = gate.held.wait(10)
+            drawn = client.post("/draw_student", headers=headers)
+            gate.release.set()
+            writer.join()
+            drift = sampler_drift(owner_id)
+            check(f"race: {method} {url} around a draw_student", held and drawn.status_code == 200
+                  and responses and responses[0].status_code == 200 and not drift,
+                  f"held {held}, draw {drawn.status_code}, "
+                  f"writer {responses[0].status_code if responses else None}, drifted students {drift[:10]}")
+    finally:
+        gate.armed = False
+        event.remove(Session, "after_commit", gate.after_commit)
+        event.remove(Session, "after_transaction_end", gate.after_transaction_end)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=os.path.join(BACKEND_DIR, "sql_app.db"), help="database to migrate (copied first)")
+    parser.add_argument("--steps", type=int, default=3000, help="random sampler operations")
+    parser.add_argument("--rounds", type=int, default=15, help="rounds of class activity")
+    args = parser.parse_args()
+
+    # load_app must come first: the app modules bind DATABASE_URL on import
+    path = prepare_copy(os.path.abspath(args.db))
+    before = snapshot(path)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    app_module = load_app()
+
+    check_sampler(args.steps)
+    check_migrations(before)
+    check_ledger(app_module, args.rounds)
+    check_race(app_module)
+
+    print(f"\n{len(failures)} failed" if failures else "\nall checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Fail on full table scans in the SQL behind the class endpoints.
+
+Builds a synthetic database (default 100k students across 2500 classes, with
+items and star history), drives every per-class endpoint once through the
+app, and runs EXPLAIN QUERY PLAN on each statement as it executes, on the
+same connection and with the same parameters. Any plan step that scans a
+table, or asks SQLite for an automatic index, is reported and makes the
+script exit 1.
+
+Allowed scans: the card catalog (a few dozen rows), single-row bookkeeping
+tables and the roster import's temp table. Admin-wide endpoints are not
+driven; they read every class by design.
+
+Usage (from backend/):  python benchmarks/check_query_plans.py [--students 100000]
+"""
+import argparse
+import io
+import random
+import re
+import sys
+import time
+
+from common import load_app, auth_headers
+
+ALLOWED_SCANS = {"item_cards", "sync_seq", "schema_version", "import_roster"}
+SCAN = re.compile(r"^SCAN (\w+)")
+PLANNED = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+current = {"label": None}
+plans = {}  # (label, statement) -> plan details
+
+
+def capture(conn, cursor, statement, parameters, context, executemany):
+    if executemany or current["label"] is None or not statement.lstrip().upper().startswith(PLANNED):
+        return
+    key = (current["label"], statement)
+    if key not in plans:
+        rows = cursor.connection.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        plans[key] = [row[3] for row in rows]
+
+
+def problems(details, aliases):
+    for detail in details:
+        match = SCAN.match(detail)
+        if match and aliases.get(match.group(1), match.group(1)) not in ALLOWED_SCANS:
+            yield detail
+        elif "AUTOMATIC" in detail:
+            yield detail
+
+
+def table_aliases(statement):
+    # EXPLAIN QUERY PLAN names aliased tables by alias ("SCAN r")
+    return {alias: table for table, alias in re.findall(r"\b(\w+) (?:AS )?(\w+)\b(?=\s*(?:,|WHERE|JOIN|ON|LEFT|$))", statement)}
+
+
+def build(app_module, students, class_size, seed=0):
+    from sqlalchemy import text
+    from database import engine
+
+    rng = random.Random(seed)
+    classes = students // class_size
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (username, hashed_password, is_admin) VALUES (:u, 'x', 0)"),
+                     [{"u": f"synthetic-{c}"} for c in range(classes)])
+        owners = [uid for (uid,) in conn.execute(text("SELECT id FROM users WHERE username LIKE 'synthetic-%' ORDER BY id"))]
+        conn.execute(text(
+            "INSERT INTO students (name, dorm_number, stars, pick_count, immune_until_turn, is_cursed, owner_id) "
+            "VALUES (:n, :d, :s, 0, 0, 0, :o)"
+        ), [{"n": f"s{i}", "d": str(i % 10), "s": rng.randint(0, 9), "o": owners[i // class_size]} for i in range(classes * class_size)])
+        student_ids = [sid for (sid,) in conn.execute(text("SELECT id FROM students"))]
+        conn.execute(text(
+            "INSERT INTO student_items (student_id, item_card_id) VALUES (:s, :c) "
+            "ON CONFLICT (student_id, item_card_id) DO UPDATE SET quantity = quantity + 1"
+        ),
+                     [{"s": rng.choice(student_ids), "c": rng.randint(1, 25)} for _ in range(len(student_ids) * 2)])
+        conn.execute(text(
+            "INSERT INTO star_events (student_id, owner_id, dorm_number, delta, reason, created_at) "
+            "SELECT id, owner_id, dorm_number, stars, 'answer', CURRENT_TIMESTAMP FROM students"
+        ))
+        stacks = conn.execute(text("SELECT COUNT(*) FROM student_items")).scalar()
+    print(f"synthetic data: {len(owners)} classes, {len(student_ids)} students, "
+          f"{len(student_ids) * 2} items in {stacks} stacks, {time.perf_counter() - start:.1f}s")
+
+
+def drive(app_module, class_size):
+    from fastapi.testclient import TestClient
+    import inventory
+    import models
+    from database import SessionLocal
+    from common import seed_class
+
+    client = TestClient(app_module.app)
+    _, ids = seed_class(app_module, "plans", students=class_size, dorms=10, password="plans")
+    headers = auth_headers(app_module, "plans")
+    db = SessionLocal()
+    cards = {c.name: c.id for c in db.query(models.ItemCard)}
+    db.close()
+
+    def call(label, method, url, **kwargs):
+        current["label"] = label
+        try:
+            r = client.request(method, url, headers=headers, **kwargs)
+        finally:
+            current["label"] = None
+        assert r.status_code < 400, f"{label}: {r.status_code} {r.text}"
+        return r
+
+    def give(student_id, card_name):
+        db = SessionLocal()
+        inventory.add_copies(db, {(student_id, cards[card_name]): 1})
+        item_id = db.query(models.StudentItem.id).filter_by(student_id=student_id, item_card_id=cards[card_name]).scalar()
+        db.commit()
+        db.close()
+        return item_id
+
+    current["label"] = "POST /token"
+    client.post("/token", data={"username": "plans", "password": "plans"})
+    current["label"] = None
+    call("GET /users/me", "GET", "/users/me")
+    call("GET /students", "GET", "/students")
+    call("GET /students/changes", "GET", "/students/changes?since=1")
+    call("GET /items", "GET", "/items")
+    call("POST /draw_student", "POST", "/draw_student")
+    call("PATCH /students/bulk (class)", "PATCH", "/students/bulk", json={"delta": 1})
+    call("PATCH /students/bulk (dorm)", "PATCH", "/students/bulk", json={"delta": 1, "dorm_number": "3"})
+    call("PATCH /students/bulk (ids)", "PATCH", "/students/bulk", json={"delta": -1, "student_ids": ids[:3]})
+    call("PUT /students/{id}", "PUT", f"/students/{ids[0]}", json={"stars": 4, "immunity": 1})
+    call("PUT /students/{id}/immunity", "PUT", f"/students/{ids[1]}/immunity?immunity=2")
+    call("POST /advance_turn", "POST", "/advance_turn")
+    call("POST /students/{id}/draw_item", "POST", f"/students/{ids[0]}/draw_item")
+    call("POST /draw_items/batch", "POST", "/draw_items/batch", json={"draws": [{"student_id": i, "count": 2} for i in ids[:5]]})
+    call("GET /students/{id}/items", "GET", f"/students/{ids[0]}/items")
+    call("GET /inventory", "GET", "/inventory")
+    call("GET /stars/summary (dorm)", "GET", "/stars/summary")
+    call("GET /stars/summary (student)", "GET", "/stars/summary?by=student")
+    call("GET /students/{id}/star_events", "GET", f"/students/{ids[0]}/star_events")
+    for card in ("军团荣耀", "末日审判", "结界：庇护所", "连锁闪电", "法力汲取", "净化术", "标记目标"):
+        call(f"POST /student_items/{{id}}/use ({card})", "POST", f"/student_items/{give(ids[2], card)}/use")
+    call("DELETE /student_items/{id}", "DELETE", f"/student_items/{give(ids[2], '绝对防御')}")
+    call("DELETE /students/{id}", "DELETE", f"/students/{ids[-1]}")
+    roster = "name,dorm\n" + "".join(f"plans-{i},{i % 10}\n" for i in range(class_size - 5)) + "newcomer,1\n"
+    call("POST /import_excel", "POST", "/import_excel", files={"file": ("roster.csv", io.BytesIO(roster.encode()))})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=100_000)
+    parser.add_argument("--class-size", type=int, default=40)
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    app_module = load_app()
+    build(app_module, args.students, args.class_size)
+
+    from sqlalchemy import event
+    from database import engine, read_engine
+    for target in (engine, read_engine):
+        event.listen(target, "before_cursor_execute", capture)
+    drive(app_module, args.class_size)
+
+    failures = 0
+    for (label, statement), details in plans.items():
+        bad = list(problems(details, table_aliases(statement)))
+        if bad or args.verbose:
+            print(f"\n[{'FAIL' if bad else 'ok'}] {label}\n  {' '.join(statement.split())[:300]}")
+            for detail in details:
+                print(f"    {detail}")
+        failures += bool(bad)
+    print(f"\n{len(plans)} statements checked across {len({label for label, _ in plans})} endpoints, {failures} with full scans")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app():
+    """Import main against a throwaway SQLite file and run its startup.
+
+    Must run before anything imports database/main. Returns the main module.
+    httpx.ASGITransport does not send lifespan events, so startup runs here.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="gacha-bench-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+    # main.py resolves static/ relative to the cwd
+    os.chdir(BACKEND_DIR)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    import main
+    main.startup()
+    return main
+
+
+def seed_class(main, username, students=60, dorms=10, password="bench"):
+    """Create a teacher with a synthetic roster; returns (user_id, student_ids)."""
+    import models
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.username == username).first()
+        if user is None:
+            user = models.User(username=username, hashed_password=main.get_password_hash(password))
+            db.add(user)
+            db.flush()
+        db.add_all([
+            models.Student(
+                name=f"{username}-{i}", dorm_number=str(i % dorms), stars=i % 5,
+                pick_count=0, immune_until_turn=0, is_cursed=False, owner_id=user.id,
+            )
+            for i in range(students)
+        ])
+        db.commit()
+        ids = [sid for (sid,) in db.query(models.Student.id).filter(models.Student.owner_id == user.id)]
+        return user.id, ids
+    finally:
+        db.close()
+
+
+def auth_headers(main, username):
+    token = main.create_access_token(data={"sub": username})
+    return {"Authorization": f"Bearer {token}"}
@@ -12,6 +12,25 @@ def build():
         print("Please run 'npm run build' in the frontend directory first.")
         return
 
+    # Card image variants are bundled; the packaged app can't write next to itself
+    try:
+        import PIL
+    except ImportError:
+        print("Installing Pillow...")
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "pillow"])
+    sys.path.insert(0, current_dir)
+    import card_images
+    card_images.build(os.path.join(current_dir, "static"))
+
+    # .br/.gz copies of the frontend bundle, so the server never compresses per request
+    try:
+        import brotli
+    except ImportError:
+        print("Installing Brotli...")
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "brotli"])
+    import spa
+    spa.precompress(frontend_dist)
+
     # Install pyinstaller if needed
     try:
         import PyInstaller
@@ -31,6 +50,7 @@ def build():
         "--name", "ClassroomGacha",
         "--add-data", f"{frontend_dist}{sep}dist",
         "--add-data", f"{os.path.join(current_dir, 'static')}{sep}static",
+        "--add-data", f"{os.path.join(current_dir, '..', 'files', '抽卡定义说明.json')}{sep}files",
         # Dependencies that might be missed
         "--hidden-import", "uvicorn.logging",
         "--hidden-import", "uvicorn.loops",
@@ -52,14 +72,7 @@ def build():
     
     print("\nBuild Complete!")
     print(f"Executable is located at: {os.path.join(current_dir, 'dist', 'ClassroomGacha', 'ClassroomGacha.exe')}")
-    
-    # Copy Excel file if exists
-    excel_file = os.path.join(current_dir, "props_cards.xlsx")
-    dist_dir = os.path.join(current_dir, "dist", "ClassroomGacha")
-    if os.path.exists(excel_file) and os.path.exists(dist_dir):
-        import shutil
-        shutil.copy(excel_file, dist_dir)
-        print("Copied props_cards.xlsx to output directory.")
+
 
 if __name__ == "__main__":
     build()
@@ -0,0 +1,148 @@
+import hashlib
+import io
+import json
+import os
+
+from fastapi.staticfiles import StaticFiles
+
+# Card art variants. The originals in static/images are phone-camera sized
+# (~2 MB, 1696x2528); the UI shows them as 96px thumbnails and ~320px
+# full-card views. prepare() resizes each original once into the widths
+# below, as WebP and JPEG, under static/cards with content-hashed names,
+# and records them in static/card_images.json. Hashed names never change
+# content, so /static/cards is served as immutable.
+#
+# Pillow is optional: without it (or with an unreadable static dir, as in
+# the packaged exe) the existing manifest is used as is, and cards without
+# variants fall back to the original file.
+
+VARIANTS = {"thumb": 240, "display": 800}  # name -> max width in px (2x the CSS size)
+JPEG_OPTIONS = {"quality": 82, "optimize": True, "progressive": True}
+WEBP_OPTIONS = {"quality": 80}  # method 6 doubles encode time for ~4% smaller files
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_manifest = {}  # image_path -> {"sha256": ..., "variants": {variant: {format: filename}}}
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _load(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("images", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _encode(image, fmt, options):
+    buf = io.BytesIO()
+    image.save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+def _render(source_path, stem, cards_dir):
+    from PIL import Image, features
+
+    formats = [("jpg", "JPEG", JPEG_OPTIONS)]
+    if features.check("webp"):
+        formats.insert(0, ("webp", "WEBP", WEBP_OPTIONS))
+    variants = {}
+    with Image.open(source_path) as original:
+        # JPEG decodes at 1/2..1/8 scale when asked for less; plenty for the largest variant
+        largest = max(VARIANTS.values())
+        original.draft("RGB", (largest, round(original.height * largest / original.width)))
+        original = original.convert("RGB")
+        for name, width in VARIANTS.items():
+            image = original
+            if original.width > width:
+                image = original.resize((width, round(original.height * width / original.width)), Image.LANCZOS)
+            variants[name] = {}
+            for ext, fmt, options in formats:
+                data = _encode(image, fmt, options)
+                filename = f"{stem}-{name}.{_digest(data)[:12]}.{ext}"
+                path = os.path.join(cards_dir, filename)
+                if not os.path.exists(path):
+                    with open(path, "wb") as f:
+                        f.write(data)
+                variants[name][ext] = filename
+    return variants
+
+
+def build(static_dir):
+    """(Re)generate variants for new or changed originals and rewrite the manifest.
+
+    Returns the manifest. Raises ImportError without Pillow, OSError when
+    static_dir is not writable.
+    """
+    import PIL  # fail before touching any file
+
+    images_dir = os.path.join(static_dir, "images")
+    cards_dir = os.path.join(static_dir, "cards")
+    manifest_path = os.path.join(static_dir, "card_images.json")
+    os.makedirs(cards_dir, exist_ok=True)
+    old = _load(manifest_path)
+    manifest, rendered = {}, 0
+    for filename in sorted(os.listdir(images_dir)):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() not in SOURCE_EXTENSIONS:
+            continue
+        source_path = os.path.join(images_dir, filename)
+        with open(source_path, "rb") as f:
+            sha = _digest(f.read())
+        entry = old.get(filename)
+        if (entry and entry["sha256"] == sha and
+                all(os.path.exists(os.path.join(cards_dir, name))
+                    for formats in entry["variants"].values() for name in formats.values())):
+            manifest[filename] = entry
+            continue
+        manifest[filename] = {"sha256": sha, "variants": _render(source_path, stem, cards_dir)}
+        rendered += 1
+
+    # Drop variants no manifest entry points at (replaced or removed originals)
+    keep = {name for entry in manifest.values() for formats in entry["variants"].values() for name in formats.values()}
+    for name in os.listdir(cards_dir):
+        if name not in keep:
+            os.remove(os.path.join(cards_dir, name))
+    if rendered or manifest != old:
+        tmp = manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"images": manifest}, f, indent=1, sort_keys=True)
+        os.replace(tmp, manifest_path)
+        print(f"Card image variants: {rendered} rendered, {len(manifest) - rendered} unchanged")
+    return manifest
+
+
+def prepare(static_dir):
+    # Startup: build what is missing if possible, else serve the manifest that shipped
+    global _manifest
+    try:
+        _manifest = build(static_dir)
+    except ImportError:
+        _manifest = _load(os.path.join(static_dir, "card_images.json"))
+        if not _manifest:
+            print("Pillow not installed; card images are served at full size")
+    except OSError as e:
+        print(f"Could not build card image variants ({e}); using the existing manifest")
+        _manifest = _load(os.path.join(static_dir, "card_images.json"))
+
+
+def urls(image_path):
+    """{"thumb": {"webp": url, "jpg": url}, "display": {...}} or None without variants."""
+    entry = _manifest.get(image_path) if image_path else None
+    if entry is None:
+        return None
+    return {
+        variant: {ext: f"/static/cards/{name}" for ext, name in formats.items()}
+        for variant, formats in entry["variants"].items()
+    }
+
+
+class ImmutableStaticFiles(StaticFiles):
+    # For content-hashed files only: a URL's bytes never change
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE
+        return response
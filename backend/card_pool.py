@@ -0,0 +1,115 @@
+import random
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import models, schemas
+
+# Fallback used when do_type has not been filled in (older databases)
+NEGATIVE_CARD_NAMES = ["群体沉默", "末日审判", "黑暗诅咒", "一夫当关"]
+
+
+def normalize_pool_type(pool_type):
+    return "negative" if pool_type == "negative" else "normal"
+
+
+class CompiledPool:
+    """Card snapshots plus a cumulative weight array for O(log n) draws."""
+
+    def __init__(self, cards):
+        self.cards = cards
+        weights = [1.0 if c["probability"] is None else c["probability"] for c in cards]
+        if sum(weights) <= 0:
+            weights = [1.0] * len(cards)
+        self.cumulative = []
+        total = 0.0
+        for w in weights:
+            total += w
+            self.cumulative.append(total)
+        self.total = total
+
+    def draw(self, k=1, rng=random):
+        # random.choices bisects the precomputed cumulative weights for all k at once
+        return rng.choices(self.cards, cum_weights=self.cumulative, k=k)
+
+
+def select_pool_cards(cards, pool_type):
+    # probability 0 marks cards retired from the catalog
+    cards = [c for c in cards if c["probability"] != 0]
+    if pool_type == "negative":
+        selected = [c for c in cards if c["do_type"] == 0]
+        if not selected:
+            selected = [c for c in cards if c["name"] in NEGATIVE_CARD_NAMES]
+    else:
+        selected = [c for c in cards if c["do_type"] == 1]
+        if not selected:
+            selected = [c for c in cards if c["name"] not in NEGATIVE_CARD_NAMES]
+    # Ultimate fallback
+    return selected or cards
+
+
+class CardPoolCache:
+    """Process-wide compiled pools keyed by pool type.
+
+    Built from one item_cards query and dropped whenever a session commits a
+    change to ItemCard.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = None
+        self._generation = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._pools = None
+            self._generation += 1
+
+    @property
+    def generation(self):
+        # Bumped after every committed ItemCard change; doubles as the catalog version
+        with self._lock:
+            return self._generation
+
+    def get(self, db, pool_type):
+        pools = self._pools
+        if pools is None:
+            with self._lock:
+                generation = self._generation
+            cards = [
+                schemas.ItemCard.model_validate(c).model_dump()
+                for c in db.query(models.ItemCard).order_by(models.ItemCard.id).all()
+            ]
+            pools = {}
+            if cards:
+                for name in ("normal", "negative"):
+                    pools[name] = CompiledPool(select_pool_cards(cards, name))
+            with self._lock:
+                # Don't install a build that raced with an invalidation
+                if generation == self._generation:
+                    self._pools = pools
+        return pools.get(normalize_pool_type(pool_type))
+
+
+card_pools = CardPoolCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _track_item_card_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, models.ItemCard):
+            session.info["item_cards_changed"] = True
+            card_pools.invalidate()
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("item_cards_changed", False):
+        card_pools.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_after_rollback(session):
+    session.info.pop("item_cards_changed", None)
@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+
+from sqlalchemy import insert, update, delete
+
+import models
+import inventory
+from effects import normalize_card_name
+
+# Single source of truth for the card pool (name, texts, art, pool, weight).
+# Lives in files/ next to backend/; the exe and the Docker image keep that layout.
+ROOT_DIR = sys._MEIPASS if getattr(sys, 'frozen', False) else os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CATALOG_PATH = os.path.join(ROOT_DIR, "files", "抽卡定义说明.json")
+CARD_FIELDS = ("description", "function_desc", "image_path", "do_type", "probability")
+
+
+def load_catalog(path=CATALOG_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def sync_card_catalog(db, catalog=None):
+    """Reconcile item_cards with the catalog file.
+
+    One SELECT, then at most one bulk INSERT and one bulk UPDATE regardless
+    of catalog size. Cards are matched by normalized name (spaces and case
+    ignored, as for effects), so "BOSS挑战券" in an old database is renamed
+    to the catalog's "Boss 挑战券" in place rather than duplicated. Other
+    rows with the same normalized name are folded into the matched card,
+    inventories included. Cards missing from the catalog are kept, because
+    inventories may reference them, but they are retired with probability
+    0 so they are never drawn. The caller commits. Returns (inserted, updated).
+    """
+    catalog = load_catalog() if catalog is None else catalog
+    existing, duplicates = {}, []
+    for card in db.query(models.ItemCard).order_by(models.ItemCard.id):
+        key = normalize_card_name(card.name)
+        if key in existing:
+            duplicates.append((card, existing[key]))
+        else:
+            existing[key] = card
+
+    inserts, updates = [], []
+    for entry in catalog:
+        wanted = {"name": entry["name"], **{field: entry.get(field) for field in CARD_FIELDS}}
+        card = existing.pop(normalize_card_name(entry["name"]), None)
+        if card is None:
+            inserts.append(wanted)
+        elif any(getattr(card, field) != value for field, value in wanted.items()):
+            updates.append({"id": card.id, **wanted})
+
+    # Cards the catalog no longer lists
+    for card in existing.values():
+        if card.probability != 0:
+            updates.append({"id": card.id, "probability": 0.0})
+
+    # Same card under two spellings (e.g. "皇城PK" and "皇城 PK"): keep the older row
+    for card, keep in duplicates:
+        inventory.merge_card(db, card.id, keep.id)
+    if duplicates:
+        db.execute(delete(models.ItemCard).where(models.ItemCard.id.in_([card.id for card, _ in duplicates])))
+
+    if inserts:
+        db.execute(insert(models.ItemCard), inserts)
+    if updates:
+        db.execute(update(models.ItemCard), updates)
+    return len(inserts), len(updates) + len(duplicates)
@@ -1,12 +1,51 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./sql_app.db")
+READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", "8"))
+# Seconds a request waits for the writer before giving up with 503
+WRITE_TIMEOUT = float(os.environ.get("DB_WRITE_TIMEOUT", "5"))
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
 
+connect_args = {"check_same_thread": False, "timeout": 15} if IS_SQLITE else {}
+
+# Writer: a single pooled connection. Requests that write queue on pool
+# checkout instead of fighting over SQLite's write lock. Handlers keep it
+# only for their transaction, so the queue drains quickly; a request that
+# still waits WRITE_TIMEOUT fails fast instead of pinning a worker thread.
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args=connect_args,
+    pool_size=1, max_overflow=0, pool_timeout=WRITE_TIMEOUT,
+)
+
+# Readers: WAL lets these run alongside the writer without blocking.
+read_engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args=connect_args,
+    pool_size=READ_POOL_SIZE, max_overflow=32,
 )
+
+
+def _sqlite_pragmas(read_only):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode NORMAL only syncs at checkpoints, so many small commits
+        # share one fsync instead of paying for one each
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=15000")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+    return on_connect
+
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _sqlite_pragmas(read_only=False))
+    event.listen(read_engine, "connect", _sqlite_pragmas(read_only=True))
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
@@ -0,0 +1,244 @@
+import random
+
+from sqlalchemy import func, update
+
+import models
+from stars import apply_star_delta, set_stars
+
+# Card effects resolved on the server, keyed by ItemCard.name.
+# Each handler mutates the class through an EffectContext and records the
+# random choices it made in ctx.outcome so the frontend can replay them.
+EFFECTS = {}
+# Cards that take effect the moment they are drawn and never reach the inventory
+DRAW_EFFECTS = set()
+
+
+def normalize_card_name(name):
+    # "Boss 挑战券" / "BOSS挑战券" / "皇城 PK" all resolve to the same handler
+    return (name or "").replace(" ", "").lower()
+
+
+def effect(*names, on_draw=False):
+    def register(fn):
+        for name in names:
+            EFFECTS[normalize_card_name(name)] = fn
+            if on_draw:
+                DRAW_EFFECTS.add(normalize_card_name(name))
+        return fn
+    return register
+
+
+def takes_effect_on_draw(card_name):
+    return normalize_card_name(card_name) in DRAW_EFFECTS
+
+
+class EffectContext:
+    def __init__(self, db, user, rng=random, card_id=None):
+        self.db = db
+        self.user = user
+        self.card_id = card_id
+        self.rng = rng
+        self.outcome = {}
+        self.changed = {}
+        self._roster = None
+
+    @property
+    def roster(self):
+        # Whole class, loaded once per card use
+        if self._roster is None:
+            self._roster = self.db.query(models.Student).filter(
+                models.Student.owner_id == self.user.owner_id
+            ).order_by(models.Student.id).all()
+        return self._roster
+
+    def others(self):
+        return [s for s in self.roster if s.id != self.user.id]
+
+    def touch(self, *students):
+        for s in students:
+            self.changed[s.id] = s
+
+    def add_stars(self, delta, dorm_number=None, student_ids=None):
+        self.touch(*apply_star_delta(
+            self.db, self.user.owner_id, delta, dorm_number, student_ids, reason="card", card_id=self.card_id
+        ))
+
+    def add_own_stars(self, delta):
+        self.add_stars(delta, student_ids=[self.user.id])
+
+
+# --- Self ---
+
+@effect("经验药水")
+def exp_potion(ctx):
+    ctx.add_own_stars(1)
+
+
+@effect("一夫当关", on_draw=True)
+def one_man_guard(ctx):
+    ctx.add_own_stars(-1)
+
+
+def immune_for(turns):
+    # Stamp for `turns` turns of immunity from the class's current turn
+    return models.owner_turn() + turns
+
+
+def grant_immunity(ctx, until, *conditions):
+    # populate_existing: loaded rows (ctx.user) must pick up the derived immunity too
+    stmt = update(models.Student).where(*conditions).values(immune_until_turn=until).returning(models.Student)
+    ctx.touch(*ctx.db.scalars(stmt, execution_options={"populate_existing": True}).all())
+
+
+@effect("潜行斗篷")
+def stealth_cloak(ctx):
+    grant_immunity(ctx, immune_for(3), models.Student.id == ctx.user.id)
+
+
+@effect("黑暗诅咒", on_draw=True)
+def dark_curse(ctx):
+    ctx.user.is_cursed = True
+    ctx.touch(ctx.user)
+
+
+@effect("净化术")
+def purification(ctx):
+    ctx.user.is_cursed = False
+    ctx.touch(ctx.user)
+    # A zero delta clamps negative stars back to 0 now that the curse is gone
+    ctx.add_own_stars(0)
+
+
+@effect("深渊凝视")
+def abyssal_gaze(ctx):
+    success = ctx.rng.random() < 0.3
+    ctx.outcome["success"] = success
+    if success:
+        ctx.add_own_stars(3)
+    else:
+        ctx.touch(*set_stars(ctx.db, ctx.user.owner_id, [ctx.user.id], 0, reason="card", card_id=ctx.card_id))
+
+
+@effect("命运轮盘")
+def destiny_roulette(ctx):
+    result = "angel" if ctx.rng.random() < 0.1 else "devil"
+    ctx.outcome["result"] = result
+    ctx.add_own_stars(10 if result == "angel" else -1)
+
+
+# --- Dorm / class wide ---
+
+@effect("军团荣耀")
+def legion_glory(ctx):
+    if ctx.user.dorm_number:
+        ctx.add_stars(1, dorm_number=ctx.user.dorm_number)
+
+
+@effect("群体沉默", on_draw=True)
+def mass_silence(ctx):
+    if ctx.user.dorm_number:
+        ctx.add_stars(-1, dorm_number=ctx.user.dorm_number)
+
+
+@effect("末日审判", on_draw=True)
+def doomsday(ctx):
+    ctx.add_stars(-1)
+
+
+@effect("普渡众生")
+def universal_salvation(ctx):
+    ctx.add_stars(1)
+
+
+@effect("结界：庇护所")
+def sanctuary(ctx):
+    if not ctx.user.dorm_number:
+        return
+    grant_immunity(
+        ctx, func.max(models.Student.immune_until_turn, immune_for(1)),
+        models.Student.owner_id == ctx.user.owner_id,
+        models.Student.dorm_number == ctx.user.dorm_number,
+    )
+
+
+# --- Random targets ---
+
+@effect("标记目标")
+def mark_target(ctx):
+    candidates = ctx.others()
+    ctx.outcome["target_id"] = ctx.rng.choice(candidates).id if candidates else None
+
+
+@effect("暗影突袭")
+def shadow_raid(ctx):
+    victim = ctx.rng.choice(ctx.roster)
+    ctx.outcome["target_id"] = victim.id
+    ctx.add_stars(-1, student_ids=[victim.id])
+
+
+@effect("狂战士试炼")
+def berserker_trial(ctx):
+    winner = ctx.rng.choice(ctx.roster)
+    ctx.outcome["target_id"] = winner.id
+    ctx.add_stars(1, student_ids=[winner.id])
+
+
+@effect("法力汲取")
+def mana_drain(ctx):
+    candidates = ctx.others()
+    if not candidates:
+        ctx.outcome.update(target_id=None, success=False)
+        return
+    target = ctx.rng.choice(candidates)
+    success = (target.stars or 0) >= 2
+    ctx.outcome.update(target_id=target.id, success=success)
+    if success:
+        ctx.add_stars(-2, student_ids=[target.id])
+        ctx.add_own_stars(2)
+    else:
+        ctx.add_own_stars(-1)
+
+
+@effect("皇城PK")
+def royal_pk(ctx):
+    candidates = ctx.others()
+    if not candidates:
+        ctx.outcome.update(opponent_id=None, winner_id=None)
+        return
+    opponent = ctx.rng.choice(candidates)
+    winner_id = ctx.user.id if (ctx.user.stars or 0) > (opponent.stars or 0) else None
+    ctx.outcome.update(opponent_id=opponent.id, winner_id=winner_id)
+    if winner_id:
+        ctx.add_own_stars(1)
+
+
+@effect("连锁闪电", on_draw=True)
+def chain_lightning(ctx):
+    # 50% hit on the user; each miss jumps to a new random classmate, max 3 jumps
+    pool = ctx.others()
+    target = ctx.user
+    path = []
+    while True:
+        hit = ctx.rng.random() < 0.5
+        path.append({"student_id": target.id, "status": "hit" if hit else "miss"})
+        if hit:
+            ctx.add_stars(-2, student_ids=[target.id])
+            break
+        if len(path) > 3 or not pool:
+            break
+        target = pool.pop(ctx.rng.randrange(len(pool)))
+    ctx.outcome["path"] = path
+
+
+def apply_card(db, card, user, rng=random):
+    """Run the effect registered for card against user's class.
+
+    Used cards and, for DRAW_EFFECTS, freshly drawn ones. Cards without a
+    server-side effect (绝对防御, 生命圣水, ...) are simply consumed.
+    Returns the EffectContext; the caller commits.
+    """
+    ctx = EffectContext(db, user, rng, card_id=card.id)
+    handler = EFFECTS.get(normalize_card_name(card.name))
+    if handler is not None:
+        handler(ctx)
+    return ctx
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import threading
+
+# Events a subscriber may fall behind by before its backlog is dropped
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "64"))
+
+
+def format_event(event):
+    # Server-Sent Events frame; the class version doubles as the event id
+    return f"id: {event['version']}\ndata: {json.dumps(event, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    """One open event stream. Its queue is only touched on its own event loop."""
+
+    def __init__(self, owner_id, loop, maxsize):
+        self.owner_id = owner_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.resyncs = 0
+
+    def _deliver(self, frame, resync_frame):
+        if self.queue.full():
+            # Slow client: drop what it hasn't read and have it refetch instead
+            self.resyncs += 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            frame = resync_frame
+        self.queue.put_nowait(frame)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class EventHub:
+    """In-process pub/sub of class change events.
+
+    publish() is called from the threadpool handlers after their commit and
+    hands each subscriber the pre-formatted frame via call_soon_threadsafe.
+    A None frame tells a stream to end.
+    """
+
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self.published = 0
+
+    def subscribe(self, owner_id):
+        # Must be called on the event loop that will read the subscription
+        sub = Subscription(owner_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(owner_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.owner_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.owner_id]
+
+    def publish(self, owner_id, event):
+        with self._lock:
+            subs = list(self._subscribers.get(owner_id, ()))
+            self.published += 1
+        if not subs:
+            return
+        frame = format_event(event)
+        resync_frame = format_event({"type": "resync", "version": event["version"]})
+        self._send(subs, frame, resync_frame)
+
+    def close(self):
+        with self._lock:
+            subs = [sub for group in self._subscribers.values() for sub in group]
+        self._send(subs, None, None)
+
+    def _send(self, subs, frame, resync_frame):
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._deliver, frame, resync_frame)
+            except RuntimeError:
+                # Loop already closed; the stream is gone
+                self.unsubscribe(sub)
+
+    def stats(self):
+        with self._lock:
+            subs = [sub for group in self._subscribers.values() for sub in group]
+            return {
+                "classes": len(self._subscribers),
+                "subscribers": len(subs),
+                "published": self.published,
+                "resyncs": sum(sub.resyncs for sub in subs),
+                "queue_size": self.queue_size,
+            }
+
+
+events = EventHub()
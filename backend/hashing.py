@@ -0,0 +1,108 @@
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# pbkdf2_sha256 cost. Stored hashes with a different round count are
+# re-hashed transparently on the next successful login.
+HASH_ROUNDS = int(os.environ.get("HASH_ROUNDS", "29000"))
+# Worker processes for hashing; 0 runs hashes inline in the calling thread
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Requests allowed to wait for a worker before logins are refused with 503
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", "64"))
+
+
+@functools.lru_cache(maxsize=None)
+def get_pwd_context():
+    # passlib is imported on first hash, not at startup
+    from passlib.context import CryptContext
+    return CryptContext(
+        schemes=["pbkdf2_sha256"],
+        deprecated="auto",
+        pbkdf2_sha256__default_rounds=HASH_ROUNDS,
+        pbkdf2_sha256__min_rounds=HASH_ROUNDS,
+        pbkdf2_sha256__max_rounds=HASH_ROUNDS,
+    )
+
+
+# Worker entry points (module level so they pickle)
+def _hash(password):
+    return get_pwd_context().hash(password)
+
+
+def _verify_and_update(password, hashed_password):
+    return get_pwd_context().verify_and_update(password, hashed_password)
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+class HashPool:
+    """Runs password hashing in a process pool with a bounded queue."""
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashPoolBusy()
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+            if self.workers > 0 and self._executor is None:
+                # spawn, not Linux's default fork: forking the threaded server can copy
+                # a lock held by another thread into the child, locked forever
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+        start = time.perf_counter()
+        try:
+            if self.workers > 0:
+                return self._executor.submit(fn, *args).result()
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+                self.total_seconds += time.perf_counter() - start
+
+    def hash(self, password):
+        return self._submit(_hash, password)
+
+    def verify_and_update(self, password, hashed_password):
+        """Returns (valid, new_hash); new_hash is set when the stored cost is outdated."""
+        return self._submit(_verify_and_update, password, hashed_password)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "rounds": HASH_ROUNDS,
+                "pending": self.pending,
+                "peak_pending": self.peak_pending,
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_ms": round(self.total_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+passwords = HashPool(HASH_WORKERS, HASH_MAX_PENDING)
@@ -0,0 +1,81 @@
+from sqlalchemy import update, delete, select, literal
+from sqlalchemy.dialects.sqlite import insert
+
+import models
+
+# Inventory is stored as one stack per (student, card) with a quantity, so
+# student_items grows with distinct cards rather than with total draws. All
+# quantity changes go through this module.
+
+
+def _stacked(stmt):
+    # Copies of a card the student already holds go onto the existing stack
+    return stmt.on_conflict_do_update(
+        index_elements=[models.StudentItem.student_id, models.StudentItem.item_card_id],
+        set_={"quantity": models.StudentItem.quantity + stmt.excluded.quantity},
+    )
+
+
+def add_copy(db, owner_id, student_id, card_id):
+    """Add one copy for a student of owner_id's class. False if there is no such student."""
+    # The ownership check rides along in the same statement
+    stmt = insert(models.StudentItem).from_select(
+        ["student_id", "item_card_id", "quantity"],
+        select(models.Student.id, literal(card_id), literal(1)).where(
+            models.Student.id == student_id, models.Student.owner_id == owner_id
+        ),
+    )
+    return db.execute(_stacked(stmt)).rowcount > 0
+
+
+def add_copies(db, counts):
+    """Add {(student_id, card_id): quantity} in one executemany; ownership is the caller's job."""
+    rows = [
+        {"student_id": sid, "item_card_id": card_id, "quantity": quantity}
+        for (sid, card_id), quantity in counts.items()
+    ]
+    if rows:
+        db.execute(_stacked(insert(models.StudentItem)), rows)
+
+
+def merge_card(db, from_card_id, into_card_id):
+    """Move every stack of from_card_id onto into_card_id, adding up quantities."""
+    stmt = insert(models.StudentItem).from_select(
+        ["student_id", "item_card_id", "quantity"],
+        select(models.StudentItem.student_id, literal(into_card_id), models.StudentItem.quantity)
+        .where(models.StudentItem.item_card_id == from_card_id)
+        # SQLite needs a WHERE on INSERT ... SELECT ... ON CONFLICT to parse the upsert
+        .where(True),
+    )
+    db.execute(_stacked(stmt))
+    db.execute(
+        delete(models.StudentItem)
+        .where(models.StudentItem.item_card_id == from_card_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def take_copy(db, item_id):
+    """Remove one copy from a stack, dropping the row at zero. False if none was left.
+
+    The decrement takes the SQLite write lock, so of two concurrent uses of a
+    last copy the second blocks here and then finds nothing to take.
+    """
+    taken = db.execute(
+        update(models.StudentItem)
+        .where(models.StudentItem.id == item_id, models.StudentItem.quantity > 0)
+        .values(quantity=models.StudentItem.quantity - 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if taken:
+        db.execute(
+            delete(models.StudentItem)
+            .where(models.StudentItem.id == item_id, models.StudentItem.quantity <= 0)
+            .execution_options(synchronize_session=False)
+        )
+    return taken > 0
+
+
+def expand(stacks):
+    # One entry per copy, for responses that predate stacking; copies share the stack id
+    return [stack for stack in stacks for _ in range(stack.quantity)]
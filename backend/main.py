@@ -1,65 +1,63 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.orm import Session, joinedload, contains_eager
 from typing import List
 import models, schemas
-from database import SessionLocal, engine
-import pandas as pd
-import io
+from database import SessionLocal, ReadSessionLocal, engine, read_engine
+from sampler import samplers
+from auth_cache import principals, Principal, stream_tickets
+from hashing import passwords, HashPoolBusy
+from card_pool import card_pools, normalize_pool_type
+from stars import apply_star_delta, set_stars, take_star_snapshots, verify_stars
+from versions import versions, etag_matches
+from events import events, format_event
+from metrics import metrics, MetricsMiddleware, instrument_engine, METRICS_ADMIN_ONLY
+import profiling
+from roster_import import iter_roster, sync_roster
+from migrations import run_migrations
+from catalog import sync_card_catalog
+import effects
+import card_images
+import spa
+import inventory
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-import random
 import os
 import sys
-from sqlalchemy import text # Import text for raw sql
+import asyncio
+import anyio
+from collections import Counter
+from sqlalchemy import text, func, update # Import text for raw sql
+import sqlalchemy.exc
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 from starlette import status
+from contextlib import asynccontextmanager
 
-models.Base.metadata.create_all(bind=engine)
-
-# Helper to ensure column exists (Migration hack for SQLite)
-def check_db_schema():
+def sync_catalog():
+    # Card pool comes from files/抽卡定义说明.json; reconciled in a constant number of statements
     db = SessionLocal()
     try:
-        # Check if immunity column exists by trying to select it
-        try:
-            db.execute(text("SELECT immunity FROM students LIMIT 1"))
-        except Exception:
-            print("adding immunity column...")
-            db.execute(text("ALTER TABLE students ADD COLUMN immunity INTEGER DEFAULT 0"))
-            db.commit()
-
-        # Check is_cursed column
-        try:
-            db.execute(text("SELECT is_cursed FROM students LIMIT 1"))
-        except Exception:
-            print("adding is_cursed column...")
-            db.execute(text("ALTER TABLE students ADD COLUMN is_cursed BOOLEAN DEFAULT 0"))
-            db.execute(text("ALTER TABLE students ADD COLUMN is_cursed BOOLEAN DEFAULT 0"))
-            db.commit()
-
-        # Check item_cards columns
-        try:
-            db.execute(text("SELECT do_type FROM item_cards LIMIT 1"))
-        except Exception:
-            print("adding do_type and probability columns...")
-            db.execute(text("ALTER TABLE item_cards ADD COLUMN do_type INTEGER DEFAULT 1"))
-            db.execute(text("ALTER TABLE item_cards ADD COLUMN probability FLOAT DEFAULT 1.0"))
-            db.commit()
+        inserted, updated = sync_card_catalog(db)
+        db.commit()
+        card_pools.invalidate()
+        if inserted or updated:
+            print(f"Synced card catalog ({inserted} added, {updated} updated)")
+    except Exception as e:
+        print(f"Failed to sync card catalog: {e}")
+    finally:
+        db.close()
 
-        # Check owner_id column in students
-        try:
-            db.execute(text("SELECT owner_id FROM students LIMIT 1"))
-        except Exception:
-            print("adding owner_id column to students...")
-            db.execute(text("ALTER TABLE students ADD COLUMN owner_id INTEGER"))
-            db.commit()
 
+def snapshot_stars():
+    # Fold the star ledger into per-student snapshots once per launch,
+    # so recomputing totals only ever reads events since the last start
+    db = SessionLocal()
+    try:
+        take_star_snapshots(db)
+        db.commit()
     except Exception as e:
-        print(f"Schema check error: {e}")
+        print(f"Failed to snapshot star ledger: {e}")
     finally:
         db.close()
 
@@ -70,7 +68,7 @@ def seed_admin_user():
     try:
         admin = db.query(models.User).filter(models.User.username == "admin").first()
         if not admin:
-            hashed_pwd = pwd_context.hash("admin")
+            hashed_pwd = get_password_hash("admin")
             admin_user = models.User(username="admin", hashed_password=hashed_pwd, is_admin=True)
             db.add(admin_user)
             db.commit()
@@ -81,21 +79,36 @@ def seed_admin_user():
     finally:
         db.close()
 
-check_db_schema()
+def startup():
+    # Schema, card catalog and admin account; one pass per process start
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    sync_catalog()
+    card_images.prepare(get_frontend_path())
+    if frontend is not None:
+        frontend.load()
+    snapshot_stars()
+    seed_admin_user()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Runs in the serving process only, not on import (hashing workers re-import this module)
+    startup()
+    yield
+    events.close()
+    passwords.shutdown()
 
 # Auth Config
 SECRET_KEY = "your-secret-key-super-secret"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 30 # 30 Days
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    # Runs in the hashing process pool (see hashing.py)
+    return passwords.hash(password)
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -104,22 +117,45 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def get_db():
+    # Write session: all writes share database.engine's single connection
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_read_db():
+    # Read-only session from the reader pool (GET endpoints, auth lookups)
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
+    return principal_for_token(token, db)
+
+def get_stream_user(ticket: str):
+    # EventSource can't send headers, so event streams pass a one-time ticket
+    # from POST /events/ticket in the query; the bearer token stays out of URLs and logs
+    principal = stream_tickets.redeem(ticket)
+    if principal is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired stream ticket")
+    return principal
+
+def principal_for_token(token: str, db: Session):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # jose is imported on first use to keep it out of cold start
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -128,24 +164,88 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
+    # Common path: principal cached by token subject, no DB work
+    principal = principals.get(token_data.username)
+    if principal is not None:
+        return principal
     user = db.query(models.User).filter(models.User.username == token_data.username).first()
     if user is None:
         raise credentials_exception
-    return user
+    principal = Principal.from_user(user)
+    principals.put(token_data.username, principal)
+    return principal
 
-app = FastAPI()
+def is_admin_token(token: str):
+    # Gate for request profiling; runs outside any route, so it opens its own session
+    db = ReadSessionLocal()
+    try:
+        return principal_for_token(token, db).is_admin
+    except HTTPException:
+        return False
+    finally:
+        db.close()
 
-seed_admin_user()
+def not_modified(request: Request, response: Response, etag: str):
+    # Conditional GET: a bare 304 when the client already holds this version,
+    # otherwise tag the 200. no-cache makes browsers revalidate every time.
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def commit_with_sampler(db: Session, owner_id: int, sync):
+    # sync() updates the class's cached sampler before the commit, while this
+    # transaction still holds the single writer connection, so sampler updates
+    # land in commit order. After the commit, a draw_student could already have
+    # committed and applied a newer row that this one would overwrite.
+    # A failed commit drops the sampler; the next draw rebuilds it from the database.
+    try:
+        sync()
+        db.commit()
+    except Exception:
+        samplers.invalidate(owner_id)
+        raise
+
+def class_changed(owner_id: int, event_type: str, **data):
+    # Call after commit: new ETag version for readers, and a diff for open event streams
+    version = versions.bump(owner_id)
+    events.publish(owner_id, {"type": event_type, "version": version, **data})
+
+# Handlers that touch the DB (or hash passwords) are plain `def` so Starlette
+# runs them in its threadpool. Sync SQLAlchemy calls inside an `async def`
+# block the event loop, and can deadlock it when the connection pool is empty.
+app = FastAPI(lifespan=lifespan)
+# Every route's endpoint is wrapped so admin-flagged requests can be profiled (see profiling.py)
+app.router.route_class = profiling.ProfiledRoute
+
+@app.exception_handler(HashPoolBusy)
+async def hash_pool_busy_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": "Server busy, please retry"}, headers={"Retry-After": "1"})
+
+@app.exception_handler(sqlalchemy.exc.TimeoutError)
+async def writer_busy_handler(request, exc):
+    # The writer queue is longer than DB_WRITE_TIMEOUT (see database.py)
+    return JSONResponse(status_code=503, content={"detail": "Server busy, please retry"}, headers={"Retry-After": "1"})
 
 @app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_read_db)):
     user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = passwords.verify_and_update(form_data.password, user.hashed_password) if user else (False, None)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash uses an outdated cost (HASH_ROUNDS changed): upgrade it now
+        write_db = SessionLocal()
+        try:
+            write_db.query(models.User).filter(models.User.id == user.id).update({"hashed_password": new_hash})
+            write_db.commit()
+        finally:
+            write_db.close()
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -155,15 +255,15 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 @app.post("/users", response_model=schemas.Token)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     # Register endpoint
+    # Hash before the first query: the session holds the single writer connection from then on
+    hashed_password = get_password_hash(user.password)
     db_user = db.query(models.User).filter(models.User.username == user.username).first()
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    
-    hashed_password = get_password_hash(user.password)
+
     db_user = models.User(username=user.username, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
-    db.refresh(db_user)
     
     # Auto login
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -177,22 +277,27 @@ async def read_users_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
 @app.delete("/users/me")
-async def delete_me(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_me(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Can delete own account
     if current_user.is_admin:
         raise HTTPException(status_code=400, detail="Admin cannot be deleted this way")
-    db.delete(current_user)
+    # current_user is a cached Principal; delete through the writer
+    user_id = current_user.id
+    db.delete(db.get(models.User, user_id))
     db.commit()
+    principals.invalidate(current_user.username)
+    samplers.invalidate(user_id)
+    class_changed(user_id, "resync")
     return {"message": "Account deleted"}
 
 @app.get("/admin/users", response_model=List[schemas.User])
-async def read_all_users(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def read_all_users(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_read_db)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     return db.query(models.User).all()
 
 @app.delete("/admin/users/{user_id}")
-async def delete_user_by_admin(user_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_user_by_admin(user_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
@@ -202,16 +307,112 @@ async def delete_user_by_admin(user_id: int, current_user: models.User = Depends
     if user_to_delete.username == "admin":
          raise HTTPException(status_code=400, detail="Cannot delete super admin")
          
+    username = user_to_delete.username
     db.delete(user_to_delete)
     db.commit()
+    principals.invalidate(username)
+    samplers.invalidate(user_id)
+    class_changed(user_id, "resync")
     return {"message": "User deleted"}
 
+@app.get("/admin/hash_pool")
+def read_hash_pool_stats(current_user: models.User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return passwords.stats()
+
+@app.get("/admin/event_hub")
+def read_event_hub_stats(current_user: models.User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return events.stats()
+
+def metrics_access(token: str | None = Depends(optional_oauth2_scheme), db: Session = Depends(get_read_db)):
+    # Open unless METRICS_ADMIN_ONLY=1 (see metrics.py)
+    if not METRICS_ADMIN_ONLY:
+        return
+    if token is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    if not principal_for_token(token, db).is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(metrics_access)])
+async def read_metrics():
+    # async: the threadpool limiter can only be read from the event loop
+    pool = anyio.to_thread.current_default_thread_limiter().statistics()
+    hub, auth, hashes = events.stats(), principals.stats(), passwords.stats()
+    extra = [
+        ("gacha_threadpool_threads", "gauge", "Worker threads in use / allowed",
+         {(("state", "busy"),): pool.borrowed_tokens, (("state", "limit"),): pool.total_tokens}),
+        ("gacha_threadpool_queue_depth", "gauge", "Sync handlers waiting for a worker thread", {(): pool.tasks_waiting}),
+        ("gacha_db_connections_checked_out", "gauge", "Pooled SQLite connections in use",
+         {(("pool", "write"),): engine.pool.checkedout(), (("pool", "read"),): read_engine.pool.checkedout()}),
+        ("gacha_event_subscribers", "gauge", "Open class event streams", {(): hub["subscribers"]}),
+        ("gacha_events_published_total", "counter", "Class change events published", {(): hub["published"]}),
+        ("gacha_event_resyncs_total", "counter", "Resyncs sent to slow event streams", {(): hub["resyncs"]}),
+        ("gacha_auth_cache_entries", "gauge", "Cached token principals", {(): auth["size"]}),
+        ("gacha_auth_cache_lookups_total", "counter", "Token principal lookups",
+         {(("result", "hit"),): auth["hits"], (("result", "miss"),): auth["misses"]}),
+        ("gacha_hash_pool_pending", "gauge", "Password hashes queued or running", {(): hashes["pending"]}),
+        ("gacha_hash_pool_completed_total", "counter", "Password hashes completed", {(): hashes["completed"]}),
+        ("gacha_hash_pool_rejected_total", "counter", "Password hashes rejected as busy", {(): hashes["rejected"]}),
+    ]
+    return Response(metrics.render(extra), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/admin/profiles")
+def list_profiles(current_user: models.User = Depends(get_current_user)):
+    # Requests sent with `X-Profile: 1` or `?profile=1` by an admin
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return profiling.reports.list_profiles()
+
+@app.get("/admin/profiles/{profile_id}")
+def download_profile(profile_id: str, format: str = "json", current_user: models.User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    report = profiling.reports.get_profile(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        # One "frame;frame;frame count" line per stack, for flamegraph.pl / speedscope
+        body = "".join(f"{s['stack']} {s['samples']}\n" for s in report["stacks"])
+        return Response(body, media_type="text/plain; charset=utf-8",
+                        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.txt"'})
+    return JSONResponse(report, headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.json"'})
+
+@app.get("/admin/slow_requests")
+def list_slow_requests(current_user: models.User = Depends(get_current_user)):
+    # Requests slower than SLOW_REQUEST_MS, newest first
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return profiling.reports.list_slow()
+
+@app.get("/admin/star_ledger")
+def verify_star_ledger(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    # Materialized Student.stars vs snapshot + ledger; should always be empty
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    mismatches = verify_stars(db)
+    return {"mismatches": [{"student_id": sid, "stars": stars, "ledger": ledger} for sid, stars, ledger in mismatches]}
+
+@app.get("/admin/auth_cache")
+def read_auth_cache_stats(current_user: models.User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return principals.stats()
+
 # --- Helpers ---
 def get_frontend_path():
     if getattr(sys, 'frozen', False):
         return os.path.join(sys._MEIPASS, "static")
     return "static"
 
+def get_spa_path():
+    # Vite build output; build_exe.py bundles it as "dist"
+    if getattr(sys, 'frozen', False):
+        return os.path.join(sys._MEIPASS, "dist")
+    return os.environ.get("FRONTEND_DIST", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "dist"))
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -219,7 +420,17 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
+# Inside the metrics middleware, whose per-request SQL counts the slow log reports
+app.add_middleware(profiling.ProfilingMiddleware, authorize=is_admin_token)
+# Outermost, so it times everything including CORS handling
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+instrument_engine(engine, metrics)
+instrument_engine(read_engine, metrics)
+profiling.instrument_engine(engine)
+profiling.instrument_engine(read_engine)
+
+# Content-hashed card art variants (see card_images.py); before /static, which would shadow it
+app.mount("/static/cards", card_images.ImmutableStaticFiles(directory=os.path.join(get_frontend_path(), "cards"), check_dir=False), name="card_images")
 # Mount static files for images
 # Mount static files for images
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -228,45 +439,133 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # --- Students ---
 @app.get("/students", response_model=List[schemas.Student])
-def read_students(skip: int = 0, limit: int = 1000, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    students = db.query(models.Student).filter(models.Student.owner_id == current_user.id).all()
+def read_students(request: Request, response: Response, skip: int = 0, limit: int = 1000, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_user)):
+    cached = not_modified(request, response, versions.etag("students", current_user.id, versions.get(current_user.id), skip, limit))
+    if cached is not None:
+        return cached
+    students = db.query(models.Student).filter(models.Student.owner_id == current_user.id).order_by(models.Student.id).offset(skip).limit(limit).all()
     return students
 
+@app.get("/students/changes", response_model=schemas.StudentChanges)
+def read_student_changes(since: int = 0, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_user)):
+    # Delta sync: rows stamped after `since` plus tombstones (see migrations.change_tracking).
+    # The cursor is read first, so anything committed meanwhile is sent again next time
+    # rather than skipped; applying a change twice is harmless.
+    cursor = db.execute(text("SELECT seq FROM sync_seq WHERE id = 1")).scalar() or 0
+    turn = db.query(models.User.current_turn).filter(models.User.id == current_user.id).scalar() or 0
+    reset = since > cursor
+    if reset:
+        since = 0
+    students = db.query(models.Student).filter(
+        models.Student.owner_id == current_user.id, models.Student.updated_seq > since
+    ).all()
+    items = db.query(models.StudentItem).join(models.Student).options(joinedload(models.StudentItem.item_card)).filter(
+        models.Student.owner_id == current_user.id, models.StudentItem.updated_seq > since
+    ).all()
+    removed = {"student": [], "item": []}
+    if not reset:
+        rows = db.execute(
+            text("SELECT kind, row_id FROM sync_tombstones WHERE owner_id = :uid AND seq > :since"),
+            {"uid": current_user.id, "since": since},
+        )
+        for kind, row_id in rows:
+            removed[kind].append(row_id)
+    return {
+        "cursor": cursor,
+        "reset": reset,
+        "turn": turn,
+        "students": students,
+        "removed_students": removed["student"],
+        "items": items,
+        "removed_items": removed["item"],
+    }
+
 @app.put("/students/{student_id}/immunity")
 def update_student_immunity(student_id: int, immunity: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     student = db.query(models.Student).filter(models.Student.id == student_id, models.Student.owner_id == current_user.id).first()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
-    student.immunity = immunity
-    db.commit()
+    student.immune_until_turn = models.owner_turn() + immunity
+    # Serialize before commit: a refresh afterwards would check the writer out again
+    db.flush()
     db.refresh(student)
-    return student
+    result = schemas.Student.model_validate(student)
+    commit_with_sampler(db, current_user.id, lambda: samplers.update_many(current_user.id, [result]))
+    class_changed(current_user.id, "students_updated", students=[result.model_dump()])
+    return result
 
 @app.post("/advance_turn")
 def advance_turn(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    # Decrement immunity for all students of current user where immunity > 0
-    # SQLite doesn't support JOIN in UPDATE easily for some versions, but we can do:
-    # UPDATE students SET immunity = immunity - 1 WHERE owner_id = :uid AND immunity > 0
-    db.execute(text("UPDATE students SET immunity = immunity - 1 WHERE owner_id = :uid AND immunity > 0"), {"uid": current_user.id})
-    db.commit()
+    # One counter per class; every student's immunity is derived from it
+    # (Student.immune_until_turn), so no student rows are rewritten.
+    turn = db.execute(
+        update(models.User).where(models.User.id == current_user.id)
+        .values(current_turn=models.User.current_turn + 1).returning(models.User.current_turn)
+    ).scalar_one()
+    commit_with_sampler(db, current_user.id, lambda: samplers.advance(current_user.id, turn))
+    class_changed(current_user.id, "turn_advanced", turn=turn)
     return {"message": "Turn advanced"}
 
+@app.patch("/students/bulk", response_model=List[schemas.Student])
+def bulk_star_change(change: schemas.StarDelta, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # Class-wide card effects (Doomsday, Legion Glory, ...) in one set-based UPDATE.
+    # Stars clamp at 0 unless the student is cursed.
+    students = apply_star_delta(db, current_user.id, change.delta, change.dorm_number, change.student_ids, reason=change.reason)
+    # Serialize before commit so the rows aren't reloaded one by one afterwards
+    result = [schemas.Student.model_validate(s) for s in students]
+    commit_with_sampler(db, current_user.id, lambda: samplers.update_many(current_user.id, result))
+    class_changed(current_user.id, "students_updated", students=[s.model_dump() for s in result])
+    return result
+
+@app.post("/draw_student", response_model=schemas.Student)
+def draw_student(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # Server-side roll call: pick by weight and bump pick_count in one transaction.
+    # The per-class lock keeps two teacher tabs from drawing against a stale sampler.
+    # Writer connection first, then the lock: every other sampler update runs
+    # inside commit_with_sampler, holding the writer, so the reverse order deadlocks.
+    db.connection()
+    with samplers.lock_for(current_user.id):
+        student_id = samplers.get(db, current_user.id).draw()
+        if student_id is None:
+            raise HTTPException(status_code=404, detail="No eligible students")
+
+        student = db.query(models.Student).filter(models.Student.id == student_id, models.Student.owner_id == current_user.id).first()
+        if not student:
+            samplers.invalidate(current_user.id)
+            raise HTTPException(status_code=409, detail="Roster changed, please retry")
+
+        student.pick_count = models.Student.pick_count + 1
+        db.flush()
+        db.refresh(student)
+        result = schemas.Student.model_validate(student)
+        commit_with_sampler(db, current_user.id, lambda: samplers.update_many(current_user.id, [result]))
+        class_changed(current_user.id, "student_drawn", students=[result.model_dump()])
+    return result
+
 @app.put("/students/{student_id}", response_model=schemas.Student)
-def update_student(student_id: int, student: schemas.StudentCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def update_student(student_id: int, student: schemas.StudentUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     db_student = db.query(models.Student).filter(models.Student.id == student_id, models.Student.owner_id == current_user.id).first()
     if not db_student:
         raise HTTPException(status_code=404, detail="Student not found")
-    
-    db_student.stars = student.stars
-    db_student.pick_count = student.pick_count
-    db_student.name = student.name
-    db_student.dorm_number = student.dorm_number
-    db_student.immunity = student.immunity
-    db_student.is_cursed = student.is_cursed
-    
-    db.commit()
+
+    # Only the fields sent are written; stars go through the ledger.
+    # Relative changes should use PATCH /students/bulk so concurrent ones add up.
+    fields = student.model_dump(exclude_unset=True)
+    stars = fields.pop("stars", None)
+    immunity = fields.pop("immunity", None)
+    for field, value in fields.items():
+        setattr(db_student, field, value)
+    if immunity is not None:
+        db_student.immune_until_turn = models.owner_turn() + immunity
+    if stars is not None:
+        set_stars(db, current_user.id, [student_id], stars, reason="set")
+
+    db.flush()
     db.refresh(db_student)
-    return db_student
+    result = schemas.Student.model_validate(db_student)
+    commit_with_sampler(db, current_user.id, lambda: samplers.update_many(current_user.id, [result]))
+    class_changed(current_user.id, "students_updated", students=[result.model_dump()])
+    return result
 
 @app.delete("/students/{student_id}")
 def delete_student(student_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
@@ -275,140 +574,229 @@ def delete_student(student_id: int, db: Session = Depends(get_db), current_user:
         raise HTTPException(status_code=404, detail="Student not found")
     
     db.delete(db_student)
-    db.commit()
+    commit_with_sampler(db, current_user.id, lambda: samplers.remove(current_user.id, student_id))
+    class_changed(current_user.id, "students_removed", student_ids=[student_id])
     return {"message": "Student deleted successfully"}
 
 @app.post("/import_excel")
-async def import_excel(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    if not file.filename.endswith(('.xls', '.xlsx')):
-         raise HTTPException(status_code=400, detail="Invalid file format. Please upload an Excel file.")
+def import_excel(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    if not file.filename.lower().endswith(('.xls', '.xlsx', '.csv')):
+         raise HTTPException(status_code=400, detail="Invalid file format. Please upload an Excel or CSV file.")
 
-    contents = await file.read()
-    
     try:
-        df = pd.read_excel(io.BytesIO(contents), header=None)
-        
-        start_row = 0
-        if not df.empty:
-            first_cell = str(df.iloc[0, 0])
-            if "Name" in first_cell or "姓名" in first_cell:
-                start_row = 1
-        
-        # Delete only CURRENT USER's students
-        # db.query(models.Student).filter(models.Student.owner_id == current_user.id).delete()
-        # Cascade delete of items handles StudentItem, but to be sure/safe or if cascade not set on DB level (it is in model):
-        # We rely on SQLAlchemy logic. But `delete()` query sometimes skips ORM hooks.
-        # But we added `cascade="all, delete-orphan"` to relationship.
-        # However, for bulk delete `db.query().delete()`, we need `synchronize_session=False`.
-        # AND manually delete related items if no DB FK constraint with cascade.
-        # We'll trust SQLite FKs are NOT enabled by default usually, so we should delete manually or iterate.
-        # Iterating is safer for small classes.
-        
-        # Re-approach: first select invalid IDs? Hard.
-        # Let's delete manually to be safe.
-        # items_to_delete = db.query(models.StudentItem).join(models.Student).filter(models.Student.owner_id == current_user.id).delete(synchronize_session=False)
-        # ^ This JOIN delete support varies in SQLite.
-        
-        # Simple approach for now:
-        existing_students = db.query(models.Student).filter(models.Student.owner_id == current_user.id).all()
-        for s in existing_students:
-            db.delete(s) # This triggers cascade
-        
-        count = 0
-        for index, row in df.iloc[start_row:].iterrows():
-            if len(row) < 1:
-                continue
-            
-            name = str(row[0]).strip()
-            if not name or name == 'nan':
-                 continue
-            
-            dorm = None
-            if len(row) > 1:
-                 dorm = str(row[1]).strip()
-                 if dorm == 'nan': dorm = None
-            
-            db_student = models.Student(
-                name=name,
-                dorm_number=dorm,
-                stars=0, # Reset stars
-                owner_id=current_user.id # Assign owner
-            )
-            db.add(db_student)
-            count += 1
-            
+        # Streams the spooled upload; existing students matched by (name, dorm) keep stars and items
+        counts = sync_roster(db, current_user.id, iter_roster(file.filename, file.file))
         db.commit()
-        return {"message": f"Successfully imported {count} students"}
     except Exception as e:
+        db.rollback()
         print(f"Import Error: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
+    samplers.invalidate(current_user.id)
+    class_changed(current_user.id, "resync")
+    return {
+        "message": f"Successfully imported {counts['count']} students "
+                   f"({counts['inserted']} new, {counts['updated']} kept, {counts['removed']} removed)",
+        **counts,
+    }
+
+# --- Star ledger ---
+def utc_naive(value: datetime):
+    # Ledger timestamps are naive UTC
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+@app.get("/stars/summary", response_model=List[schemas.StarTotal])
+def star_summary(by: str = "dorm", since: datetime | None = None, until: datetime | None = None, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_user)):
+    # Stars gained per dorm (or student) in [since, until): a range scan on
+    # star_events (owner_id, created_at). Defaults to the last 7 days.
+    if by not in ("dorm", "student"):
+        raise HTTPException(status_code=400, detail="by must be 'dorm' or 'student'")
+    since = utc_naive(since) if since else utc_naive(datetime.now(timezone.utc) - timedelta(days=7))
+    field = "dorm_number" if by == "dorm" else "student_id"
+    key = getattr(models.StarEvent, field)
+    query = db.query(key, func.sum(models.StarEvent.delta), func.count()).filter(
+        models.StarEvent.owner_id == current_user.id, models.StarEvent.created_at >= since
+    )
+    if until:
+        query = query.filter(models.StarEvent.created_at < utc_naive(until))
+    return [{field: k, "stars": stars, "events": events} for k, stars, events in query.group_by(key)]
+
+@app.get("/students/{student_id}/star_events", response_model=List[schemas.StarEvent])
+def read_star_events(student_id: int, limit: int = 50, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_user)):
+    # Most recent first; owner_id in the filter is the ownership check
+    return db.query(models.StarEvent).filter(
+        models.StarEvent.owner_id == current_user.id, models.StarEvent.student_id == student_id
+    ).order_by(models.StarEvent.id.desc()).limit(limit).all()
+
+# --- Live class events ---
+EVENT_HEARTBEAT_SECONDS = 15
+
+@app.post("/events/ticket")
+def create_stream_ticket(current_user: models.User = Depends(get_current_user)):
+    # Single use: a reconnecting client asks for a new one
+    return {"ticket": stream_tickets.issue(current_user), "expires_in": stream_tickets.ttl}
+
+@app.get("/events")
+async def class_events(current_user: models.User = Depends(get_stream_user)):
+    # Server-Sent Events: compact diffs of every committed change to this class.
+    # Starts with a resync so a (re)connecting client refetches once, cheaply via ETag.
+    subscription = events.subscribe(current_user.id)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n" + format_resync(current_user.id)
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscription.get(), EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            events.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def format_resync(owner_id):
+    return format_event({"type": "resync", "version": versions.get(owner_id)})
+
 # --- Items ---
 
 @app.get("/items", response_model=List[schemas.ItemCard])
-def read_items(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_items(request: Request, response: Response, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    # The card catalog is shared by every class; its version is the pool generation
+    cached = not_modified(request, response, versions.etag("items", card_pools.generation, skip, limit))
+    if cached is not None:
+        return cached
     items = db.query(models.ItemCard).offset(skip).limit(limit).all()
     return items
 
-@app.post("/students/{student_id}/draw_item", response_model=schemas.ItemCard)
-def draw_item_for_student(student_id: int, pool_type: str = "normal", db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    # Verify student exists and belongs to current user
-    student = db.query(models.Student).filter(models.Student.id == student_id, models.Student.owner_id == current_user.id).first()
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
+def apply_drawn_card(db, card_id, student):
+    # Flushed and serialized per card, so each effect reports the state it left behind
+    card = db.get(models.ItemCard, card_id)
+    ctx = effects.apply_card(db, card, student)
+    db.flush()
+    return schemas.CardEffect(
+        student_id=student.id,
+        card=schemas.ItemCard.model_validate(card),
+        outcome=ctx.outcome,
+        students=[schemas.Student.model_validate(s) for s in ctx.changed.values()],
+    )
 
-    # Get all item cards
-    items = db.query(models.ItemCard).all()
-    if not items:
+@app.post("/students/{student_id}/draw_item", response_model=schemas.DrawnCard)
+def draw_item_for_student(student_id: int, pool_type: str = "normal", db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # Weighted draw against the compiled pool (see card_pool.py)
+    pool = card_pools.get(db, pool_type)
+    if pool is None:
         raise HTTPException(status_code=404, detail="No items available in card pool")
 
-    # Filter by pool type
-    # Filter by pool type and do_type
-    filtered_items = []
-    if pool_type == "negative":
-        # Negative cards (do_type = 0)
-        filtered_items = [i for i in items if i.do_type == 0]
-        # Fallback to name-based if do_type not set or empty (migration safety)
-        if not filtered_items:
-             neg_names = ["群体沉默", "末日审判", "黑暗诅咒", "一夫当关"]
-             filtered_items = [i for i in items if i.name in neg_names]
-    else:
-        # Normal pool (do_type = 1)
-        filtered_items = [i for i in items if i.do_type == 1]
-        # Fallback
-        if not filtered_items:
-             neg_names = ["群体沉默", "末日审判", "黑暗诅咒", "一夫当关"]
-             filtered_items = [i for i in items if i.name not in neg_names]
-
-    if not filtered_items:
-         # Ultimate fallback
-         filtered_items = items
-
-    # Weighted Draw
-    # Extract weights. Default to 1.0 if None
-    weights = [getattr(i, 'probability', 1.0) or 1.0 for i in filtered_items]
-    
-    # Check if all weights are zero/valid? 
-    if sum(weights) <= 0:
-        weights = [1.0] * len(filtered_items)
-
-    drawn_item = random.choices(filtered_items, weights=weights, k=1)[0]
-
-    # Add to student inventory
-    student_item = models.StudentItem(student_id=student_id, item_card_id=drawn_item.id)
-    db.add(student_item)
-    db.commit()
-
-    return drawn_item
+    drawn_item = pool.draw()[0]
+
+    effect = None
+    if effects.takes_effect_on_draw(drawn_item["name"]):
+        # Resolved against the class right away instead of going to the inventory
+        student = db.query(models.Student).filter(models.Student.id == student_id, models.Student.owner_id == current_user.id).first()
+        if not student:
+            raise HTTPException(status_code=404, detail="Student not found")
+        effect = apply_drawn_card(db, drawn_item["id"], student)
+    # Add to student inventory (checks ownership in the same statement)
+    elif not inventory.add_copy(db, current_user.id, student_id, drawn_item["id"]):
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Student not found")
+    students = effect.students if effect is not None else []
+    commit_with_sampler(db, current_user.id, lambda: samplers.update_many(current_user.id, students))
+    changes = {}
+    if students:
+        changes["students"] = [s.model_dump() for s in students]
+    class_changed(current_user.id, "items_drawn", results=[{"student_id": student_id, "card_ids": [drawn_item["id"]]}], **changes)
+
+    return schemas.DrawnCard(**drawn_item, effect=effect)
+
+@app.post("/draw_items/batch", response_model=schemas.BatchDrawResponse)
+def draw_items_batch(batch: schemas.BatchDrawRequest, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # Multi-pull: reward a dorm / the whole class in one request
+    student_ids = {entry.student_id for entry in batch.draws}
+    owned = {
+        sid for (sid,) in db.query(models.Student.id).filter(
+            models.Student.owner_id == current_user.id, models.Student.id.in_(student_ids)
+        )
+    }
+    missing = student_ids - owned
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Student not found: {sorted(missing)}")
+
+    # One draw call per pool type covering every entry that uses it
+    by_pool = {}
+    for entry in batch.draws:
+        by_pool.setdefault(normalize_pool_type(entry.pool_type), []).append(entry)
+
+    drawn = {}
+    for pool_type, entries in by_pool.items():
+        pool = card_pools.get(db, pool_type)
+        if pool is None:
+            raise HTTPException(status_code=404, detail="No items available in card pool")
+        cards = iter(pool.draw(k=sum(e.count for e in entries)))
+        for entry in entries:
+            drawn.setdefault(entry.student_id, []).extend(next(cards) for _ in range(entry.count))
+
+    # Draw-time cards resolve in order; everything else goes to the inventories
+    on_draw = [(sid, card) for sid, cards in drawn.items() for card in cards if effects.takes_effect_on_draw(card["name"])]
+    counts = Counter(
+        (sid, card["id"]) for sid, cards in drawn.items() for card in cards
+        if not effects.takes_effect_on_draw(card["name"])
+    )
+    card_effects = []
+    if on_draw:
+        students = {s.id: s for s in db.query(models.Student).filter(models.Student.id.in_({sid for sid, _ in on_draw}))}
+        card_effects = [apply_drawn_card(db, card["id"], students[sid]) for sid, card in on_draw]
+    if counts:
+        inventory.add_copies(db, counts)
+    changed = {s.id: s for effect in card_effects for s in effect.students}  # latest state wins
+    if drawn:
+        commit_with_sampler(db, current_user.id, lambda: samplers.update_many(current_user.id, list(changed.values())))
+
+    changes = {}
+    if changed:
+        changes["students"] = [s.model_dump() for s in changed.values()]
+    results = [
+        {"student_id": sid, "card_ids": [card["id"] for card in cards]}
+        for sid, cards in drawn.items()
+    ]
+    if drawn:
+        class_changed(current_user.id, "items_drawn", results=results, **changes)
+    unique_cards = {card["id"]: card for cards in drawn.values() for card in cards}
+    return {"results": results, "cards": list(unique_cards.values()), "effects": card_effects}
 
 @app.get("/students/{student_id}/items", response_model=List[schemas.StudentItem])
-def get_student_items(student_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_student_items(request: Request, response: Response, student_id: int, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_user)):
+    # A matching tag was issued with a 200 for this student, so ownership was already checked
+    cached = not_modified(request, response, versions.etag("inventory", current_user.id, student_id, versions.get(current_user.id)))
+    if cached is not None:
+        return cached
     # Verify student ownership first
     student = db.query(models.Student).filter(models.Student.id == student_id, models.Student.owner_id == current_user.id).first()
     if not student:
          raise HTTPException(status_code=404, detail="Student not found")
          
-    return db.query(models.StudentItem).filter(models.StudentItem.student_id == student_id).all()
+    stacks = db.query(models.StudentItem).options(joinedload(models.StudentItem.item_card)).filter(
+        models.StudentItem.student_id == student_id
+    ).all()
+    return inventory.expand(stacks)
+
+@app.get("/inventory", response_model=schemas.Inventory)
+def read_inventory(request: Request, response: Response, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_user)):
+    # One row per (student, card) with a count, instead of one request per student
+    cached = not_modified(request, response, versions.etag("class_inventory", current_user.id, versions.get(current_user.id)))
+    if cached is not None:
+        return cached
+    rows = db.query(
+        models.StudentItem.student_id, models.StudentItem.item_card_id, models.StudentItem.quantity.label("count")
+    ).join(models.Student).filter(models.Student.owner_id == current_user.id).all()
+    card_ids = {row.item_card_id for row in rows}
+    cards = db.query(models.ItemCard).filter(models.ItemCard.id.in_(card_ids)).all() if card_ids else []
+    return {"entries": [row._asdict() for row in rows], "cards": cards}
 
 @app.delete("/student_items/{item_id}")
 def use_student_item(item_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
@@ -417,348 +805,62 @@ def use_student_item(item_id: int, db: Session = Depends(get_db), current_user:
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    db.delete(item)
+    student_id = item.student_id
+    if not inventory.take_copy(db, item_id):
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Item not found")
     db.commit()
+    class_changed(current_user.id, "item_removed", item_id=item_id, student_id=student_id)
     return {"message": "Item used successfully"}
 
-# --- Initialization Script Endpoint (Optional, or run on startup) ---
-# We'll just run a function on startup to seed if empty
-def seed_items_from_excel():
-    db = SessionLocal()
-    try:
-        # Check if items exist
-        if db.query(models.ItemCard).count() > 0:
-            return
-
-        excel_path = "props_cards.xlsx"
-        if not os.path.exists(excel_path):
-            print("Items Excel not found, skipping seed")
-            return
-
-        df = pd.read_excel(excel_path)
-        # Columns: 序号, 原义, RPG/魔法命名, 功能描述, 卡片图片
-        
-        for _, row in df.iterrows():
-            name = str(row['RPG/魔法命名'])
-            desc = str(row['原义'])
-            func_desc = str(row['功能描述'])
-            img_file = str(row['卡片图片'])
-            
-            # Fix extension png -> jpg
-            if img_file.endswith('.png'):
-                img_file = img_file.replace('.png', '.jpg')
-            
-            # Check if file really exists? Just store the path relative to static/images
-            # We assume frontend will prepend valid URL
-            
-            item = models.ItemCard(
-                name=name,
-                description=desc,
-                function_desc=func_desc,
-                image_path=img_file
-            )
-            db.add(item)
-        db.commit()
-        print("Seeded Item Cards")
-    except Exception as e:
-        print(f"Failed to seed items: {e}")
-    finally:
-        db.close()
-
-def ensure_special_cards_exist():
-    """Ensure specific cards like Doomsday exist even if not in Excel"""
-    db = SessionLocal()
-    try:
-        # Check Doomsday
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "末日审判").first():
-            item = models.ItemCard(
-                name="末日审判",
-                description="全班所有学生星级 -1。",
-                function_desc="Doomsday Judgment: All students lose 1 star.",
-                image_path="" # No image specified, fontend will handle or empty
-            )
-            db.add(item)
-            print("Added missing card: 末日审判")
-        
-        # Check Mass Silence
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "群体沉默").first():
-            item = models.ItemCard(
-                name="群体沉默",
-                description="同宿舍所有学生星级 -1。",
-                function_desc="Mass Silence: Dormmates lose 1 star.",
-                image_path=""
-            )
-            db.add(item)
-            print("Added missing card: 群体沉默")
-
-        # Check Legion Glory
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "军团荣耀").first():
-            item = models.ItemCard(
-                name="军团荣耀",
-                description="同宿舍所有学生星级 +1。",
-                function_desc="Legion Glory: Dormmates gain 1 star.",
-                image_path=""
-            )
-            db.add(item)
-            print("Added missing card: 军团荣耀")
-
-        # Check Shadow Raid
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "暗影突袭").first():
-            item = models.ItemCard(
-                name="暗影突袭",
-                description="随机扣除一人1星。",
-                function_desc="Shadow Raid: Randomly deduct 1 star from one person.",
-                image_path=""
-            )
-            db.add(item)
-            print("Added missing card: 暗影突袭")
-
-        # Check Berserker Trial
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "狂战士试炼").first():
-            item = models.ItemCard(
-                name="狂战士试炼",
-                description="随机挑选一名勇士，完成20个俯卧撑后得1星。",
-                function_desc="Berserker Trial: Random person does 20 pushups for 1 star.",
-                image_path=""
-            )
-            db.add(item)
-            print("Added missing card: 狂战士试炼")
-
-        # Check Mana Drain
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "法力汲取").first():
-            item = models.ItemCard(
-                name="法力汲取",
-                description="随机汲取一人2星，若不足2星则反噬扣1星。",
-                function_desc="Mana Drain: Steal 2 stars, or lose 1 if target has < 2.",
-                image_path=""
-            )
-            db.add(item)
-            print("Added missing card: 法力汲取")
-            
-            db.add(item)
-            print("Added missing card: 法力汲取")
-
-        # Check Stealth Cloak
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "潜行斗篷").first():
-            item = models.ItemCard(
-                name="潜行斗篷",
-                description="接下来3次抽取，不在名单中。",
-                function_desc="Stealth Cloak: Immune for next 3 draws.",
-                image_path=""
-            )
-            db.add(item)
-            print("Added missing card: 潜行斗篷")
-
-        # Check Barrier Sanctuary
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "结界：庇护所").first():
-            item = models.ItemCard(
-                name="结界：庇护所",
-                description="宿舍全员下一次抽取将不在名单中。",
-                function_desc="Barrier Sanctuary: Dormmates immune for next 1 draw.",
-                image_path=""
-            )
-            db.add(item)
-            print("Added missing card: 结界：庇护所")
-            
-        # Check Universal Salvation
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "普渡众生").first():
-            item = models.ItemCard(
-                name="普渡众生",
-                description="全班所有学生星级 +1。",
-                function_desc="Universal Salvation: All students gain 1 star.",
-                image_path="24.jpg"
-            )
-            db.add(item)
-            print("Added missing card: 普渡众生")
-        else:
-            # Fix existing path if incorrect (migration fix)
-            card = db.query(models.ItemCard).filter(models.ItemCard.name == "普渡众生").first()
-            if card.image_path == "static/images/24.jpg":
-                card.image_path = "24.jpg"
-                db.add(card)
-                print("Fixed image path for: 普渡众生")
-        
-        # Check Dark Curse
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "黑暗诅咒").first():
-            item = models.ItemCard(
-                name="黑暗诅咒",
-                description="自身陷入可以负分状态，突破下限。",
-                function_desc="Dark Curse: Allows negative stars.",
-                image_path=""
-            )
-            db.add(item)
-            print("Added missing card: 黑暗诅咒")
-
-        # Check Purification
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "净化术").first():
-            item = models.ItemCard(
-                name="净化术",
-                description="解除负分状态，分数重置为0分。",
-                function_desc="Purification: Clears curse and resets negative stars to 0.",
-                image_path=""
-            )
-            db.add(item)
-            print("Added missing card: 净化术")
-
-        # Check Abyssal Gaze
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "深渊凝视").first():
-            item = models.ItemCard(
-                name="深渊凝视",
-                description="进行判定，具有30%概率加3星，70%概率清零。",
-                function_desc="Abyssal Gaze: 30% chance +3 stars, 70% reset to 0.",
-                image_path=""
-            )
-            db.add(item)
-            print("Added missing card: 深渊凝视")
-
-        # Check Royal PK
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "皇城PK").first():
-            item = models.ItemCard(
-                name="皇城PK",
-                description="随机抽取一个人进行星星数量的比较，如果比对方多，则多增加一星",
-                function_desc="Royal PK: Compare stars with random student. If higher, gain +1 star.",
-                image_path="",
-                do_type=1,
-                probability=1.0
-            )
-            db.add(item)
-            print("Added missing card: 皇城PK")
-
-        # Check Chain Lightning
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "连锁闪电").first():
-            item = models.ItemCard(
-                name="连锁闪电",
-                description="概率性扣自己2个星，如果没中，继承到下一个人，最多继承3次",
-                function_desc="Chain Lightning: 50% chance -2 stars. On miss, jumps to next student (max 3 jumps).",
-                image_path="12.jpg",
-                do_type=0,
-                probability=1.0
-            )
-            db.add(item)
-            print("Added missing card: 连锁闪电")
-
-        # Check One Man Guard (一夫当关)
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "一夫当关").first():
-             item = models.ItemCard(
-                name="一夫当关",
-                description="仅自身扣分，不会波及其他人。",
-                function_desc="One Man Guard: Only user loses stars.",
-                image_path="11.jpg",
-                do_type=0,
-                probability=1.0
-            )
-             db.add(item)
-             print("Added missing card: 一夫当关")
-
-        # Check Destiny Roulette (命运轮盘)
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "命运轮盘").first():
-             item = models.ItemCard(
-                name="命运轮盘",
-                description="特殊效果，当使用时，将会出现两张牌，牌面分别为天使与魔鬼。然后翻转牌面开始洗牌。天使概率为0.1，恶魔概率为0.9",
-                function_desc="Destiny Roulette: 10% Angel (+10★), 90% Devil (-1★).",
-                image_path="", # Will be fixed by updated fixer or manual
-                do_type=1,
-                probability=1.0
-            )
-             db.add(item)
-             print("Added missing card: 命运轮盘")
-
-        # Check Life Elixir (生命圣水)
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "生命圣水").first():
-             item = models.ItemCard(
-                name="生命圣水",
-                description="使用后播放音效，象征生命恢复。",
-                function_desc="Life Elixir: Play sound.",
-                image_path="", 
-                do_type=1,
-                probability=1.0
-            )
-             db.add(item)
-             print("Added missing card: 生命圣水")
-
-        # Check Bard (吟游诗人)
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "吟游诗人").first():
-             item = models.ItemCard(
-                name="吟游诗人",
-                description="使用后播放音效，象征激励。",
-                function_desc="Bard: Play sound.",
-                image_path="", 
-                do_type=1,
-                probability=1.0
-            )
-             db.add(item)
-             print("Added missing card: 吟游诗人")
-
-        # Check Boss Ticket (BOSS挑战券)
-        # Check both cases just to be sure we seed one standard one
-        if not db.query(models.ItemCard).filter(models.ItemCard.name == "BOSS挑战券").first() and \
-           not db.query(models.ItemCard).filter(models.ItemCard.name == "boss挑战券").first():
-             item = models.ItemCard(
-                name="BOSS挑战券",
-                description="挑战强大的BOSS，胜者获得丰厚奖励。",
-                function_desc="Boss Ticket: Challenge Boss event.",
-                image_path="", 
-                do_type=1,
-                probability=1.0
-            )
-             db.add(item)
-             print("Added missing card: BOSS挑战券")
-
-        # Update images for special cards if empty (Migration Fix)
-        special_card_images = {
-            "末日审判": "25.jpg",
-            "群体沉默": "23.jpg",
-            "军团荣耀": "22.jpg",
-            "暗影突袭": "21.jpg",
-            "狂战士试炼": "20.jpg",
-            "法力汲取": "19.jpg",
-            "潜行斗篷": "18.jpg",
-            "结界：庇护所": "17.jpg",
-            "黑暗诅咒": "16.jpg",
-            "净化术": "15.jpg",
-            "深渊凝视": "14.jpg",
-            "皇城PK": "13.jpg",
-            "连锁闪电": "12.jpg",
-            "一夫当关": "11.jpg",
-            "普渡众生": "24.jpg"
-        }
-        
-        for name, img in special_card_images.items():
-            card = db.query(models.ItemCard).filter(models.ItemCard.name == name).first()
-            if card and (not card.image_path or card.image_path == ""):
-                card.image_path = img
-                db.add(card)
-                print(f"Updated image for: {name}")
+@app.post("/student_items/{item_id}/use", response_model=schemas.CardUseResult)
+def use_card(item_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # Consume the card and apply its whole effect (see effects.py) in one transaction
+    item = db.query(models.StudentItem).join(models.Student).options(
+        contains_eager(models.StudentItem.student), joinedload(models.StudentItem.item_card)
+    ).filter(models.StudentItem.id == item_id, models.Student.owner_id == current_user.id).first()
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    card = item.item_card
+    user = item.student
 
-        db.commit()
-    except Exception as e:
-        print(f"Error checking special cards: {e}")
-    finally:
-        db.close()
+    # Consume first: this takes the SQLite write lock (see inventory.take_copy)
+    if not inventory.take_copy(db, item_id):
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Item not found")
 
-seed_items_from_excel()
-ensure_special_cards_exist()
+    ctx = effects.apply_card(db, card, user)
+    db.flush()
+    result = schemas.CardUseResult(
+        item_id=item_id,
+        student_id=user.id,
+        card=schemas.ItemCard.model_validate(card),
+        outcome=ctx.outcome,
+        students=[schemas.Student.model_validate(s) for s in ctx.changed.values()],
+    )
+    commit_with_sampler(db, current_user.id, lambda: samplers.update_many(current_user.id, result.students))
+    class_changed(
+        current_user.id, "item_used", item_id=item_id, student_id=user.id, card_id=card.id,
+        outcome=result.outcome, students=[s.model_dump() for s in result.students],
+    )
+    return result
 
 # --- Frontend Static Serving ---
-frontend_path = get_frontend_path()
-
-if frontend_path:
-    # Mount assets if they exist (Vite structure)
-    assets_path = os.path.join(frontend_path, "assets")
-    if os.path.exists(assets_path):
-        app.mount("/assets", StaticFiles(directory=assets_path), name="assets")
+# Indexed once in startup(), then served from memory (see spa.py)
+frontend = spa.SPA(get_spa_path()) if os.path.isdir(get_spa_path()) else None
 
+if frontend is not None:
     @app.get("/{full_path:path}")
-    async def serve_spa(full_path: str):
+    async def serve_spa(full_path: str, request: Request):
         # Note: This catch-all must be last
-        target_file = os.path.join(frontend_path, full_path)
-        if os.path.isfile(target_file):
-            return FileResponse(target_file)
-            
-        return FileResponse(os.path.join(frontend_path, "index.html"))
+        return frontend.response(full_path, request)
 
 if __name__ == "__main__":
+    import multiprocessing
+    # Required for the hashing process pool in the PyInstaller build
+    multiprocessing.freeze_support()
     import uvicorn
     # When running as exe, we usually want to open the browser automatically?
     # Or just start the server. Start server for now.
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    # Open event streams never finish on their own; give them 5s on shutdown
+    uvicorn.run(app, host="127.0.0.1", port=8000, timeout_graceful_shutdown=5)
@@ -0,0 +1,208 @@
+import contextvars
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+# Request and SQL instrumentation, exported as Prometheus text on GET /metrics.
+# Kept dependency-free: counters and histograms live in process memory and
+# are rendered on scrape; stats of other components are read at that time.
+
+# 1: GET /metrics needs an admin bearer token (default: open, for local scrapers)
+METRICS_ADMIN_ONLY = os.environ.get("METRICS_ADMIN_ONLY", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# SQL counters of the request being served; handlers run in the threadpool,
+# which copies the context, so statements executed there land here too
+_request_sql = contextvars.ContextVar("request_sql", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: above every bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, n in zip(self.buckets, self.counts):
+            total += n
+            yield _number(bound), total
+        yield "+Inf", self.count
+
+
+class RequestSQL:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+def current_request_sql():
+    # RequestSQL of the request being served, None outside MetricsMiddleware
+    return _request_sql.get()
+
+
+class Metrics:
+    """Process-wide counters, keyed by (method, route template)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}  # (method, route, status) -> count
+        self.latency = {}  # (method, route) -> Histogram of seconds
+        self.queries = {}  # (method, route) -> Histogram of statements per request
+        self.db_seconds = {}  # (method, route) -> seconds spent in SQL
+        self.in_flight = 0
+        self.sql_queries = 0  # every statement, including startup and streams
+        self.sql_seconds = 0.0
+
+    def record_sql(self, seconds):
+        with self._lock:
+            self.sql_queries += 1
+            self.sql_seconds += seconds
+        sql = _request_sql.get()
+        if sql is not None:
+            sql.queries += 1
+            sql.seconds += seconds
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def record_request(self, method, route, status, seconds, sql):
+        key = (method, route)
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[key + (status,)] = self.requests.get(key + (status,), 0) + 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.queries[key] = Histogram(QUERY_BUCKETS)
+                self.db_seconds[key] = 0.0
+            self.latency[key].observe(seconds)
+            self.queries[key].observe(sql.queries)
+            self.db_seconds[key] += sql.seconds
+
+    def render(self, extra=()):
+        """Prometheus text exposition.
+
+        extra: (name, type, help, {labels tuple: value}) read from other
+        components at scrape time.
+        """
+        out = []
+        with self._lock:
+            _family(out, "gacha_http_requests_total", "counter", "Requests by route template and status",
+                    {(("method", m), ("route", r), ("status", s)): n for (m, r, s), n in sorted(self.requests.items())})
+            _histogram(out, "gacha_http_request_duration_seconds", "Request latency by route template", self.latency)
+            _histogram(out, "gacha_http_request_queries", "SQL statements per request by route template", self.queries)
+            _family(out, "gacha_http_request_db_seconds_total", "counter", "Time spent in SQL by route template",
+                    {(("method", m), ("route", r)): s for (m, r), s in sorted(self.db_seconds.items())})
+            _family(out, "gacha_http_requests_in_flight", "gauge", "Requests being served", {(): self.in_flight})
+            _family(out, "gacha_db_queries_total", "counter", "SQL statements executed", {(): self.sql_queries})
+            _family(out, "gacha_db_seconds_total", "counter", "Time spent in SQL", {(): self.sql_seconds})
+        for name, kind, help_text, samples in extra:
+            _family(out, name, kind, help_text, samples)
+        return "\n".join(out) + "\n"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _family(out, name, kind, help_text, samples):
+    out.append(f"# HELP {name} {help_text}")
+    out.append(f"# TYPE {name} {kind}")
+    for labels, value in samples.items():
+        out.append(f"{name}{_labels(labels)} {_number(value)}")
+
+
+def _histogram(out, name, help_text, histograms):
+    out.append(f"# HELP {name} {help_text}")
+    out.append(f"# TYPE {name} histogram")
+    for (method, route), hist in sorted(histograms.items()):
+        labels = (("method", method), ("route", route))
+        for bound, count in hist.cumulative():
+            out.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {count}")
+        out.append(f"{name}_sum{_labels(labels)} {_number(hist.sum)}")
+        out.append(f"{name}_count{_labels(labels)} {hist.count}")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording every HTTP request under its route template.
+
+    Plain ASGI rather than BaseHTTPMiddleware so event streams pass through
+    untouched; their duration is the stream's lifetime.
+    """
+
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        sql = RequestSQL()
+        token = _request_sql.set(sql)
+        self.metrics.request_started()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_sql.reset(token)
+            # The router stores the matched route in the scope; unmatched paths share one label
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.metrics.record_request(scope["method"], route, status, elapsed, sql)
+
+
+def instrument_engine(engine, metrics):
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_start")
+        if starts:
+            metrics.record_sql(time.perf_counter() - starts.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def drop_timer(context):
+        # Failed statements never reach after_cursor_execute
+        starts = context.connection.info.get("metrics_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+metrics = Metrics()
@@ -0,0 +1,185 @@
+from sqlalchemy import text
+
+# Ordered schema migrations. Each step runs once, in order, and is recorded in
+# schema_version. Tables themselves come from Base.metadata.create_all; steps
+# only bring databases created by older versions up to date.
+MIGRATIONS = []
+
+
+def migration(version):
+    def register(fn):
+        MIGRATIONS.append((version, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+
+
+def _add_column(conn, table, column, ddl):
+    if column not in _columns(conn, table):
+        print(f"adding {table}.{column} column...")
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+@migration(1)
+def legacy_columns(conn):
+    # Columns added to the first releases by the old probe-and-alter check.
+    # Tables created from the current models have immune_until_turn instead
+    # of immunity, which only migration 6 reads.
+    if "immune_until_turn" not in _columns(conn, "students"):
+        _add_column(conn, "students", "immunity", "INTEGER DEFAULT 0")
+    _add_column(conn, "students", "is_cursed", "BOOLEAN DEFAULT 0")
+    _add_column(conn, "students", "owner_id", "INTEGER")
+    _add_column(conn, "item_cards", "do_type", "INTEGER DEFAULT 1")
+    _add_column(conn, "item_cards", "probability", "FLOAT DEFAULT 1.0")
+
+
+# Change tracking for GET /students/changes. One global counter in sync_seq;
+# triggers stamp every inserted or changed row with the next value and record
+# deletions in sync_tombstones. Triggers rather than application code because
+# rows are written through bulk UPDATE/INSERT statements all over the backend.
+STAMP = """
+        UPDATE sync_seq SET seq = seq + 1 WHERE id = 1;
+        UPDATE {table} SET updated_seq = (SELECT seq FROM sync_seq WHERE id = 1) WHERE id = NEW.id;
+"""
+TOMBSTONE = """
+        UPDATE sync_seq SET seq = seq + 1 WHERE id = 1;
+        INSERT INTO sync_tombstones (seq, owner_id, kind, row_id)
+        VALUES ((SELECT seq FROM sync_seq WHERE id = 1), {owner}, '{kind}', OLD.id);
+"""
+TRACKED_COLUMNS = {
+    "students": ("name", "dorm_number", "stars", "pick_count", "immune_until_turn", "is_cursed", "owner_id"),
+    "student_items": ("student_id", "item_card_id", "quantity"),
+}
+# Items are usually deleted before their student, so the owner is still there
+ITEM_OWNER = "(SELECT owner_id FROM students WHERE id = OLD.student_id)"
+
+
+def _tracking_triggers(table, kind, owner):
+    columns = TRACKED_COLUMNS[table]
+    # Only rows whose values actually change get a new stamp
+    changed = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in columns)
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_seq_insert AFTER INSERT ON {table} BEGIN{STAMP.format(table=table)}END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_seq_update AFTER UPDATE OF {', '.join(columns)} ON {table} "
+        f"WHEN {changed} BEGIN{STAMP.format(table=table)}END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_seq_delete AFTER DELETE ON {table} BEGIN{TOMBSTONE.format(owner=owner, kind=kind)}END",
+    ]
+
+
+@migration(2)
+def change_tracking(conn):
+    _add_column(conn, "students", "updated_seq", "INTEGER DEFAULT 0")
+    _add_column(conn, "student_items", "updated_seq", "INTEGER DEFAULT 0")
+    conn.execute(text("CREATE TABLE IF NOT EXISTS sync_seq (id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER NOT NULL)"))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS sync_tombstones ("
+        "seq INTEGER PRIMARY KEY, owner_id INTEGER, kind TEXT NOT NULL, row_id INTEGER NOT NULL)"
+    ))
+    # Existing rows all start at 1 so `since=0` returns everything
+    conn.execute(text("INSERT OR IGNORE INTO sync_seq (id, seq) VALUES (1, 1)"))
+    conn.execute(text("UPDATE students SET updated_seq = 1"))
+    conn.execute(text("UPDATE student_items SET updated_seq = 1"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_students_owner_seq ON students (owner_id, updated_seq)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_student_items_seq ON student_items (updated_seq)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_sync_tombstones_owner ON sync_tombstones (owner_id, seq)"))
+    for ddl in _tracking_triggers("students", "student", "OLD.owner_id"):
+        conn.execute(text(ddl))
+    for ddl in _tracking_triggers("student_items", "item", ITEM_OWNER):
+        conn.execute(text(ddl))
+
+
+@migration(3)
+def star_ledger_baseline(conn):
+    # star_events/star_snapshots come from create_all. Stars earned before the
+    # ledger existed become each student's opening snapshot.
+    conn.execute(text(
+        "INSERT OR IGNORE INTO star_snapshots (student_id, stars, last_event_id, taken_at) "
+        "SELECT id, COALESCE(stars, 0), 0, CURRENT_TIMESTAMP FROM students"
+    ))
+    # SQLite reuses the highest student id, so a removed student's events are
+    # detached (kept for class/dorm totals) and its snapshot dropped.
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS students_star_ledger_delete AFTER DELETE ON students BEGIN "
+        "UPDATE star_events SET student_id = NULL WHERE student_id = OLD.id; "
+        "DELETE FROM star_snapshots WHERE student_id = OLD.id; "
+        "END"
+    ))
+
+
+@migration(4)
+def hot_query_indexes(conn):
+    # Same names as the Index() entries in models.py, which cover fresh databases.
+    # Checked by benchmarks/check_query_plans.py.
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_students_owner_id ON students (owner_id, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_students_owner_dorm ON students (owner_id, dorm_number)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_student_items_student_card ON student_items (student_id, item_card_id)"))
+
+
+@migration(5)
+def stacked_inventory(conn):
+    # One row per (student, card) with a quantity instead of one row per copy
+    _add_column(conn, "student_items", "quantity", "INTEGER NOT NULL DEFAULT 1")
+    # Quantity changes must stamp the row too (trigger from change_tracking)
+    conn.execute(text("DROP TRIGGER IF EXISTS student_items_seq_update"))
+    for ddl in _tracking_triggers("student_items", "item", ITEM_OWNER):
+        conn.execute(text(ddl))
+    # Fold duplicate copies into the oldest row of each pair; the rest are
+    # deleted, which tombstones them for delta-sync clients
+    conn.execute(text(
+        "UPDATE student_items SET quantity = ("
+        "SELECT COUNT(*) FROM student_items AS c "
+        "WHERE c.student_id IS student_items.student_id AND c.item_card_id IS student_items.item_card_id"
+        ") WHERE id IN (SELECT MIN(id) FROM student_items GROUP BY student_id, item_card_id HAVING COUNT(*) > 1)"
+    ))
+    conn.execute(text(
+        "DELETE FROM student_items WHERE id NOT IN (SELECT MIN(id) FROM student_items GROUP BY student_id, item_card_id)"
+    ))
+    conn.execute(text("DROP INDEX IF EXISTS ix_student_items_student_card"))
+    conn.execute(text("CREATE UNIQUE INDEX ix_student_items_student_card ON student_items (student_id, item_card_id)"))
+
+
+@migration(6)
+def turn_counter(conn):
+    # Immunity becomes a stamp against a per-class turn counter, so advancing
+    # a turn updates one users row. students.immunity is left in place unused.
+    _add_column(conn, "users", "current_turn", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "students", "immune_until_turn", "INTEGER NOT NULL DEFAULT 0")
+    conn.execute(text("DROP TRIGGER IF EXISTS students_seq_update"))
+    for ddl in _tracking_triggers("students", "student", "OLD.owner_id"):
+        conn.execute(text(ddl))
+    # Every class starts at turn 0, so the remaining turns are the stamp
+    if "immunity" in _columns(conn, "students"):
+        conn.execute(text("UPDATE students SET immune_until_turn = immunity WHERE immunity > 0"))
+
+
+
+@migration(7)
+def purge_deleted_owners(conn):
+    # SQLite hands a deleted account's id to the next one, so whatever is
+    # keyed by owner_id goes with the account. Students (and their
+    # snapshots) are deleted first by the ORM cascade; their tombstones too.
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS users_owner_data_delete AFTER DELETE ON users BEGIN "
+        "DELETE FROM star_events WHERE owner_id = OLD.id; "
+        "DELETE FROM star_snapshots WHERE student_id IN (SELECT id FROM students WHERE owner_id = OLD.id); "
+        "DELETE FROM sync_tombstones WHERE owner_id = OLD.id; "
+        "END"
+    ))
+    # Leftovers of accounts deleted before the trigger; an id already reused can't be told apart
+    conn.execute(text("DELETE FROM star_events WHERE owner_id NOT IN (SELECT id FROM users)"))
+    conn.execute(text("DELETE FROM sync_tombstones WHERE owner_id NOT IN (SELECT id FROM users)"))
+
+
+def run_migrations(engine):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+        current = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+        for version, step in MIGRATIONS:
+            if version > current:
+                step(conn)
+                conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": version})
+                print(f"Applied schema migration {version}: {step.__name__}")
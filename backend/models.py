@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Float, DateTime, Index, select, func
+from sqlalchemy.orm import relationship, column_property
 from database import Base
 
 class User(Base):
@@ -9,6 +9,7 @@ class User(Base):
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     is_admin = Column(Boolean, default=False)
+    current_turn = Column(Integer, nullable=False, default=0, server_default="0") # Roll-call turns taken
 
     students = relationship("Student", back_populates="owner", cascade="all, delete-orphan")
 
@@ -20,13 +21,29 @@ class Student(Base):
     dorm_number = Column(String, nullable=True)
     stars = Column(Integer, default=0)
     pick_count = Column(Integer, default=0)
-    immunity = Column(Integer, default=0)
+    immune_until_turn = Column(Integer, nullable=False, default=0, server_default="0") # Immune while the class turn is below this
     is_cursed = Column(Boolean, default=False)
     owner_id = Column(Integer, ForeignKey("users.id")) # Link to User (Class)
+    updated_seq = Column(Integer, default=0) # Stamped by triggers, see migrations.py
 
     owner = relationship("User", back_populates="students")
     items = relationship("StudentItem", back_populates="student", cascade="all, delete-orphan")
 
+    # Every class query filters on owner_id (see migrations.hot_query_indexes)
+    __table_args__ = (
+        Index("ix_students_owner_id", "owner_id", "id"),
+        Index("ix_students_owner_dorm", "owner_id", "dorm_number"),
+    )
+
+def owner_turn():
+    # Current turn of the class a students row belongs to
+    return func.coalesce(
+        select(User.current_turn).where(User.id == Student.owner_id).correlate_except(User).scalar_subquery(), 0
+    )
+
+# Turns of immunity left, derived from the stamp; read-only
+Student.immunity = column_property(func.max(0, Student.immune_until_turn - owner_turn()))
+
 class ItemCard(Base):
     __tablename__ = "item_cards"
 
@@ -44,6 +61,35 @@ class StudentItem(Base):
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(Integer, ForeignKey("students.id"))
     item_card_id = Column(Integer, ForeignKey("item_cards.id"))
+    quantity = Column(Integer, nullable=False, default=1, server_default="1") # Copies held, see inventory.py
+    updated_seq = Column(Integer, default=0) # Stamped by triggers, see migrations.py
 
     student = relationship("Student", back_populates="items")
     item_card = relationship("ItemCard")
+
+    # One stack per (student, card)
+    __table_args__ = (Index("ix_student_items_student_card", "student_id", "item_card_id", unique=True),)
+
+class StarEvent(Base):
+    # Append-only ledger; Student.stars is the materialized running total
+    __tablename__ = "star_events"
+
+    id = Column(Integer, primary_key=True)
+    student_id = Column(Integer, index=True) # NULL once the student is removed (ids get reused)
+    owner_id = Column(Integer)
+    dorm_number = Column(String, nullable=True) # Dorm at the time of the change
+    delta = Column(Integer)
+    reason = Column(String) # answer / manual / card / set / adjust
+    card_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime) # UTC
+
+    __table_args__ = (Index("ix_star_events_owner_created", "owner_id", "created_at"),)
+
+class StarSnapshot(Base):
+    # Ledger total per student up to last_event_id; bounds recomputation
+    __tablename__ = "star_snapshots"
+
+    student_id = Column(Integer, primary_key=True)
+    stars = Column(Integer)
+    last_event_id = Column(Integer)
+    taken_at = Column(DateTime)
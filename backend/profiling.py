@@ -0,0 +1,300 @@
+import collections
+import contextvars
+import functools
+import inspect
+import itertools
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import anyio
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+from metrics import current_request_sql
+
+# On-demand request profiling and the slow-request log.
+#
+# An admin adds `X-Profile: 1` (or `?profile=1`) to a request. While its
+# handler runs, a sampler thread records the handler thread's stack every
+# PROFILE_INTERVAL_MS, and every SQL statement is captured with its timing;
+# statements slower than PROFILE_EXPLAIN_MS also get EXPLAIN QUERY PLAN. The
+# report is kept in memory (last PROFILE_KEEP) under /admin/profiles and its
+# id is returned in the X-Profile-Id response header.
+
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "500"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "2"))
+PROFILE_EXPLAIN_MS = float(os.environ.get("PROFILE_EXPLAIN_MS", "5"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "20"))
+
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+_active = contextvars.ContextVar("active_profile", default=None)
+
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profile:
+    """Samples and SQL of one profiled request."""
+
+    def __init__(self, profile_id, method, path):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now(timezone.utc)
+        self.stacks = collections.Counter()
+        self.sql = []
+        self._roots = {}  # thread id -> handler wrapper frame
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enter(self, frame):
+        with self._lock:
+            self._roots[threading.get_ident()] = frame
+
+    def exit(self):
+        with self._lock:
+            self._roots.pop(threading.get_ident(), None)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name=f"profile-{self.id}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while not self._stop.wait(interval):
+            with self._lock:
+                roots = list(self._roots.items())
+            frames = sys._current_frames()
+            for thread_id, root in roots:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None and frame is not root:
+                    stack.append(_label(frame.f_code))
+                    frame = frame.f_back
+                if frame is None:
+                    # The handler is suspended (async) and the thread is doing other work
+                    stack = ["(event loop)"]
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def add_sql(self, statement, seconds, plan):
+        self.sql.append({"statement": " ".join(statement.split()), "ms": round(seconds * 1000, 3), "plan": plan})
+
+    def report(self, route, status, seconds):
+        samples = sum(self.stacks.values())
+        own, total = collections.Counter(), collections.Counter()
+        for stack, n in self.stacks.items():
+            if stack:
+                own[stack[-1]] += n
+            for name in set(stack):
+                total[name] += n
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": route,
+            "status": status,
+            "started_at": self.started_at.isoformat(timespec="milliseconds"),
+            "duration_ms": round(seconds * 1000, 3),
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "samples": samples,
+            "functions": [
+                {"function": name, "self": own[name], "total": n} for name, n in total.most_common(40)
+            ],
+            # Collapsed stacks (root first), the input format of flame graph tools
+            "stacks": [{"stack": ";".join(stack), "samples": n} for stack, n in self.stacks.most_common()],
+            "sql_count": len(self.sql),
+            "sql_ms": round(sum(q["ms"] for q in self.sql), 3),
+            "sql": self.sql,
+        }
+
+
+def profiled(endpoint):
+    """Wrap an endpoint so a profiled request samples the thread running it."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            profile = _active.get()
+            if profile is None:
+                return await endpoint(*args, **kwargs)
+            profile.enter(sys._getframe())
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                profile.exit()
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            profile = _active.get()
+            if profile is None:
+                return endpoint(*args, **kwargs)
+            profile.enter(sys._getframe())
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                profile.exit()
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    # Set as the app's route_class before any route is declared
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, profiled(endpoint), **kwargs)
+
+
+class Reports:
+    """Recent profile reports and slow requests, in memory."""
+
+    def __init__(self, keep=PROFILE_KEEP):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.profiles = collections.OrderedDict()
+        self.keep = keep
+        self.slow = collections.deque(maxlen=200)
+
+    def next_id(self):
+        return str(next(self._ids))
+
+    def add_profile(self, report):
+        with self._lock:
+            self.profiles[report["id"]] = report
+            while len(self.profiles) > self.keep:
+                self.profiles.popitem(last=False)
+
+    def get_profile(self, profile_id):
+        with self._lock:
+            return self.profiles.get(profile_id)
+
+    def list_profiles(self):
+        with self._lock:
+            keys = ("id", "method", "path", "route", "status", "started_at", "duration_ms", "samples", "sql_count", "sql_ms")
+            return [{k: r[k] for k in keys} for r in reversed(self.profiles.values())]
+
+    def add_slow(self, entry):
+        with self._lock:
+            self.slow.append(entry)
+
+    def list_slow(self):
+        with self._lock:
+            return list(reversed(self.slow))
+
+
+reports = Reports()
+
+
+class ProfilingMiddleware:
+    """Slow-request log (always on) and profiling of flagged admin requests.
+
+    authorize(token) -> bool decides whether a bearer token may profile; it
+    touches the database, so it runs in the threadpool and only for flagged
+    requests. Without permission the flag is ignored.
+    """
+
+    def __init__(self, app, authorize):
+        self.app = app
+        self.authorize = authorize
+
+    def _requested(self, scope):
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile") == b"1" or b"profile=1" in scope.get("query_string", b"").split(b"&"):
+            scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profile = None
+        token = self._requested(scope)
+        if token is not None and await anyio.to_thread.run_sync(self.authorize, token):
+            profile = Profile(reports.next_id(), scope["method"], scope["path"])
+        status = 500
+        streaming = False
+
+        async def send_status(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = any(k.lower() == b"content-type" and v.startswith(b"text/event-stream")
+                                for k, v in message.get("headers", []))
+                if profile is not None:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        context_token = _active.set(profile)
+        if profile is not None:
+            profile.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _active.reset(context_token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            if profile is not None:
+                profile.stop()
+                reports.add_profile(profile.report(route, status, elapsed))
+            # An event stream lasts as long as the client stays connected; that isn't slowness
+            if elapsed * 1000 >= SLOW_REQUEST_MS and not streaming:
+                self._log_slow(scope, route, status, elapsed, profile)
+
+    def _log_slow(self, scope, route, status, elapsed, profile):
+        sql = current_request_sql()
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "method": scope["method"],
+            "route": route,
+            "path": scope["path"],
+            "status": status,
+            "ms": round(elapsed * 1000, 1),
+            "sql_count": sql.queries if sql else None,
+            "sql_ms": round(sql.seconds * 1000, 1) if sql else None,
+            "profile_id": profile.id if profile else None,
+        }
+        reports.add_slow(entry)
+        print(f"Slow request: {entry['method']} {entry['path']} -> {status} in {entry['ms']} ms "
+              f"({entry['sql_count']} SQL statements, {entry['sql_ms']} ms in SQL)")
+
+
+def instrument_engine(engine):
+    # Statement capture for profiled requests; a no-op for everything else
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        if _active.get() is not None:
+            conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        profile = _active.get()
+        starts = conn.info.get("profile_start")
+        if profile is None or not starts:
+            return
+        seconds = time.perf_counter() - starts.pop()
+        plan = None
+        if (seconds * 1000 >= PROFILE_EXPLAIN_MS and not executemany
+                and statement.lstrip().upper().startswith(EXPLAINABLE)):
+            # Same connection and parameters, so temp tables and bound values resolve
+            try:
+                rows = cursor.connection.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+                plan = [row[3] for row in rows]
+            except sqlite3.Error:
+                # Losing a plan must not fail the request being profiled
+                plan = None
+        profile.add_sql(statement, seconds, plan)
+
+    @event.listens_for(engine, "handle_error")
+    def drop_timer(context):
+        starts = context.connection.info.get("profile_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
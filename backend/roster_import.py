@@ -0,0 +1,114 @@
+import codecs
+import csv
+import itertools
+
+from sqlalchemy import text
+
+CHUNK_SIZE = 1000
+
+
+def _cell_text(value):
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return None
+        if value.is_integer():
+            value = int(value)
+    value = str(value).strip()
+    if not value or value == "nan":
+        return None
+    return value
+
+
+def _iter_xlsx(fileobj):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _iter_csv(fileobj):
+    yield from csv.reader(codecs.iterdecode(fileobj, "utf-8-sig"))
+
+
+def _iter_xls(fileobj):
+    # Legacy .xls has no streaming reader; fall back to pandas
+    import pandas as pd
+
+    df = pd.read_excel(fileobj, header=None)
+    for row in df.itertuples(index=False):
+        yield tuple(row)
+
+
+def iter_roster(filename, fileobj):
+    """Yield (name, dorm_number) per roster row, skipping a header row."""
+    lower = filename.lower()
+    if lower.endswith(".csv"):
+        rows = _iter_csv(fileobj)
+    elif lower.endswith(".xls"):
+        rows = _iter_xls(fileobj)
+    else:
+        rows = _iter_xlsx(fileobj)
+
+    first = True
+    for row in rows:
+        if not row:
+            continue
+        name = _cell_text(row[0])
+        if first:
+            first = False
+            if name and ("name" in name.lower() or "姓名" in name):
+                continue
+        if not name:
+            continue
+        dorm = _cell_text(row[1]) if len(row) > 1 else None
+        yield name, dorm
+
+
+def sync_roster(db, owner_id, roster):
+    """Diff the uploaded roster against the class, matching on (name, dorm).
+
+    Matching students keep their stars and items, new ones are inserted and
+    students missing from the upload are removed with their items. Rows are
+    staged in a temp table so memory and statement count stay constant.
+    Returns counts; the caller commits.
+    """
+    db.execute(text("DROP TABLE IF EXISTS temp.import_roster"))
+    db.execute(text("CREATE TEMP TABLE import_roster (name VARCHAR NOT NULL, dorm_number VARCHAR)"))
+    db.execute(text("CREATE INDEX temp.ix_import_roster ON import_roster (name, dorm_number)"))
+
+    total = 0
+    roster = iter(roster)
+    while True:
+        chunk = [{"name": n, "dorm": d} for n, d in itertools.islice(roster, CHUNK_SIZE)]
+        if not chunk:
+            break
+        db.execute(text("INSERT INTO import_roster (name, dorm_number) VALUES (:name, :dorm)"), chunk)
+        total += len(chunk)
+
+    params = {"uid": owner_id}
+    departed = (
+        "SELECT s.id FROM students s WHERE s.owner_id = :uid AND NOT EXISTS ("
+        "SELECT 1 FROM import_roster r WHERE r.name = s.name AND r.dorm_number IS s.dorm_number)"
+    )
+    db.execute(text(f"DELETE FROM student_items WHERE student_id IN ({departed})"), params)
+    removed = db.execute(text(f"DELETE FROM students WHERE id IN ({departed})"), params).rowcount
+
+    updated = db.execute(text(
+        "SELECT COUNT(*) FROM students s WHERE s.owner_id = :uid AND EXISTS ("
+        "SELECT 1 FROM import_roster r WHERE r.name = s.name AND r.dorm_number IS s.dorm_number)"
+    ), params).scalar()
+
+    inserted = db.execute(text(
+        "INSERT INTO students (name, dorm_number, stars, pick_count, immune_until_turn, is_cursed, owner_id) "
+        "SELECT DISTINCT r.name, r.dorm_number, 0, 0, 0, 0, :uid FROM import_roster r "
+        "WHERE NOT EXISTS (SELECT 1 FROM students s WHERE s.owner_id = :uid "
+        "AND s.name = r.name AND s.dorm_number IS r.dorm_number)"
+    ), params).rowcount
+
+    db.execute(text("DROP TABLE temp.import_roster"))
+    return {"count": total, "inserted": inserted, "updated": updated, "removed": removed}
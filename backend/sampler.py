@@ -0,0 +1,190 @@
+import heapq
+import random
+import threading
+
+import models
+
+# Roll-call weighting (previously computed in App.tsx handleDraw):
+# 1. Students never picked and not immune are drawn uniformly first.
+# 2. Otherwise weight = 60 // (stars + 1), immune students excluded.
+WEIGHT_NUMERATOR = 60
+
+
+def fresh_weight(pick_count, immune):
+    return 1 if (pick_count or 0) == 0 and not immune else 0
+
+
+def star_weight(stars, immune):
+    if immune:
+        return 0
+    return WEIGHT_NUMERATOR // (max(0, stars or 0) + 1)
+
+
+class FenwickTree:
+    """Binary indexed tree over integer weights: O(log n) update and sample."""
+
+    def __init__(self, weights):
+        self.size = len(weights)
+        self.tree = [0] * (self.size + 1)
+        self.total = 0
+        for i, w in enumerate(weights):
+            if w:
+                self.add(i, w)
+
+    def add(self, index, delta):
+        self.total += delta
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, target):
+        # Smallest index whose prefix sum exceeds target (0 <= target < total)
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+
+class ClassSampler:
+    """Weighted sampler over one class roster, kept in sync incrementally.
+
+    Immunity is an immune_until_turn stamp; students whose stamp the class
+    turn reaches are released by advance() from a heap, not by a roster scan.
+    """
+
+    def __init__(self, rows, turn=0):
+        # rows: iterable of (id, stars, pick_count, immune_until_turn)
+        rows = list(rows)
+        self.turn = turn
+        self.ids = []
+        self.slots = {}
+        self.fresh = []
+        self.weighted = []
+        self.state = []
+        self.expiring = []
+        for student_id, stars, pick_count, until in rows:
+            slot = len(self.ids)
+            self.slots[student_id] = slot
+            self.ids.append(student_id)
+            self.state.append((stars, pick_count, until or 0))
+            fresh, weighted = self._weights(slot)
+            self.fresh.append(fresh)
+            self.weighted.append(weighted)
+            if (until or 0) > turn:
+                self.expiring.append((until, student_id))
+        heapq.heapify(self.expiring)
+        self._rebuild(max(16, len(self.ids) * 2))
+
+    def _weights(self, slot):
+        stars, pick_count, until = self.state[slot]
+        immune = until > self.turn
+        return fresh_weight(pick_count, immune), star_weight(stars, immune)
+
+    def _rebuild(self, capacity):
+        pad = capacity - len(self.ids)
+        self.fresh_tree = FenwickTree(self.fresh + [0] * pad)
+        self.weighted_tree = FenwickTree(self.weighted + [0] * pad)
+
+    def _set(self, slot, fresh, weighted):
+        if fresh != self.fresh[slot]:
+            self.fresh_tree.add(slot, fresh - self.fresh[slot])
+            self.fresh[slot] = fresh
+        if weighted != self.weighted[slot]:
+            self.weighted_tree.add(slot, weighted - self.weighted[slot])
+            self.weighted[slot] = weighted
+
+    def update(self, student_id, stars, pick_count, until):
+        slot = self.slots.get(student_id)
+        if slot is None:
+            slot = len(self.ids)
+            self.slots[student_id] = slot
+            self.ids.append(student_id)
+            self.fresh.append(0)
+            self.weighted.append(0)
+            self.state.append(None)
+            if slot >= self.fresh_tree.size:
+                self._rebuild(self.fresh_tree.size * 2)
+        self.state[slot] = (stars, pick_count, until or 0)
+        if (until or 0) > self.turn:
+            heapq.heappush(self.expiring, (until, student_id))
+        self._set(slot, *self._weights(slot))
+
+    def advance(self, turn):
+        # Entries can be stale (stamp changed, student removed); recomputing is harmless
+        self.turn = max(self.turn, turn)
+        while self.expiring and self.expiring[0][0] <= self.turn:
+            _, student_id = heapq.heappop(self.expiring)
+            slot = self.slots.get(student_id)
+            if slot is not None:
+                self._set(slot, *self._weights(slot))
+
+    def remove(self, student_id):
+        slot = self.slots.pop(student_id, None)
+        if slot is not None:
+            self._set(slot, 0, 0)
+            self.ids[slot] = None
+
+    def draw(self, rng=random):
+        tree = self.fresh_tree if self.fresh_tree.total > 0 else self.weighted_tree
+        if tree.total <= 0:
+            return None
+        return self.ids[tree.find(rng.randrange(tree.total))]
+
+
+class SamplerRegistry:
+    """Process-wide ClassSampler cache keyed by owner (class) id."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samplers = {}
+        self._class_locks = {}
+
+    def lock_for(self, owner_id):
+        with self._lock:
+            return self._class_locks.setdefault(owner_id, threading.RLock())
+
+    def get(self, db, owner_id):
+        with self.lock_for(owner_id):
+            sampler = self._samplers.get(owner_id)
+            if sampler is None:
+                rows = db.query(
+                    models.Student.id, models.Student.stars,
+                    models.Student.pick_count, models.Student.immune_until_turn,
+                ).filter(models.Student.owner_id == owner_id).all()
+                turn = db.query(models.User.current_turn).filter(models.User.id == owner_id).scalar() or 0
+                sampler = ClassSampler(rows, turn)
+                self._samplers[owner_id] = sampler
+            return sampler
+
+    def update_many(self, owner_id, students):
+        # students: anything with id/stars/pick_count/immune_until_turn attributes
+        with self.lock_for(owner_id):
+            sampler = self._samplers.get(owner_id)
+            if sampler is not None:
+                for s in students:
+                    sampler.update(s.id, s.stars, s.pick_count, s.immune_until_turn)
+
+    def advance(self, owner_id, turn):
+        with self.lock_for(owner_id):
+            sampler = self._samplers.get(owner_id)
+            if sampler is not None:
+                sampler.advance(turn)
+
+    def remove(self, owner_id, student_id):
+        with self.lock_for(owner_id):
+            sampler = self._samplers.get(owner_id)
+            if sampler is not None:
+                sampler.remove(student_id)
+
+    def invalidate(self, owner_id):
+        with self.lock_for(owner_id):
+            self._samplers.pop(owner_id, None)
+
+
+samplers = SamplerRegistry()
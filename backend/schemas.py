@@ -1,5 +1,8 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field, computed_field, field_validator
+from typing import Optional, List, Dict, Any
+from datetime import datetime
+
+import card_images
 
 class StudentBase(BaseModel):
     name: str
@@ -14,10 +17,54 @@ class StudentCreate(StudentBase):
 
 class Student(StudentBase):
     id: int
+    immune_until_turn: int = 0 # immunity = max(0, immune_until_turn - class turn)
+
+    class Config:
+        from_attributes = True
+
+class StarDelta(BaseModel):
+    # Target selector: explicit ids, a dorm, or (neither) the whole class
+    delta: int
+    dorm_number: Optional[str] = None
+    student_ids: Optional[List[int]] = None
+    reason: str = "adjust" # Recorded in the star ledger (answer, manual, card, ...)
+
+class StudentUpdate(BaseModel):
+    # Partial update: only the fields sent are written
+    name: Optional[str] = None
+    dorm_number: Optional[str] = None
+    stars: Optional[int] = None
+    pick_count: Optional[int] = None
+    immunity: Optional[int] = None
+    is_cursed: Optional[bool] = None
+
+    # Omitting a field leaves it alone; only dorm_number may be cleared with null
+    @field_validator("name", "stars", "pick_count", "immunity", "is_cursed")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
+class StarEvent(BaseModel):
+    id: int
+    student_id: Optional[int] = None
+    dorm_number: Optional[str] = None
+    delta: int
+    reason: Optional[str] = None
+    card_id: Optional[int] = None
+    created_at: datetime
 
     class Config:
         from_attributes = True
 
+class StarTotal(BaseModel):
+    # One group of GET /stars/summary; the key not grouped on is None
+    dorm_number: Optional[str] = None
+    student_id: Optional[int] = None
+    stars: int
+    events: int
+
 class ItemCardBase(BaseModel):
     name: str
     description: str | None = None
@@ -29,6 +76,12 @@ class ItemCardBase(BaseModel):
 class ItemCard(ItemCardBase):
     id: int
 
+    @computed_field
+    @property
+    def images(self) -> Optional[Dict[str, Dict[str, str]]]:
+        # Resized, content-hashed variants: {"thumb"|"display": {"webp"|"jpg": url}}
+        return card_images.urls(self.image_path)
+
     class Config:
         from_attributes = True
 
@@ -43,6 +96,65 @@ class StudentItem(StudentItemBase):
     class Config:
         from_attributes = True
 
+class StudentItemStack(StudentItem):
+    # Stored form: `quantity` copies of one card
+    quantity: int
+
+class InventoryEntry(BaseModel):
+    student_id: int
+    item_card_id: int
+    count: int
+
+class Inventory(BaseModel):
+    # Whole-class inventory; each held card is listed once in `cards`
+    entries: List[InventoryEntry]
+    cards: List[ItemCard]
+
+class CardEffect(BaseModel):
+    # Resolved effect of a card; outcome holds the random picks to replay
+    student_id: int
+    card: ItemCard
+    outcome: Dict[str, Any] = {}
+    students: List[Student] = []
+
+class CardUseResult(CardEffect):
+    item_id: int
+
+class DrawnCard(ItemCard):
+    # Set for cards that take effect on draw instead of going to the inventory
+    effect: Optional[CardEffect] = None
+
+class StudentChanges(BaseModel):
+    # Delta since a cursor; pass `cursor` back as `since` next time.
+    # reset: the cursor was unknown (e.g. another database), so this is a full sync.
+    # Advancing a turn changes no rows; recompute immunity from `turn`.
+    cursor: int
+    reset: bool = False
+    turn: int = 0
+    students: List[Student] = []
+    removed_students: List[int] = []
+    items: List[StudentItemStack] = []
+    removed_items: List[int] = []
+
+class BatchDrawEntry(BaseModel):
+    student_id: int
+    count: int = Field(default=1, ge=1, le=100)
+    pool_type: str = "normal"
+
+class BatchDrawRequest(BaseModel):
+    draws: List[BatchDrawEntry]
+
+class BatchDrawResult(BaseModel):
+    student_id: int
+    card_ids: List[int]
+
+class BatchDrawResponse(BaseModel):
+    # Each drawn card is listed once in `cards`; results reference them by id
+    results: List[BatchDrawResult]
+    cards: List[ItemCard]
+    # Draw-time cards, applied in draw order (see effects.DRAW_EFFECTS)
+    effects: List[CardEffect] = []
+
 class UserBase(BaseModel):
     username: str
 
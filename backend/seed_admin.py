@@ -1,8 +1,6 @@
 from database import SessionLocal
 import models
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+from hashing import get_pwd_context
 
 def seed_admin_user():
     db = SessionLocal()
@@ -13,7 +11,7 @@ def seed_admin_user():
             db.commit()
             print("Deleted old admin")
         
-        hashed_pwd = pwd_context.hash("admin")
+        hashed_pwd = get_pwd_context().hash("admin")
         admin_user = models.User(username="admin", hashed_password=hashed_pwd, is_admin=True)
         db.add(admin_user)
         db.commit()
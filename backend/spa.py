@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from fastapi.responses import Response, FileResponse
+
+from versions import etag_matches
+
+# Serving of the built frontend (Vite's dist/) from the app itself, as the
+# packaged exe does. load() indexes the bundle once at startup: content
+# type, strong ETag and cache policy per file, plus the .br/.gz siblings
+# written by precompress() at build time (build_exe.py). Each request is
+# then a dict lookup and Accept-Encoding negotiation; files up to
+# SPA_MEMORY_MAX bytes are answered from memory without touching the disk.
+#
+# Vite puts content-hashed files under assets/, so those are immutable;
+# index.html and the other unhashed files are revalidated (no-cache + ETag).
+
+SPA_MEMORY_MAX = int(os.environ.get("SPA_MEMORY_MAX", str(512 * 1024)))
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE = {".html", ".js", ".mjs", ".css", ".svg", ".json", ".map", ".txt", ".xml", ".ico", ".webmanifest", ".wasm"}
+MIN_COMPRESS = 1024  # smaller files don't gain enough to be worth a variant
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))  # preference order
+# Windows can map .js to text/plain in the registry; browsers refuse such module scripts
+MEDIA_TYPES = {
+    ".html": "text/html", ".js": "text/javascript", ".mjs": "text/javascript", ".css": "text/css",
+    ".svg": "image/svg+xml", ".json": "application/json", ".webmanifest": "application/manifest+json",
+    ".wasm": "application/wasm",
+}
+
+
+def _compressible(name, size):
+    return os.path.splitext(name)[1].lower() in COMPRESSIBLE and size >= MIN_COMPRESS
+
+
+def _sources(dist_dir):
+    # (relative URL path, file path) of every bundle file, skipping compressed siblings
+    for root, _, files in os.walk(dist_dir):
+        for name in files:
+            if name.endswith((".br", ".gz")):
+                continue
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, dist_dir).replace(os.sep, "/"), path
+
+
+def precompress(dist_dir):
+    """Write .gz (and .br, with the brotli package) next to each compressible file.
+
+    Build-time step: maximum compression levels, which are too slow to run
+    per request. A variant that doesn't save at least 10% is not written.
+    """
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("brotli not installed; writing gzip variants only")
+    totals = {"files": 0, "raw": 0, "gzip": 0, "br": 0}
+    for _, path in _sources(dist_dir):
+        with open(path, "rb") as f:
+            data = f.read()
+        if not _compressible(path, len(data)):
+            continue
+        totals["files"] += 1
+        totals["raw"] += len(data)
+        variants = [("gzip", ".gz", gzip.compress(data, 9, mtime=0))]
+        if brotli is not None:
+            variants.append(("br", ".br", brotli.compress(data, quality=11)))
+        for encoding, suffix, compressed in variants:
+            if len(compressed) <= len(data) * 0.9:
+                with open(path + suffix, "wb") as f:
+                    f.write(compressed)
+                totals[encoding] += len(compressed)
+            else:
+                totals[encoding] += len(data)
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+    print(f"Precompressed {totals['files']} frontend files: {totals['raw']} bytes -> "
+          f"gzip {totals['gzip']}" + (f", brotli {totals['br']}" if brotli is not None else ""))
+    return totals
+
+
+class Variant:
+    __slots__ = ("path", "etag", "body")
+
+    def __init__(self, path, etag, body):
+        self.path = path
+        self.etag = etag
+        self.body = body  # None: served from disk
+
+
+class Asset:
+    __slots__ = ("media_type", "cache_control", "variants")
+
+    def __init__(self, media_type, cache_control):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.variants = {}  # encoding -> Variant; "identity" always present
+
+
+class SPA:
+    def __init__(self, dist_dir):
+        self.dist_dir = dist_dir
+        self.assets = {}  # URL path relative to the root -> Asset
+        self.index = None
+
+    def load(self):
+        assets, held = {}, 0
+        for rel, path in _sources(self.dist_dir):
+            with open(path, "rb") as f:
+                data = f.read()
+            ext = os.path.splitext(rel)[1].lower()
+            media_type = MEDIA_TYPES.get(ext) or mimetypes.guess_type(rel)[0] or "application/octet-stream"
+            asset = Asset(media_type, IMMUTABLE if rel.startswith("assets/") else REVALIDATE)
+            digest = hashlib.sha256(data).hexdigest()[:20]
+            asset.variants["identity"] = Variant(path, f'"{digest}"', data if len(data) <= SPA_MEMORY_MAX else None)
+            for encoding, suffix in ENCODINGS:
+                sibling = path + suffix
+                # A sibling older than its source is left over from an earlier build
+                if os.path.exists(sibling) and os.path.getmtime(sibling) >= os.path.getmtime(path):
+                    size = os.path.getsize(sibling)
+                    body = None
+                    if size <= SPA_MEMORY_MAX:
+                        with open(sibling, "rb") as f:
+                            body = f.read()
+                    asset.variants[encoding] = Variant(sibling, f'"{digest}-{encoding}"', body)
+            if "gzip" not in asset.variants and _compressible(rel, len(data)) and len(data) <= SPA_MEMORY_MAX:
+                # Not precompressed (e.g. a dev build): gzip once here rather than per request
+                asset.variants["gzip"] = Variant(None, f'"{digest}-gzip"', gzip.compress(data, 6, mtime=0))
+            held += sum(len(v.body) for v in asset.variants.values() if v.body is not None)
+            assets[rel] = asset
+        self.assets = assets
+        self.index = assets.get("index.html")
+        print(f"Indexed frontend bundle: {len(assets)} files, {held} bytes held in memory")
+
+    def response(self, full_path, request):
+        asset = self.assets.get(full_path)
+        if asset is None:
+            # A missing hashed asset is a stale page, not a client-side route
+            if full_path.startswith("assets/") or self.index is None:
+                return Response(status_code=404)
+            asset = self.index
+        encoding = negotiate(request.headers.get("accept-encoding", ""), asset.variants)
+        variant = asset.variants[encoding]
+        headers = {"ETag": variant.etag, "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), variant.etag):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if variant.body is not None:
+            return Response(variant.body, media_type=asset.media_type, headers=headers)
+        return FileResponse(variant.path, media_type=asset.media_type, headers=headers)
+
+
+def negotiate(accept_encoding, available):
+    """Best of `available` (br, then gzip) that Accept-Encoding allows; else identity."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = q
+    for encoding, _ in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
@@ -0,0 +1,103 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import update, insert, select, case, func, literal
+
+import models
+
+# Every change to Student.stars goes through this module. Each one appends the
+# actual (clamped) per-student change to star_events in the caller's
+# transaction, then updates the materialized total.
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def clamped_stars(delta):
+    # Stars never drop below 0 unless the student is cursed
+    new_stars = models.Student.stars + delta
+    return case((models.Student.is_cursed == True, new_stars), else_=func.max(0, new_stars))
+
+
+def _selection(owner_id, dorm_number=None, student_ids=None):
+    conditions = [models.Student.owner_id == owner_id]
+    if dorm_number is not None:
+        conditions.append(models.Student.dorm_number == dorm_number)
+    if student_ids is not None:
+        conditions.append(models.Student.id.in_(student_ids))
+    return conditions
+
+
+def _change_stars(db, conditions, new_stars, reason, card_id):
+    # Pending ORM edits (e.g. a cleared curse) must be visible to the clamp
+    db.flush()
+    # Ledger first, from the same rows and expression the UPDATE uses; the
+    # single writer connection means nothing can change them in between.
+    changed = conditions + [new_stars != models.Student.stars]
+    db.execute(insert(models.StarEvent).from_select(
+        ["student_id", "owner_id", "dorm_number", "delta", "reason", "card_id", "created_at"],
+        select(
+            models.Student.id, models.Student.owner_id, models.Student.dorm_number, new_stars - models.Student.stars,
+            literal(reason), literal(card_id, models.StarEvent.card_id.type),
+            literal(utcnow(), models.StarEvent.created_at.type),
+        ).where(*changed),
+    ))
+    stmt = update(models.Student).where(*conditions).values(stars=new_stars).returning(models.Student)
+    return db.scalars(stmt).all()
+
+
+def apply_star_delta(db, owner_id, delta, dorm_number=None, student_ids=None, reason="adjust", card_id=None):
+    """Add delta to the selected students of one class in a single UPDATE.
+
+    With no selector the whole class is targeted. Returns the updated
+    Student rows; the caller owns the transaction.
+    """
+    return _change_stars(db, _selection(owner_id, dorm_number, student_ids), clamped_stars(delta), reason, card_id)
+
+
+def set_stars(db, owner_id, student_ids, stars, reason="set", card_id=None):
+    # Absolute assignment (manual edit, 深渊凝视 reset); the ledger gets the difference
+    return _change_stars(db, _selection(owner_id, student_ids=student_ids), literal(stars), reason, card_id)
+
+
+def ledger_totals(owner_id=None, upto=None):
+    """Select (student_id, stars) recomputed from snapshot + later events."""
+    later = select(func.coalesce(func.sum(models.StarEvent.delta), 0)).where(
+        models.StarEvent.student_id == models.Student.id,
+        models.StarEvent.id > func.coalesce(models.StarSnapshot.last_event_id, 0),
+    )
+    if upto is not None:
+        later = later.where(models.StarEvent.id <= upto)
+    total = func.coalesce(models.StarSnapshot.stars, 0) + later.scalar_subquery()
+    query = select(models.Student.id, total.label("stars")).outerjoin(
+        models.StarSnapshot, models.StarSnapshot.student_id == models.Student.id
+    )
+    if owner_id is not None:
+        query = query.where(models.Student.owner_id == owner_id)
+    return query
+
+
+def take_star_snapshots(db):
+    """Fold all events so far into star_snapshots; returns the last event id covered.
+
+    Snapshots are derived from the ledger, not copied from Student.stars, so
+    drift in the materialized totals stays detectable by verify_stars().
+    """
+    upto = db.query(func.max(models.StarEvent.id)).scalar() or 0
+    totals = ledger_totals(upto=upto).subquery()
+    db.execute(insert(models.StarSnapshot).prefix_with("OR REPLACE").from_select(
+        ["student_id", "stars", "last_event_id", "taken_at"],
+        select(totals.c.id, totals.c.stars, literal(upto), literal(utcnow(), models.StarSnapshot.taken_at.type)),
+    ))
+    return upto
+
+
+def verify_stars(db, owner_id=None):
+    """Students whose materialized stars disagree with the ledger: [(id, stars, ledger)]."""
+    totals = ledger_totals(owner_id).subquery()
+    rows = db.execute(
+        select(models.Student.id, models.Student.stars, totals.c.stars)
+        .join(totals, totals.c.id == models.Student.id)
+        .where(models.Student.stars != totals.c.stars)
+    )
+    return [tuple(row) for row in rows]
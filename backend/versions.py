@@ -0,0 +1,46 @@
+import os
+import threading
+
+
+class ClassVersions:
+    """Per-class write counters used as ETag validators.
+
+    Write handlers bump a class after their commit; read handlers take the
+    version before they query. A tag can therefore be older than the data it
+    labels but never newer, so a 304 is never sent for stale data.
+
+    Counters live in process memory. `boot` is part of every tag, so after a
+    restart no pre-restart tag can match.
+    """
+
+    def __init__(self):
+        self.boot = os.urandom(4).hex()
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def get(self, owner_id):
+        with self._lock:
+            return self._versions.get(owner_id, 0)
+
+    def bump(self, owner_id):
+        # Never reset: SQLite may hand a deleted user's id to a new account
+        with self._lock:
+            version = self._versions[owner_id] = self._versions.get(owner_id, 0) + 1
+            return version
+
+    def etag(self, *parts):
+        return '"' + "-".join(str(p) for p in (self.boot, *parts)) + '"'
+
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match uses weak comparison: "*", or any listed tag with W/ ignored
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+versions = ClassVersions()
@@ -22,12 +22,41 @@ import DestinyRouletteEffect from './components/DestinyRouletteEffect';
 import ChainLightningEffect from './components/ChainLightningEffect';
 import RouletteEffect from './components/RouletteEffect';
 import { RARITY_CONFIG } from './constants';
-import { Student, RarityLevel, Stats, ItemCard as ItemCardType, StudentItem } from './types';
+import { Student, RarityLevel, Stats, ItemCard as ItemCardType, StudentItem, CardEffect, CardUseResult, DrawnCard } from './types';
 import ItemCard from './components/ItemCard';
 import Login from './components/Login';
 import AdminPanel from './components/AdminPanel';
 import { playSound } from './utils/sound';
 
+// Animation (and sound) per card, keyed like the server's effects (spaces removed, lowercase).
+// Effects are resolved on the server; the animations only replay their outcome.
+const CARD_ANIMATIONS: Record<string, { effect: string; sound?: string }> = {
+  "绝对防御": { effect: "shield", sound: "绝对防御" },
+  "标记目标": { effect: "mark_target", sound: "标记目标" },
+  "经验药水": { effect: "exp_potion", sound: "经验药水" },
+  "军团荣耀": { effect: "legion_glory" },
+  "暗影突袭": { effect: "shadow_raid", sound: "暗影突袭" },
+  "狂战士试炼": { effect: "berserker_trial", sound: "狂战士试炼" },
+  "法力汲取": { effect: "mana_drain", sound: "法力汲取" },
+  "潜行斗篷": { effect: "stealth_cloak", sound: "隐身" },
+  "结界：庇护所": { effect: "sanctuary", sound: "结界：庇护所" },
+  "普渡众生": { effect: "universal_salvation", sound: "普渡众生" },
+  "净化术": { effect: "purification", sound: "净化术" },
+  "深渊凝视": { effect: "abyssal_gaze", sound: "深渊凝视" },
+  "皇城pk": { effect: "royal_pk", sound: "皇城PK" },
+  "命运轮盘": { effect: "destiny_roulette" },
+  // These take effect when drawn
+  "群体沉默": { effect: "mass_silence", sound: "群体沉默" },
+  "末日审判": { effect: "doomsday", sound: "末日审判" },
+  "黑暗诅咒": { effect: "dark_curse", sound: "黑暗诅咒" },
+  "一夫当关": { effect: "one_man_guard" },
+  "连锁闪电": { effect: "chain_lightning", sound: "连锁闪电" },
+};
+// Cards without an animation that still announce themselves
+const CARD_NOTICES = ["生命圣水", "吟游诗人", "boss挑战券"];
+
+const normalizeCardName = (name: string) => name.replace(/\s+/g, "").toLowerCase();
+
 export default function App() {
   // --- State ---
   // Initialize from localStorage or fallback to default
@@ -82,7 +111,68 @@ export default function App() {
     }
   }, [token, isAdmin]);
 
+  // Live class events: other screens on this class (and our own writes) arrive as diffs
+  useEffect(() => {
+    if (!token || isAdmin) return;
+    let source: EventSource | null = null;
+    let retry: ReturnType<typeof setTimeout> | undefined;
+    let closed = false;
+
+    // Streams authenticate with a one-time ticket (never the token in the URL),
+    // so reconnects are ours: a new ticket each time instead of EventSource's retry
+    const connect = async () => {
+      try {
+        const res = await authFetch(`${API_URL}/events/ticket`, { method: 'POST' });
+        if (!res.ok) throw new Error(`ticket: ${res.status}`);
+        const { ticket } = await res.json();
+        if (closed) return;
+        source = new EventSource(`${API_URL}/events?ticket=${encodeURIComponent(ticket)}`);
+        source.onmessage = onMessage;
+        source.onerror = () => {
+          source?.close();
+          if (!closed) retry = setTimeout(connect, 3000);
+        };
+      } catch (error) {
+        if (!closed) retry = setTimeout(connect, 3000);
+      }
+    };
 
+    const onMessage = (message: MessageEvent) => {
+      const event = JSON.parse(message.data);
+      if (event.type === 'resync') {
+        // Sent on (re)connect and when we fell behind; cheap thanks to the ETag
+        fetchStudents();
+      } else if (event.students) {
+        const changed = new Map<number, Student>(event.students.map((s: any) => [s.id, toStudent(s)]));
+        const apply = (s: Student): Student => changed.get(s.id) ?? s;
+        setStudents(prev => prev.map(apply));
+        setManualSelection(prev => prev ? apply(prev) : prev);
+      } else if (event.type === 'students_removed') {
+        setStudents(prev => prev.filter(s => !event.student_ids.includes(s.id)));
+      } else if (event.type === 'turn_advanced') {
+        setStudents(prev => prev.map(s => s.immunity > 0 ? { ...s, immunity: s.immunity - 1 } : s));
+      }
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      source?.close();
+    };
+  }, [token, isAdmin]);
+
+
+
+  const toStudent = (s: any): Student => ({
+    id: s.id,
+    name: s.name,
+    dormNumber: s.dorm_number,
+    stars: s.stars,
+    pickCount: s.pick_count,
+    immunity: s.immunity || 0,
+    isCursed: s.is_cursed || false
+  });
 
   const fetchStudents = async () => {
     if (!token) return;
@@ -90,16 +180,7 @@ export default function App() {
       const response = await authFetch(`${API_URL}/students`);
       if (response.ok) {
         const data = await response.json();
-        const mappedStudents = data.map((s: any) => ({
-          id: s.id,
-          name: s.name,
-          dormNumber: s.dorm_number,
-          stars: s.stars,
-          pickCount: s.pick_count,
-          immunity: s.immunity || 0,
-          isCursed: s.is_cursed || false
-        }));
-        setStudents(mappedStudents);
+        setStudents(data.map(toStudent));
       }
     } catch (error) {
       console.error("Failed to fetch students:", error);
@@ -121,13 +202,12 @@ export default function App() {
   const [previewItem, setPreviewItem] = useState<StudentItem | null>(null);
   const [isInteractionComplete, setIsInteractionComplete] = useState(false);
   const [activeEffect, setActiveEffect] = useState<string | null>(null);
-  const [pendingItemId, setPendingItemId] = useState<number | null>(null);
+  const [cardEffect, setCardEffect] = useState<CardEffect | null>(null);
 
   // Roulette State
   const [showRoulette, setShowRoulette] = useState(false);
   const [rouletteItems, setRouletteItems] = useState<ItemCardType[]>([]);
-  const [pendingDrawnItem, setPendingDrawnItem] = useState<ItemCardType | null>(null);
-  const [pkOpponent, setPkOpponent] = useState<Student | null>(null);
+  const [pendingDrawnItem, setPendingDrawnItem] = useState<DrawnCard | null>(null);
 
   const [chainPath, setChainPath] = useState<{ student: Student; status: 'hit' | 'miss' }[]>([]);
   const [pendingTargetStudentId, setPendingTargetStudentId] = useState<number | null>(null);
@@ -136,27 +216,26 @@ export default function App() {
   const fileInputRef = useRef<HTMLInputElement>(null);
 
   // --- Persistence ---
-  const updateStudentOnBackend = async (student: Student) => {
+  // Class-wide star change in one request (whole class, a dorm, or explicit ids)
+  const applyBulkStarChange = async (delta: number, target: { dorm_number?: string; student_ids?: number[] } = {}, reason: string = 'card') => {
     try {
-      // Map back to snake_case for backend
-      const payload = {
-        name: student.name,
-        dorm_number: student.dormNumber,
-        stars: student.stars,
-        pick_count: student.pickCount,
-        immunity: student.immunity,
-        is_cursed: student.isCursed
-      };
-
-      await authFetch(`${API_URL}/students/${student.id}`, {
-        method: 'PUT',
+      const res = await authFetch(`${API_URL}/students/bulk`, {
+        method: 'PATCH',
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify(payload),
+        body: JSON.stringify({ delta, reason, ...target }),
       });
+      if (res.ok) {
+        const updated: any[] = await res.json();
+        const starsById = new Map<number, number>(updated.map(s => [s.id, s.stars]));
+        const apply = (s: Student): Student => starsById.has(s.id) ? { ...s, stars: starsById.get(s.id)! } : s;
+        setStudents(prev => prev.map(apply));
+        setDrawnStudent(prev => prev ? apply(prev) : prev);
+        setManualSelection(prev => prev ? apply(prev) : prev);
+      }
     } catch (error) {
-      console.error("Failed to update student:", error);
+      console.error("Failed to apply bulk star change:", error);
     }
   };
 
@@ -222,68 +301,11 @@ export default function App() {
     const item = pendingDrawnItem;
     const studentId = pendingTargetStudentId;
 
-    if (item.name === "群体沉默") {
-      setDrawnItem(item);
-      setActiveEffect("mass_silence");
-      fetchStudentItems(studentId);
-      playSound("群体沉默");
-    } else if (item.name === "末日审判") {
-      setDrawnItem(item);
-      setActiveEffect("doomsday");
-      fetchStudentItems(studentId);
-      playSound("末日审判");
-    } else if (item.name === "黑暗诅咒") {
-      setDrawnItem(item);
-      setActiveEffect("dark_curse");
-      fetchStudentItems(studentId);
-      playSound("黑暗诅咒");
-    } else if (item.name === "一夫当关") {
-      setDrawnItem(item);
-      setActiveEffect("one_man_guard");
-      fetchStudentItems(studentId);
-    } else if (item.name === "连锁闪电") {
-      setDrawnItem(item);
-      // Calculate chain immediately
-      const initialTarget = students.find(s => s.id === studentId);
-      if (initialTarget) {
-        let currentPool = students.filter(s => s.id !== initialTarget.id);
-        let path = [];
-        let currentTarget = initialTarget;
-        let jumps = 0;
-        let isHit = false;
-
-        // First step (Self)
-        // 50% chance
-        if (Math.random() < 0.5) {
-          path.push({ student: currentTarget, status: 'hit' });
-          isHit = true;
-        } else {
-          path.push({ student: currentTarget, status: 'miss' });
-        }
-
-        // Jumps
-        while (!isHit && jumps < 3 && currentPool.length > 0) {
-          jumps++;
-          // Pick next random
-          const nextIndex = Math.floor(Math.random() * currentPool.length);
-          currentTarget = currentPool[nextIndex];
-          // Remove from pool to avoid duplicates
-          currentPool.splice(nextIndex, 1);
-
-          if (Math.random() < 0.5) {
-            path.push({ student: currentTarget, status: 'hit' as const });
-            isHit = true;
-          } else {
-            path.push({ student: currentTarget, status: 'miss' as const });
-          }
-        }
-        setChainPath(path);
-        setActiveEffect("chain_lightning");
-        playSound("连锁闪电");
-      }
-      fetchStudentItems(studentId);
+    setDrawnItem(item);
+    if (item.effect) {
+      // Took effect on the server as it was drawn; it never reaches the inventory
+      playCardEffect(item.effect);
     } else {
-      setDrawnItem(item);
       setShowItemModal(true);
       fetchStudentItems(studentId);
     }
@@ -292,410 +314,85 @@ export default function App() {
     setPendingTargetStudentId(null);
   };
 
-  const executeUseItem = async (itemId: number) => {
-    try {
-      const res = await authFetch(`${API_URL}/student_items/${itemId}`, { method: 'DELETE' });
-      if (res.ok) {
-        setStudentItems(prev => prev.filter(i => i.id !== itemId));
-      }
-    } catch (error) {
-      console.error("Failed to use item:", error);
-    }
-  };
-
-  const useItem = async (studentItem: StudentItem) => {
-    console.log("Using item:", studentItem.item_card.name, "ID:", studentItem.item_card.id);
-    if (!window.confirm("确认使用这张卡片吗？使用后将销毁。")) return;
-
-    if (studentItem.item_card.name === "绝对防御") {
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("shield");
-      playSound("绝对防御");
-    } else if (studentItem.item_card.name === "标记目标") {
-      // Logic for "Mark Target":
-      // 1. Trigger Effect UI (Random Shuffle)
-      // 2. Effect calls back with new student
-      // 3. We REPLACE the currently drawn student with this new one
-      // 4. Then we consume the item.
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("mark_target");
-      playSound("标记目标");
-    } else if (studentItem.item_card.name === "经验药水") {
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("exp_potion");
-      playSound("经验药水");
-    } else if (studentItem.item_card.name === "军团荣耀") {
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("legion_glory");
-    } else if (studentItem.item_card.name === "暗影突袭") {
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("shadow_raid");
-      playSound("暗影突袭");
-    } else if (studentItem.item_card.name === "狂战士试炼") {
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("berserker_trial");
-      playSound("狂战士试炼");
-    } else if (studentItem.item_card.name === "法力汲取") {
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("mana_drain");
-      playSound("法力汲取");
-    } else if (studentItem.item_card.name === "潜行斗篷") {
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("stealth_cloak");
-      playSound("隐身");
-    } else if (studentItem.item_card.name === "结界：庇护所") {
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("sanctuary");
-      playSound("结界：庇护所");
-    } else if (studentItem.item_card.name === "普渡众生") {
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("universal_salvation");
-      playSound("普渡众生");
-    } else if (studentItem.item_card.name === "净化术") {
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("purification");
-      playSound("净化术");
-    } else if (studentItem.item_card.name === "生命圣水") {
-      await executeUseItem(studentItem.id);
-      setPreviewItem(null);
-      playSound("生命圣水");
-      alert("使用了生命圣水！");
-    } else if (studentItem.item_card.name === "吟游诗人") {
-      await executeUseItem(studentItem.id);
-      setPreviewItem(null);
-      playSound("吟游诗人");
-      alert("使用了吟游诗人！");
-    } else if (studentItem.item_card.name.toLowerCase() === "boss挑战券") {
-      await executeUseItem(studentItem.id);
-      setPreviewItem(null);
-      playSound("boss挑战券");
-      alert("使用了boss挑战券！");
-    } else if (studentItem.item_card.name === "深渊凝视") {
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("abyssal_gaze");
-      playSound("深渊凝视");
-    } else if (studentItem.item_card.name === "皇城PK") {
-      console.log("Triggering Royal PK");
-      // Pick random opponent
-      const otherStudents = students.filter(s => s.id !== studentItem.student_id);
-      console.log("Opponent pool size:", otherStudents.length);
-
-      if (otherStudents.length > 0) {
-        const opponent = otherStudents[Math.floor(Math.random() * otherStudents.length)];
-        console.log("Selected opponent:", opponent.name);
-        setPkOpponent(opponent);
-        setPreviewItem(null);
-        setPendingItemId(studentItem.id);
-        setActiveEffect("royal_pk");
-        playSound("皇城PK");
-      } else {
-        alert("没有对手！");
-      }
-    } else if (studentItem.item_card.name === "命运轮盘") {
-      setPreviewItem(null);
-      setPendingItemId(studentItem.id);
-      setActiveEffect("destiny_roulette");
-    } else {
-      await executeUseItem(studentItem.id);
-      setPreviewItem(null);
-      alert("卡片已使用！");
-    }
+  // Students a card changed; the class event stream delivers them too, this keeps the
+  // acting screen in step with its animation when the stream lags or is down
+  const applyChangedStudents = (changed: any[]) => {
+    const byId = new Map<number, Student>(changed.map(s => [s.id, toStudent(s)]));
+    const apply = (s: Student): Student => byId.get(s.id) ?? s;
+    setStudents(prev => prev.map(apply));
+    setDrawnStudent(prev => prev ? apply(prev) : prev);
+    setManualSelection(prev => prev ? apply(prev) : prev);
   };
 
-  const handleEffectComplete = async (payload?: any) => {
-    if (activeEffect === "mark_target" && payload) {
-      setDrawnStudent(payload);
-      fetchStudentItems(payload.id);
-    }
-
-    if (activeEffect === "exp_potion") {
-      if (drawnStudent) {
-        handleManualStarChange(drawnStudent.id, 1);
-      } else if (manualSelection) {
-        handleManualStarChange(manualSelection.id, 1);
-      }
-    }
-
-    if (activeEffect === "mass_silence") {
-      if (drawnStudent && drawnStudent.dormNumber) {
-        // Find all students in same dorm
-        const dormMates = students.filter(s => s.dormNumber === drawnStudent.dormNumber);
-
-        // Deduct 1 star for each (min 0)
-        // We use loop to update backend for each
-        // Note: Parallel requests might be heavy? But it's small scale.
-        dormMates.forEach(mate => {
-          handleManualStarChange(mate.id, -1);
-        });
-      }
-
-      // Try to delete the silence card from inventory if it exists
-      // We need to find the student_item id.
-      // Since we refreshed inventory in drawItem, studentItems should have it?
-      // Wait, handleEffectComplete is called AFTER invalidation? 
-      // studentItems state might not be updated immediately in this closure if we didn't wait.
-      // But for visual effect duration (3.5s) it should be enough time for state update / refetch.
-      // Actually state updates are async.
-      // Let's just re-fetch in drawItem and hope it is here.
-      // Or we can just do a precise search.
-
-      // Simplest strategy: Fetch items again, find "群体沉默", delete it.
-      // We use the API directly to avoid state dependency issues if possible, or use current state.
-      if (drawnStudent) {
-        try {
-          const res = await authFetch(`${API_URL}/students/${drawnStudent.id}/items`);
-          if (res.ok) {
-            const items: StudentItem[] = await res.json();
-            const silenceItem = items.find(i => i.item_card.name === "群体沉默");
-            if (silenceItem) {
-              await executeUseItem(silenceItem.id);
-            }
-          }
-        } catch (e) { console.error(e); }
-      }
-    }
-
-    if (activeEffect === "doomsday") {
-      // Deduct 1 star from EVERYONE
-      students.forEach(s => {
-        handleManualStarChange(s.id, -1);
-      });
-
-      // Try to delete item from inventory (similar logic to mass silence)
-      if (drawnStudent) {
-        try {
-          const res = await authFetch(`${API_URL}/students/${drawnStudent.id}/items`);
-          if (res.ok) {
-            const items: StudentItem[] = await res.json();
-            const doomItem = items.find(i => i.item_card.name === "末日审判");
-            if (doomItem) {
-              await executeUseItem(doomItem.id);
-            }
-          }
-        } catch (e) { console.error(e); }
-      }
-    }
-
-    if (activeEffect === "legion_glory") {
-      const student = drawnStudent || manualSelection;
-      if (student && student.dormNumber) {
-        const dormMates = students.filter(s => s.dormNumber === student.dormNumber);
-        dormMates.forEach(mate => {
-          handleManualStarChange(mate.id, 1);
-        });
-      }
-    }
-
-    if (activeEffect === "shadow_raid" && payload) {
-      // Payload is the victim student
-      handleManualStarChange(payload.id, -1);
-    }
-
-    if (activeEffect === "berserker_trial" && payload) {
-      // Payload is the winner student
-      handleManualStarChange(payload.id, 1);
-    }
-
-    if (activeEffect === "mana_drain" && payload) {
-      // Payload: { success: boolean, target: Student }
-      // We also need the USER (drawnStudent or manualSelection)
-      // Priority: If manual modal is open (manualSelection), use that. Otherwise use drawnStudent.
-      const user = manualSelection || drawnStudent;
-      if (!user) return; // Should not happen
-
-      if (payload.success) {
-        // Success: Target -2, User +2
-        handleManualStarChange(payload.target.id, -2);
-        handleManualStarChange(user.id, 2);
+  const findStudent = (id?: number | null) => students.find(s => s.id === id) ?? null;
+  const cardUser = findStudent(cardEffect?.student_id);
+
+  // Replay a card the server resolved: its animation, or a notice for cards without one
+  const playCardEffect = (effect: CardEffect) => {
+    const name = normalizeCardName(effect.card.name);
+    const animation = CARD_ANIMATIONS[name];
+    // Duels need both sides on screen; without them there is nothing to replay
+    const playable = !!findStudent(effect.student_id)
+      && (animation?.effect !== "royal_pk" || !!findStudent(effect.outcome.opponent_id));
+    if (!animation || !playable) {
+      applyChangedStudents(effect.students);
+      if (CARD_NOTICES.includes(name)) {
+        playSound(name);
+        alert(`使用了${name}！`);
       } else {
-        // Fail: User -1
-        handleManualStarChange(user.id, -1);
+        alert("卡片已使用！");
       }
+      return;
     }
-
-    // Stealth Cloak logic
-    if (activeEffect === "stealth_cloak") {
-      const user = drawnStudent || manualSelection;
-      if (user) {
-        try {
-          await authFetch(`${API_URL}/students/${user.id}/immunity?immunity=3`, { method: 'PUT' });
-          // We delay fetch just a bit or assume handleDraw next time will get fresh data
-        } catch (e) { console.error(e); }
-      }
+    if (animation.effect === "chain_lightning") {
+      setChainPath((effect.outcome.path ?? []).flatMap((step: { student_id: number; status: 'hit' | 'miss' }) => {
+        const student = findStudent(step.student_id);
+        return student ? [{ student, status: step.status }] : [];
+      }));
     }
+    setCardEffect(effect);
+    setActiveEffect(animation.effect);
+    if (animation.sound) playSound(animation.sound);
+  };
 
-    // Sanctuary logic
-    if (activeEffect === "sanctuary") {
-      const user = drawnStudent || manualSelection;
-      if (user && user.dormNumber) {
-        const dormMates = students.filter(s => s.dormNumber === user.dormNumber);
-        for (const mate of dormMates) {
-          const newImmunity = Math.max(mate.immunity || 0, 1);
-          try {
-            await authFetch(`${API_URL}/students/${mate.id}/immunity?immunity=${newImmunity}`, { method: 'PUT' });
-          } catch (e) { console.error(e); }
-        }
-      }
+  const useItem = async (studentItem: StudentItem) => {
+    if (!window.confirm("确认使用这张卡片吗？使用后将销毁。")) return;
+    if (normalizeCardName(studentItem.item_card.name) === "皇城pk" && !students.some(s => s.id !== studentItem.student_id)) {
+      alert("没有对手！");
+      return;
     }
 
-
-    // Universal Salvation
-    if (activeEffect === "universal_salvation") {
-      students.forEach(s => {
-        handleManualStarChange(s.id, 1);
+    try {
+      // The server consumes the card and applies its whole effect in one transaction
+      const res = await authFetch(`${API_URL}/student_items/${studentItem.id}/use`, { method: 'POST' });
+      if (!res.ok) throw new Error(`use: ${res.status}`);
+      const result: CardUseResult = await res.json();
+      // Copies of a stacked card share its id; only one of them was used
+      setStudentItems(prev => {
+        const index = prev.findIndex(i => i.id === result.item_id);
+        return index === -1 ? prev : [...prev.slice(0, index), ...prev.slice(index + 1)];
       });
+      setPreviewItem(null);
+      playCardEffect(result);
+    } catch (error) {
+      console.error("Failed to use item:", error);
     }
+  };
 
-    // Dark Curse Logic
-    if (activeEffect === "dark_curse") {
-      const user = drawnStudent || manualSelection;
-      if (user) {
-        // Update local state first to feel responsive? Or wait for backend.
-        // Let's optimistic update.
-        setStudents(prev => prev.map(s => s.id === user.id ? { ...s, isCursed: true } : s));
-
-        // Call Backend
-        // We need a specific endpoint or just update student.
-        // Using updateStudentOnBackend might check existing state? 
-        // `updateStudentOnBackend` takes a `Student` object.
-        // We can construct it.
-        const updatedUser = { ...user, isCursed: true };
-        updateStudentOnBackend(updatedUser);
-
-        // Remove "Dark Curse" item from inventory immediately
-        try {
-          const res = await authFetch(`${API_URL}/students/${user.id}/items`);
-          if (res.ok) {
-            const items: StudentItem[] = await res.json();
-            const curseItem = items.find(i => i.item_card.name === "黑暗诅咒");
-            if (curseItem) {
-              await executeUseItem(curseItem.id);
-            }
-          }
-        } catch (e) { console.error(e); }
-      }
-    }
-
-    // Purification Logic
-    if (activeEffect === "purification") {
-      const user = drawnStudent || manualSelection;
-      if (user) {
-        let newStars = user.stars;
-        if (newStars < 0) newStars = 0;
-
-        const updatedUser = {
-          ...user,
-          isCursed: false,
-          stars: newStars
-        };
-
-        // Optimistic update
-        setStudents(prev => prev.map(s => s.id === user.id ? updatedUser : s));
-        if (drawnStudent && drawnStudent.id === user.id) setDrawnStudent(updatedUser);
-        if (manualSelection && manualSelection.id === user.id) setManualSelection(updatedUser);
-
-        updateStudentOnBackend(updatedUser);
-      }
-    }
-
-    // Abyssal Gaze Logic
-    if (activeEffect === "abyssal_gaze") {
-      const user = drawnStudent || manualSelection;
-      const isSuccess = payload === true; // payload passed from effect
-      if (user) {
-        if (isSuccess) {
-          // Success: +3 Stars
-          handleManualStarChange(user.id, 3);
-        } else {
-          // Fail: Reset to 0
-          const updatedUser = { ...user, stars: 0 };
-          setStudents(prev => prev.map(s => s.id === user.id ? updatedUser : s));
-          if (drawnStudent && drawnStudent.id === user.id) setDrawnStudent(updatedUser);
-          if (manualSelection && manualSelection.id === user.id) setManualSelection(updatedUser);
-          updateStudentOnBackend(updatedUser);
-
-
-        }
-      }
-    }
-
-    // One Man Guard Logic
-    if (activeEffect === "one_man_guard") {
-      const user = drawnStudent || manualSelection;
-      if (user) {
-        // Apply single target penalty
-        handleManualStarChange(user.id, -1);
-
-        // Remove item from inventory
-        try {
-          const res = await authFetch(`${API_URL}/students/${user.id}/items`);
-          if (res.ok) {
-            const items: StudentItem[] = await res.json();
-            const guardItem = items.find(i => i.item_card.name === "一夫当关");
-            if (guardItem) {
-              await executeUseItem(guardItem.id);
-            }
-          }
-        } catch (e) { console.error(e); }
-      }
-    }
-
-    // Royal PK Logic
-    if (activeEffect === "royal_pk") {
-      const user = drawnStudent || manualSelection;
-      // payload is winnerId
-      if (user && payload === user.id) {
-        handleManualStarChange(user.id, 1);
-      }
-      setPkOpponent(null);
-    }
-
-    // Destiny Roulette Logic
-    if (activeEffect === "destiny_roulette" && payload) {
-      const user = drawnStudent || manualSelection;
-      if (user) {
-        if (payload === 'angel') {
-          handleManualStarChange(user.id, 10);
-        } else {
-          handleManualStarChange(user.id, -1);
+  const handleEffectComplete = () => {
+    if (cardEffect) {
+      applyChangedStudents(cardEffect.students);
+      if (activeEffect === "mark_target") {
+        // The marked student replaces the one on stage
+        const target = findStudent(cardEffect.outcome.target_id);
+        if (target) {
+          setDrawnStudent(target);
+          fetchStudentItems(target.id);
         }
       }
     }
-
-
-
-
-    // Chain Lightning Logic
-    if (activeEffect === "chain_lightning") {
-      chainPath.forEach(step => {
-        if (step.status === 'hit') {
-          handleManualStarChange(step.student.id, -2);
-        }
-      });
-      setChainPath([]);
-    }
-
-    // If item was used from inventory (pendingItemId is set)
-    if (pendingItemId) {
-      await executeUseItem(pendingItemId);
-      setPendingItemId(null);
-    }
-
-    // Always refresh students to get backend updates (stars, immunity, inventory items if needed)
-    setTimeout(fetchStudents, 500);
-
+    setCardEffect(null);
+    setChainPath([]);
     setActiveEffect(null);
   };
 
@@ -725,8 +422,8 @@ export default function App() {
 
       if (response.ok) {
         const result = await response.json();
-        alert(`导入成功！共 ${result.count} 条数据。\nImport successful!`);
-        fetchStudents();
+        alert(`导入成功！共 ${result.count} 条数据（新增 ${result.inserted}，保留 ${result.updated}，移除 ${result.removed}）。\nImport successful!`);
+        // The import publishes a resync on the event stream, which refetches the roster
       } else {
         const err = await response.json();
         alert(`导入失败: ${err.detail}\nImport failed.`);
@@ -739,8 +436,8 @@ export default function App() {
 
   // --- Logic ---
 
-  // Gacha algorithm
-  const handleDraw = () => {
+  // Gacha algorithm (weighted pick + pick_count bump happen on the server)
+  const handleDraw = async () => {
     if (isDrawing) return;
     setIsDrawing(true);
     setShowResult(false);
@@ -750,31 +447,27 @@ export default function App() {
     setIsInteractionComplete(false);
     playSound('roll');
 
-    // 1. Priority Pool: Never picked students AND NOT IMMUNE
-    const neverPicked = students.filter(s => s.pickCount === 0 && (!s.immunity || s.immunity <= 0));
-
-    let targetId: number;
-
-    if (neverPicked.length > 0) {
-      // Pure random from unpicked
-      const randomIndex = Math.floor(Math.random() * neverPicked.length);
-      targetId = neverPicked[randomIndex].id;
-    } else {
-      // 2. Weighted Pool: Lower stars = Higher weight, exclude immune
-      // Weight formula: 60 / (stars + 1)
-      let weightedPool: number[] = [];
-      students.filter(s => !s.immunity || s.immunity <= 0).forEach(student => {
-        const weight = Math.floor(60 / (Math.max(0, student.stars) + 1));
-        for (let i = 0; i < weight; i++) {
-          weightedPool.push(student.id);
-        }
-      });
-      const randomIndex = Math.floor(Math.random() * weightedPool.length);
-      targetId = weightedPool[randomIndex];
+    let selected: Student | null = null;
+    try {
+      const res = await authFetch(`${API_URL}/draw_student`, { method: 'POST' });
+      if (res.ok) {
+        const s = await res.json();
+        selected = {
+          id: s.id,
+          name: s.name,
+          dormNumber: s.dorm_number,
+          stars: s.stars,
+          pickCount: s.pick_count,
+          immunity: s.immunity || 0,
+          isCursed: s.is_cursed || false
+        };
+        const picked = selected;
+        setStudents(prev => prev.map(st => st.id === picked.id ? picked : st));
+      }
+    } catch (error) {
+      console.error("Failed to draw student:", error);
     }
 
-    const selected = students.find(s => s.id === targetId);
-
     // Animation Sequence
     setTimeout(() => {
       if (selected) {
@@ -802,25 +495,10 @@ export default function App() {
   const handleUpdateStats = (starChange: number) => {
     if (!drawnStudent) return;
 
-    setStudents(prev => prev.map(s => {
-      if (s.id === drawnStudent.id) {
-        // Calculate new stars
-        // If student is cursed, allow negative. Else clamp at 0.
-        let newStars = s.stars + starChange;
-        if (!s.isCursed) {
-          newStars = Math.max(0, newStars);
-        }
-
-        const updatedStudent = {
-          ...s,
-          pickCount: s.pickCount + 1,
-          stars: newStars
-        };
-        updateStudentOnBackend(updatedStudent); // Sync backend
-        return updatedStudent;
-      }
-      return s;
-    }));
+    // Atomic increment on the server (clamped at 0 unless cursed); pickCount was already bumped by /draw_student
+    if (starChange !== 0) {
+      applyBulkStarChange(starChange, { student_ids: [drawnStudent.id] }, 'answer');
+    }
 
     if (starChange > 0) {
       playSound('success_roll'); // Correct answer sound
@@ -849,8 +527,8 @@ export default function App() {
 
     // Advance Turn logic: Decrement immunity for everyone
     // We do this after interaction is complete (user response recorded)
-    fetch(`${API_URL}/advance_turn`, { method: 'POST' })
-      .then(() => fetchStudents()) // Refresh to get updated immunities
+    // Updated immunities arrive as a turn_advanced event
+    authFetch(`${API_URL}/advance_turn`, { method: 'POST' })
       .catch(err => console.error("Failed to advance turn", err));
   };
 
@@ -863,29 +541,8 @@ export default function App() {
 
   // Handle manual star adjustment (Sidebar flow)
   const handleManualStarChange = (studentId: number, change: number) => {
-    setStudents(prev => prev.map(s => {
-      if (s.id === studentId) {
-        let newStars = s.stars + change;
-        if (!s.isCursed) {
-          newStars = Math.max(0, newStars);
-        }
-
-
-
-        const updatedStudent = { ...s, stars: newStars };
-
-        // Update the modal view as well
-        if (manualSelection && manualSelection.id === studentId) {
-          setManualSelection(updatedStudent);
-        }
-        if (drawnStudent && drawnStudent.id === studentId) {
-          setDrawnStudent(updatedStudent);
-        }
-        updateStudentOnBackend(updatedStudent); // Sync backend
-        return updatedStudent;
-      }
-      return s;
-    }));
+    // Server applies the change atomically and updates the list, modal and result view
+    applyBulkStarChange(change, { student_ids: [studentId] }, 'manual');
   };
 
   // Fetch items when manual selection opens
@@ -1024,8 +681,8 @@ export default function App() {
                   <Award size={14} /> 个人道具包
                 </h3>
                 <div className="flex flex-col gap-2 max-h-[40vh] overflow-y-auto custom-scrollbar pr-1">
-                  {studentItems.map(si => (
-                    <div key={si.id} onClick={() => setPreviewItem(si)} className="cursor-pointer hover:scale-105 transition-transform">
+                  {studentItems.map((si, index) => (
+                    <div key={`${si.id}-${index}`} onClick={() => setPreviewItem(si)} className="cursor-pointer hover:scale-105 transition-transform">
                       <ItemCard
                         item={si.item_card}
                         size="small"
@@ -1324,8 +981,8 @@ export default function App() {
                 <div className="w-full">
                   <h4 className="text-xs font-bold text-slate-400 uppercase mb-2">我的卡包</h4>
                   <div className="flex gap-2 overflow-x-auto pb-2 custom-scrollbar">
-                    {studentItems.map(si => (
-                      <div key={si.id} onClick={() => setPreviewItem(si)} className="cursor-pointer flex-shrink-0 transition-transform duration-300 hover:scale-105 active:scale-95">
+                    {studentItems.map((si, index) => (
+                      <div key={`${si.id}-${index}`} onClick={() => setPreviewItem(si)} className="cursor-pointer flex-shrink-0 transition-transform duration-300 hover:scale-105 active:scale-95">
                         <ItemCard item={si.item_card} size="small" showDetails={false} className="w-24 h-32" />
                       </div>
                     ))}
@@ -1438,62 +1095,64 @@ export default function App() {
           />
         )
       }
-      {activeEffect === 'shield' && <ShieldEffect onComplete={() => handleEffectComplete()} />}
+      {activeEffect === 'shield' && <ShieldEffect onComplete={handleEffectComplete} />}
       {
         activeEffect === 'mark_target' && (
           <MarkTargetEffect
-            students={students.filter(s => s.id !== drawnStudent?.id)} // Exclude current student? Or include? Usually replace means someone else.
-            onComplete={(victim) => handleEffectComplete(victim)}
+            students={students.filter(s => s.id !== cardEffect?.student_id)}
+            target={findStudent(cardEffect?.outcome.target_id)}
+            onComplete={handleEffectComplete}
           />
         )
       }
-      {activeEffect === 'exp_potion' && <ExpPotionEffect onComplete={() => handleEffectComplete()} />}
-      {activeEffect === 'mass_silence' && <MassSilenceEffect onComplete={() => handleEffectComplete()} />}
-      {activeEffect === 'doomsday' && <DoomsdayEffect onComplete={() => handleEffectComplete()} />}
-      {activeEffect === 'legion_glory' && <LegionGloryEffect onComplete={() => handleEffectComplete()} />}
+      {activeEffect === 'exp_potion' && <ExpPotionEffect onComplete={handleEffectComplete} />}
+      {activeEffect === 'mass_silence' && <MassSilenceEffect onComplete={handleEffectComplete} />}
+      {activeEffect === 'doomsday' && <DoomsdayEffect onComplete={handleEffectComplete} />}
+      {activeEffect === 'legion_glory' && <LegionGloryEffect onComplete={handleEffectComplete} />}
       {
         activeEffect === 'shadow_raid' && (
           <ShadowRaidEffect
-            students={students}
-            onComplete={(victim) => handleEffectComplete(victim)}
+            victim={findStudent(cardEffect?.outcome.target_id)}
+            onComplete={handleEffectComplete}
           />
         )
       }
       {
         activeEffect === 'berserker_trial' && (
           <BerserkerTrialEffect
-            students={students}
-            onComplete={(winner) => handleEffectComplete(winner)}
+            winner={findStudent(cardEffect?.outcome.target_id)}
+            onComplete={handleEffectComplete}
           />
         )
       }
       {
-        activeEffect === 'mana_drain' && (
+        activeEffect === 'mana_drain' && cardUser && (
           <ManaDrainEffect
-            user={drawnStudent || manualSelection!}
+            user={cardUser}
             students={students}
-            onComplete={(result) => {
-              handleEffectComplete(result);
-            }}
+            target={findStudent(cardEffect?.outcome.target_id)}
+            success={!!cardEffect?.outcome.success}
+            onComplete={handleEffectComplete}
           />
         )
       }
-      {activeEffect === 'stealth_cloak' && <StealthCloakEffect onComplete={() => handleEffectComplete()} />}
-      {activeEffect === 'sanctuary' && <SanctuaryEffect onComplete={() => handleEffectComplete()} />}
-      {activeEffect === 'universal_salvation' && <UniversalSalvationEffect onComplete={() => handleEffectComplete()} />}
-      {activeEffect === 'dark_curse' && <DarkCurseEffect onComplete={() => handleEffectComplete()} />}
-      {activeEffect === 'purification' && <PurificationEffect onComplete={() => handleEffectComplete()} />}
-      {activeEffect === 'abyssal_gaze' && <AbyssalGazeEffect onComplete={(success) => handleEffectComplete(success)} />}
-      {activeEffect === 'one_man_guard' && <OneManGuardEffect onComplete={() => handleEffectComplete()} />}
-      {activeEffect === 'royal_pk' && pkOpponent && (drawnStudent || manualSelection) && (
+      {activeEffect === 'stealth_cloak' && <StealthCloakEffect onComplete={handleEffectComplete} />}
+      {activeEffect === 'sanctuary' && <SanctuaryEffect onComplete={handleEffectComplete} />}
+      {activeEffect === 'universal_salvation' && <UniversalSalvationEffect onComplete={handleEffectComplete} />}
+      {activeEffect === 'dark_curse' && <DarkCurseEffect onComplete={handleEffectComplete} />}
+      {activeEffect === 'purification' && <PurificationEffect onComplete={handleEffectComplete} />}
+      {activeEffect === 'abyssal_gaze' && <AbyssalGazeEffect success={!!cardEffect?.outcome.success} onComplete={handleEffectComplete} />}
+      {activeEffect === 'one_man_guard' && <OneManGuardEffect onComplete={handleEffectComplete} />}
+      {activeEffect === 'royal_pk' && cardUser && findStudent(cardEffect?.outcome.opponent_id) && (
         <RoyalPKEffect
-          user={drawnStudent || manualSelection!}
-          opponent={pkOpponent}
-          onComplete={(winnerId) => handleEffectComplete(winnerId)}
+          user={cardUser}
+          opponent={findStudent(cardEffect?.outcome.opponent_id)!}
+          winnerId={cardEffect?.outcome.winner_id ?? null}
+          onComplete={handleEffectComplete}
         />
       )}
-      {activeEffect === 'chain_lightning' && <ChainLightningEffect chainPath={chainPath} onComplete={() => handleEffectComplete()} />}
-      {activeEffect === 'destiny_roulette' && <DestinyRouletteEffect onComplete={(result) => handleEffectComplete(result)} />}
+      {activeEffect === 'chain_lightning' && <ChainLightningEffect chainPath={chainPath} onComplete={handleEffectComplete} />}
+      {activeEffect === 'destiny_roulette' && <DestinyRouletteEffect result={cardEffect?.outcome.result === 'angel' ? 'angel' : 'devil'} onComplete={handleEffectComplete} />}
     </div >
   );
 }
\ No newline at end of file
@@ -2,30 +2,28 @@ import React, { useState, useEffect } from 'react';
 import { Eye, Ghost, Dna } from 'lucide-react';
 
 interface AbyssalGazeEffectProps {
-    onComplete: (success: boolean) => void;
+    success: boolean; // rolled by the server
+    onComplete: () => void;
 }
 
-export default function AbyssalGazeEffect({ onComplete }: AbyssalGazeEffectProps) {
+export default function AbyssalGazeEffect({ success: isSuccess, onComplete }: AbyssalGazeEffectProps) {
     const [stage, setStage] = useState<'judging' | 'success' | 'fail'>('judging');
 
     useEffect(() => {
-        // Determine result immediately but show it later
-        const roll = Math.random();
-        const isSuccess = roll < 0.3; // 30% chance
-
+        // The result is known already; reveal it after the build-up
         const judgeTimer = setTimeout(() => {
             setStage(isSuccess ? 'success' : 'fail');
         }, 2500);
 
         const closeTimer = setTimeout(() => {
-            onComplete(isSuccess);
+            onComplete();
         }, 4500);
 
         return () => {
             clearTimeout(judgeTimer);
             clearTimeout(closeTimer);
         };
-    }, [onComplete]);
+    }, [isSuccess, onComplete]);
 
     return (
         <div className="fixed inset-0 z-[200] flex items-center justify-center bg-black/98 animate-in fade-in duration-1000">
@@ -3,18 +3,14 @@ import { Dumbbell, Medal, PersonStanding } from 'lucide-react';
 import { Student } from '../types';
 
 interface BerserkerTrialEffectProps {
-    students: Student[];
-    onComplete: (winner: Student) => void;
+    winner: Student | null; // picked by the server
+    onComplete: () => void;
 }
 
-export default function BerserkerTrialEffect({ students, onComplete }: BerserkerTrialEffectProps) {
-    const [target, setTarget] = useState<Student | null>(null);
+export default function BerserkerTrialEffect({ winner: target, onComplete }: BerserkerTrialEffectProps) {
     const [count, setCount] = useState(0);
 
     useEffect(() => {
-        // Pick random target immediately
-        const winner = students[Math.floor(Math.random() * students.length)];
-        setTarget(winner);
 
         // Initial delay then start counting visuals
         const startDelay = setTimeout(() => {
@@ -26,7 +22,7 @@ export default function BerserkerTrialEffect({ students, onComplete }: Berserker
                 if (currentCount >= 20) {
                     clearInterval(interval);
                     setTimeout(() => {
-                        onComplete(winner);
+                        onComplete();
                     }, 2000);
                 }
             }, 80); // Fast counting
@@ -2,15 +2,16 @@ import React, { useState, useEffect } from 'react';
 import { Skull, Heart, HelpCircle } from 'lucide-react';
 
 interface DestinyRouletteEffectProps {
-    onComplete: (result: 'angel' | 'devil') => void;
+    result: 'angel' | 'devil'; // drawn by the server; the pick only reveals it
+    onComplete: () => void;
 }
 
-export default function DestinyRouletteEffect({ onComplete }: DestinyRouletteEffectProps) {
+export default function DestinyRouletteEffect({ result, onComplete }: DestinyRouletteEffectProps) {
     const [phase, setPhase] = useState<'intro' | 'flip' | 'shuffle' | 'pick' | 'reveal'>('intro');
     const [positions, setPositions] = useState<[number, number]>([0, 1]); // Index of cards: 0 is Left, 1 is Right. Content: 0 and 1.
     // Content 0: Angel? Content 1: Devil? No, let's randomized content mapping later.
     // Actually, let's keep it simple: Card A and Card B.
-    // We determine the result (Angel/Devil) only when clicked based on probability.
+    // The result (Angel/Devil) is already decided; it is revealed when a card is clicked.
     // Visuals: Just shuffling back and forth.
 
     const [revealedResult, setRevealedResult] = useState<'angel' | 'devil' | null>(null);
@@ -55,16 +56,11 @@ export default function DestinyRouletteEffect({ onComplete }: DestinyRouletteEff
 
         setPickedIndex(index);
 
-        // Calculate Result
-        // 10% Angel, 90% Devil
-        const isAngel = Math.random() < 0.1;
-        const result = isAngel ? 'angel' : 'devil';
-
         setRevealedResult(result);
         setPhase('reveal');
 
         setTimeout(() => {
-            onComplete(result);
+            onComplete();
         }, 3000); // View result for 3s
     };
 
@@ -14,6 +14,8 @@ const ItemCard: React.FC<Props> = ({ item, onClick, size = 'small', showDetails
     const [isHovered, setIsHovered] = useState(false);
     const [imgError, setImgError] = useState(false);
     const API_URL = 'http://localhost:8000'; // Make global const later if needed
+    // Resized variants when the server has them, else the original art
+    const variant = item.images?.[size === 'large' ? 'display' : 'thumb'];
 
     return (
         <div
@@ -28,12 +30,17 @@ const ItemCard: React.FC<Props> = ({ item, onClick, size = 'small', showDetails
             onMouseLeave={() => setIsHovered(false)}
         >
             {item.image_path && !imgError ? (
-                <img
-                    src={`${API_URL}/static/images/${item.image_path}`}
-                    alt={item.name}
-                    className="w-full h-full object-cover"
-                    onError={() => setImgError(true)}
-                />
+                <picture className="block w-full h-full">
+                    {variant?.webp && <source srcSet={`${API_URL}${variant.webp}`} type="image/webp" />}
+                    <img
+                        src={variant ? `${API_URL}${variant.jpg}` : `${API_URL}/static/images/${item.image_path}`}
+                        alt={item.name}
+                        className="w-full h-full object-cover"
+                        loading="lazy"
+                        decoding="async"
+                        onError={() => setImgError(true)}
+                    />
+                </picture>
             ) : (
                 <div className="w-full h-full bg-slate-800 flex items-center justify-center">
                     <span className="text-4xl">🎴</span>
@@ -5,10 +5,14 @@ import { Student } from '../types';
 interface ManaDrainEffectProps {
     user: Student;
     students: Student[];
-    onComplete: (result: { success: boolean, target: Student }) => void;
+    // Picked by the server: the drained classmate (null when there is none) and
+    // whether they had the 2 stars to give
+    target: Student | null;
+    success: boolean;
+    onComplete: () => void;
 }
 
-export default function ManaDrainEffect({ user, students, onComplete }: ManaDrainEffectProps) {
+export default function ManaDrainEffect({ user, students, target: finalTarget, success: isSuccess, onComplete }: ManaDrainEffectProps) {
     const [target, setTarget] = useState<Student | null>(null);
     const [phase, setPhase] = useState<'searching' | 'locked' | 'action' | 'result'>('searching');
     const [success, setSuccess] = useState(false);
@@ -18,12 +22,12 @@ export default function ManaDrainEffect({ user, students, onComplete }: ManaDrai
         let shuffleInterval: NodeJS.Timeout;
         const candidates = students.filter(s => s.id !== user.id);
 
-        if (candidates.length === 0) {
-            onComplete({ success: true, target: user });
+        if (candidates.length === 0 || !finalTarget) {
+            onComplete();
             return;
         }
 
-        // Shuffle Animation
+        // Shuffle Animation (visual only)
         shuffleInterval = setInterval(() => {
             const randomPreview = candidates[Math.floor(Math.random() * candidates.length)];
             setTarget(randomPreview);
@@ -32,19 +36,15 @@ export default function ManaDrainEffect({ user, students, onComplete }: ManaDrai
         // Lock Target
         setTimeout(() => {
             clearInterval(shuffleInterval);
-            const finalTarget = candidates[Math.floor(Math.random() * candidates.length)];
             setTarget(finalTarget);
             setPhase('locked');
-
-            // Logic Check
-            const isSuccess = finalTarget.stars >= 2;
             setSuccess(isSuccess);
 
             // Proceed
             setTimeout(() => setPhase('action'), 1000);
             setTimeout(() => setPhase('result'), 3000);
             setTimeout(() => {
-                onComplete({ success: isSuccess, target: finalTarget });
+                onComplete();
             }, 4500);
 
         }, 2000);
@@ -5,10 +5,11 @@ import Card from './Card';
 
 interface MarkTargetEffectProps {
     students: Student[];
-    onComplete: (target: Student) => void;
+    target: Student | null; // picked by the server
+    onComplete: () => void;
 }
 
-export default function MarkTargetEffect({ students, onComplete }: MarkTargetEffectProps) {
+export default function MarkTargetEffect({ students, target, onComplete }: MarkTargetEffectProps) {
     const [displayedStudent, setDisplayedStudent] = useState<Student | null>(null);
     const [isRunning, setIsRunning] = useState(true);
 
@@ -19,7 +20,10 @@ export default function MarkTargetEffect({ students, onComplete }: MarkTargetEff
     }, [students]);
 
     useEffect(() => {
-        if (candidates.length === 0) return;
+        if (candidates.length === 0 || !target) {
+            onComplete();
+            return;
+        }
 
         let intervalId: NodeJS.Timeout;
         const startTime = Date.now();
@@ -37,17 +41,12 @@ export default function MarkTargetEffect({ students, onComplete }: MarkTargetEff
                 setIsRunning(false);
                 clearInterval(intervalId);
 
-                // Final selection
-                const finalValues = new Uint32Array(1);
-                crypto.getRandomValues(finalValues);
-                const finalIndex = finalValues[0] % candidates.length;
-                const selected = candidates[finalIndex];
-
-                setDisplayedStudent(selected);
+                // Land on the server's pick
+                setDisplayedStudent(target);
 
                 // Wait a bit to show result then complete
                 setTimeout(() => {
-                    onComplete(selected);
+                    onComplete();
                 }, 1500);
 
             }, duration);
@@ -57,7 +56,7 @@ export default function MarkTargetEffect({ students, onComplete }: MarkTargetEff
                 clearTimeout(timeoutId);
             };
         }
-    }, [candidates, isRunning, onComplete]);
+    }, [candidates, target, isRunning, onComplete]);
 
     return (
         <div className="fixed inset-0 z-[200] flex items-center justify-center bg-slate-900/95 backdrop-blur-md animate-in fade-in duration-300">
@@ -5,33 +5,18 @@ import { Student } from '../types';
 interface RoyalPKEffectProps {
     user: Student;
     opponent: Student;
-    onComplete: (winnerId: number | null) => void;
+    // Decided by the server: the user's id when they had more stars, else null (no star changes hands)
+    winnerId: number | null;
+    onComplete: () => void;
 }
 
-export default function RoyalPKEffect({ user, opponent, onComplete }: RoyalPKEffectProps) {
+export default function RoyalPKEffect({ user, opponent, winnerId: winner, onComplete }: RoyalPKEffectProps) {
     const [stage, setStage] = useState<'intro' | 'clash' | 'result'>('intro');
-    const [winner, setWinner] = useState<number | null>(null);
 
     useEffect(() => {
-        // Determine winner immediately
-        // If user > opponent -> User wins (id)
-        // Else -> No one wins extra star (null) or Opponent wins?
-        // Description: "If higher than opponent, gain +1 star". 
-        // It doesn't say opponent loses or gains anything.
-        // So if User > Opponent -> Winner is User.
-        // If User <= Opponent -> Winner is null (Draw/Loss).
-
-        let w: number | null = null;
-        if (user.stars > opponent.stars) {
-            w = user.id;
-        } else {
-            w = null;
-        }
-        setWinner(w);
-
         const timer1 = setTimeout(() => setStage('clash'), 1500);
         const timer2 = setTimeout(() => setStage('result'), 3000);
-        const timer3 = setTimeout(() => onComplete(w), 5000);
+        const timer3 = setTimeout(() => onComplete(), 5000);
 
         return () => {
             clearTimeout(timer1);
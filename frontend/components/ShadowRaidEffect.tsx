@@ -3,31 +3,18 @@ import { Sword, Ghost, EyeOff } from 'lucide-react';
 import { Student } from '../types';
 
 interface ShadowRaidEffectProps {
-    students: Student[]; // Need list to show who got hit, or we just show generic effect?
-    // Better to select the victim here or pass it in?
-    // Let's pass the VICTIM in if we calculated it, or just generic "Searching..."
-    // The requirement is just the effect. 
-    // I'll stick to generic cool effect, maybe revealing the name at the end if I can.
-    // For simplicity and consistency with MarkTarget, I'll let the parent handle logic 
-    // but maybe I can show the result callback?
-    // Actually, MarkTarget calls back with the result.
-    // Let's do the random selection inside logic, here just visuals.
-    // Or better: Visuals show "Searching..." -> "Strike!".
-    onComplete: (victim: Student) => void;
+    victim: Student | null; // picked by the server; revealed at the end
+    // Visuals show "Searching..." -> "Strike!" -> the victim
+    onComplete: () => void;
 }
 
-export default function ShadowRaidEffect({ students, onComplete }: ShadowRaidEffectProps) {
-    const [target, setTarget] = useState<Student | null>(null);
+export default function ShadowRaidEffect({ victim: target, onComplete }: ShadowRaidEffectProps) {
     const [phase, setPhase] = useState<'searching' | 'striking' | 'reveal'>('searching');
 
     useEffect(() => {
         // 1. Searching Phase (Rapid shuffle)
         let shuffleInterval: NodeJS.Timeout;
 
-        // Pick final target immediately
-        const finalTarget = students[Math.floor(Math.random() * students.length)];
-        setTarget(finalTarget);
-
         if (phase === 'searching') {
             setTimeout(() => {
                 setPhase('striking');
@@ -38,7 +25,7 @@ export default function ShadowRaidEffect({ students, onComplete }: ShadowRaidEff
             }, 1000);
         } else if (phase === 'reveal') {
             setTimeout(() => {
-                onComplete(finalTarget);
+                onComplete();
             }, 2000);
         }
     }, [phase]);
@@ -24,16 +24,39 @@ export interface Stats {
   unpickedCount: number;
 }
 
+// Resized card art URLs by format; jpg is always present, webp when the server supports it
+export interface CardImageVariant {
+  webp?: string;
+  jpg: string;
+}
+
 export interface ItemCard {
   id: number;
   name: string;
   description: string;
   function_desc: string;
   image_path: string;
+  images?: { thumb: CardImageVariant; display: CardImageVariant } | null;
 }
 
 export interface StudentItem {
   id: number;
   student_id: number;
   item_card: ItemCard;
-}
\ No newline at end of file
+}
+// A card effect as resolved by the server; outcome holds the random picks to replay
+export interface CardEffect {
+  student_id: number;
+  card: ItemCard;
+  outcome: Record<string, any>;
+  students: any[]; // changed students, as the API returns them
+}
+
+export interface CardUseResult extends CardEffect {
+  item_id: number;
+}
+
+// Cards that take effect on draw come back already resolved
+export interface DrawnCard extends ItemCard {
+  effect?: CardEffect | null;
+}